@@ -1,14 +1,10 @@
 import streamlit as st
-import asyncio
 from pathlib import Path
 import builtins
-from test_research_workflow import research_topic
-from test_illustrator import generate_illustration
-from test_research_to_slides import structure_essay
-from test_video import EssayVideo
-from manim import config
-import shutil
-import json
+import time
+from jobs import JobQueue, JOBS_DIR
+from media_server import MediaServer
+from tracing import start_metrics_server
 
 st.set_page_config(
     page_title="3Research1Video",
@@ -42,123 +38,114 @@ with st.sidebar:
     The process may take several minutes depending on the complexity of the topic.
     """)
 
+# How often a page with a running job re-checks its status
+POLL_INTERVAL = 2
+
+@st.cache_resource
+def get_job_queue():
+    """One job queue and worker pool per server process, shared by all sessions"""
+    return JobQueue()
+
+@st.cache_resource
+def get_metrics_server():
+    """Prometheus /metrics endpoint over the metrics flushed by finished jobs"""
+    return start_metrics_server()
+
+@st.cache_resource
+def get_media_server():
+    """HTTP server for finished artifacts, started once per server process"""
+    return MediaServer(JOBS_DIR)
+
+def show_stored(queue, topic_id: str):
+    """Results of an earlier job for the same or a near-duplicate topic"""
+    record = queue.artifacts.get(int(topic_id))
+    if record is None:
+        st.error(f"Unknown stored topic: {topic_id}")
+        return
+    st.info(f"Showing the video already made for '{record['topic']}'")
+    if st.button("Generate a new video instead"):
+        st.query_params.pop("stored", None)
+        st.query_params["job"] = queue.submit(record["topic"])
+        st.rerun()
+    show_results({"topic": record["topic"], "result": {name: str(path) for name, path in record["artifacts"].items()}})
+
+def show_results(job):
+    topic = job["topic"]
+    essay_path = Path(job["result"]["essay"])
+    final_video_path = Path(job["result"]["video"])
+
+    # Display results in tabs
+    tab1, tab2 = st.tabs(["Essay", "Video"])
+    
+    with tab1:
+        st.header("Generated Essay")
+        if essay_path.exists():
+            with open(essay_path, 'r') as f:
+                essay_content = f.read()
+                st.markdown(essay_content)
+                st.download_button(
+                    label="Download Essay",
+                    data=essay_content,
+                    file_name=f"{topic.replace(' ', '_').lower()}_essay.md",
+                    mime="text/markdown"
+                )
+    
+    with tab2:
+        st.header("Generated Video")
+        if final_video_path.exists():
+            # Streamed from disk with range requests; the video never passes through this process
+            media = get_media_server()
+            st.video(media.url_for(final_video_path))
+            st.link_button("Download Video", media.url_for(final_video_path, download=True))
+
 def main():
+    queue = get_job_queue()
+    get_metrics_server()
+
+    with st.sidebar:
+        st.header("Recent jobs")
+        for job in queue.recent(limit=10):
+            st.markdown(f"[{job['topic']}](?job={job['id']}) — {job['status']}")
+
     # Input section
     topic = st.text_input("Enter your research topic:", 
                          placeholder="e.g., artificial intelligence in material science")
 
     if st.button("Generate Video", disabled=not topic):
-        # Create status containers
-        status_area = st.empty()
-        progress_text = ""
-        
-        def update_status(message):
-            nonlocal progress_text
-            progress_text += f"{message}\n"
-            status_area.code(progress_text)
-        
-        try:
-            with st.spinner("Cooking you something nice..."):
-                output_dir = Path("publication")
-                output_dir.mkdir(exist_ok=True)
-
-                # Step 1: Research and Essay Generation (async)
-                update_status(f"🔍 Starting research on topic: {topic}")
-                async def research_and_write():
-                    essay = await research_topic(topic)
-                    return essay
-
-                essay = asyncio.run(research_and_write())
-                update_status("✅ Research complete")
-
-                # Save essay
-                essay_path = output_dir / f"{topic.replace(' ', '_').lower()}_essay.md"
-                with open(essay_path, 'w', encoding='utf-8') as f:
-                    f.write(str(essay))
-                update_status("📝 Essay generated and saved")
-
-                # Step 2: Generate illustration
-                update_status("🎨 Creating illustration...")
-                illustration_path = output_dir / f"{topic.replace(' ', '_').lower()}_illustration.jpg"
-                success = generate_illustration(str(essay), str(illustration_path))
-                if success:
-                    update_status("✅ Illustration created successfully")
-                else:
-                    update_status("⚠️ Using default illustration")
-
-                # Step 3: Structure essay into slides
-                update_status("📏 Structuring content into presentation format...")
-                structured_content = structure_essay(str(essay))
-                structured_content_path = output_dir / f"{topic.replace(' ', '_').lower()}_structured_content.json"
-                with open(structured_content_path, 'w', encoding='utf-8') as f:
-                    json.dump(structured_content, f, indent=2)
-                update_status("✅ Content structure complete")
-
-                # Step 4: Generate video
-                update_status("🎞 Generating video presentation...")
-                video_name = f"{topic.replace(' ', '_').lower()}_video"
-                final_video_path = output_dir / f"{video_name}.mp4"
-
-                try:
-                    # Configure Manim
-                    config.media_dir = str(output_dir)
-                    config.video_dir = str(output_dir)
-                    config.output_file = video_name
-                    config.quality = "medium_quality"
-                    config.flush_cache = True
-
-                    scene = EssayVideo(structured_content, str(illustration_path))
-                    scene.render()
-                    update_status("✅ Video generation complete")
-
-                except Exception as e:
-                    # Check if video was actually generated despite the error
-                    if final_video_path.exists():
-                        update_status("✅ Video generated successfully despite some non-critical errors")
-                    else:
-                        update_status(f"⚠️ Error during video generation: {str(e)}")
-                        raise e
-
-                finally:
-                    # Clean up temporary directories
-                    if Path("media").exists():
-                        shutil.rmtree("media")
-                    if Path("slides").exists():
-                        shutil.rmtree("slides")
-
-                update_status("✨ All processing complete!")
-
-            # Display results in tabs
-            tab1, tab2 = st.tabs(["Essay", "Video"])
-            
-            with tab1:
-                st.header("Generated Essay")
-                if essay_path.exists():
-                    with open(essay_path, 'r') as f:
-                        essay_content = f.read()
-                        st.markdown(essay_content)
-                        st.download_button(
-                            label="Download Essay",
-                            data=essay_content,
-                            file_name=f"{topic.replace(' ', '_').lower()}_essay.md",
-                            mime="text/markdown"
-                        )
-            
-            with tab2:
-                st.header("Generated Video")
-                if final_video_path.exists():
-                    with open(final_video_path, 'rb') as f:
-                        video_data = f.read()
-                        st.video(video_data)
-                        st.download_button(
-                            label="Download Video",
-                            data=video_data,
-                            file_name=f"{topic.replace(' ', '_').lower()}_video.mp4",
-                            mime="video/mp4"
-                        )
-        
-        except Exception as e:
-            st.error(f"An error occurred: {str(e)}")
+        st.query_params.pop("job", None)
+        st.query_params.pop("stored", None)
+        stored = queue.artifacts.lookup(topic)
+        if stored:
+            # Same or near-duplicate topic done before: show it now instead of paying for a new run
+            st.query_params["stored"] = str(stored["id"])
+        else:
+            # The job runs in a worker process; keep its id in the URL so a reload reattaches
+            st.query_params["job"] = queue.submit(topic)
+
+    if st.query_params.get("stored"):
+        show_stored(queue, st.query_params["stored"])
+        return
+    job_id = st.query_params.get("job")
+    if not job_id:
+        return
+    job = queue.status(job_id)
+    if job is None:
+        st.error(f"Unknown job: {job_id}")
+        return
+
+    st.code(job["progress"] or f"⏳ Waiting for a free worker: {job['topic']}")
+    if job["status"] in ("queued", "running"):
+        with st.spinner("Cooking you something nice..."):
+            time.sleep(POLL_INTERVAL)
+        st.rerun()
+    elif job["status"] == "failed":
+        st.error(f"An error occurred: {job['error'].strip().splitlines()[-1]}")
+        if st.button("Retry"):
+            # Finished stages are reused, so a failed render only costs the render
+            queue.retry(job_id)
+            st.rerun()
+    else:
+        show_results(job)
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file
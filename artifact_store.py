@@ -0,0 +1,216 @@
+import hashlib
+import os
+import re
+import shutil
+import sqlite3
+import time
+from pathlib import Path
+from typing import Dict, List
+from tracing import count
+
+# What a finished topic keeps; a topic only counts as done when all of them are stored
+ARTIFACT_NAMES = ("essay", "illustration", "structure", "video")
+# Topics nobody looked up for this long are dropped, then the least recently used beyond the size bound
+ARTIFACT_RETENTION_DAYS = float(os.getenv("ARTIFACT_RETENTION_DAYS", 30))
+ARTIFACT_STORE_MAX_BYTES = int(os.getenv("ARTIFACT_STORE_MAX_BYTES", 20 * 1024 * 1024 * 1024))
+# Topics at least this similar are the same topic for lookups
+TOPIC_MATCH_THRESHOLD = float(os.getenv("TOPIC_MATCH_THRESHOLD", 0.8))
+# A term at least this close in character trigrams to one of the other topic's terms is a misspelling of it
+TERM_TYPO_SIMILARITY = 0.5
+# Unreferenced blobs younger than this may belong to a put that has not indexed them yet
+BLOB_MIN_AGE = 3600
+
+_WORD = re.compile(r"[a-z0-9]+")
+_STOPWORDS = set("a about an and are as at be by for from has have how in into is it its of on or "
+                 "that the to was were what why will with".split())
+_ABBREVIATIONS = {
+    "ai": "artificial intelligence", "ml": "machine learning", "nlp": "natural language processing",
+    "llm": "large language model", "llms": "large language models", "iot": "internet of things",
+    "vr": "virtual reality", "ev": "electric vehicle", "evs": "electric vehicles",
+}
+
+def _stem(word: str) -> str:
+    """Singular of a regular English plural, which is all topic matching needs"""
+    if len(word) > 4 and word.endswith("ies"):
+        return word[:-3] + "y"
+    if len(word) > 3 and word.endswith("s") and not word.endswith(("ss", "us", "is")):
+        return word[:-1]
+    return word
+
+def topic_terms(topic: str) -> List[str]:
+    """Distinct content words of a topic, abbreviations spelled out and plurals singular, sorted"""
+    words = " ".join(_ABBREVIATIONS.get(word, word) for word in _WORD.findall(topic.lower())).split()
+    return sorted({_stem(word) for word in words if word not in _STOPWORDS})
+
+def normalize_topic(topic: str) -> str:
+    """Form shared by topics that differ only in case, word order, stopwords, plurals or abbreviations"""
+    return " ".join(topic_terms(topic)) or topic.strip().lower()
+
+def _trigrams(text: str) -> set:
+    text = f"  {text} "
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+def _jaccard(a: set, b: set) -> float:
+    return len(a & b) / len(a | b) if a or b else 0.0
+
+def _correct_terms(terms: set, known: set) -> set:
+    """Terms with each one missing from ``known`` replaced by the known term it is a misspelling of, if any"""
+    corrected = set()
+    for term in terms:
+        candidates = [(_jaccard(_trigrams(term), _trigrams(other)), other) for other in known - terms]
+        score, other = max(candidates, default=(0.0, term))
+        corrected.add(other if term not in known and score >= TERM_TYPO_SIMILARITY else term)
+    return corrected
+
+def topic_similarity(a: str, b: str) -> float:
+    """Share of terms two normalized topics have in common, after correcting misspelled terms"""
+    a_terms, b_terms = set(a.split()), set(b.split())
+    return _jaccard(_correct_terms(a_terms, b_terms), b_terms)
+
+def _digest(path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+class ArtifactStore:
+    """Finished topics' artifacts as content-addressed blobs, indexed by normalized topic in SQLite.
+
+    Topics that normalize alike share one entry; ``lookup`` also finds near
+    duplicates (a few words or a typo apart). Equal files are stored once, and
+    a blob is deleted when no topic refers to it any more.
+    """
+
+    def __init__(self, root, retention_days: float = ARTIFACT_RETENTION_DAYS,
+                 max_bytes: int = ARTIFACT_STORE_MAX_BYTES, threshold: float = TOPIC_MATCH_THRESHOLD):
+        self.root = Path(root).resolve()
+        self.blob_dir = self.root / "blobs"
+        self.blob_dir.mkdir(parents=True, exist_ok=True)
+        self.retention = retention_days * 24 * 3600
+        self.max_bytes = max_bytes
+        self.threshold = threshold
+        with self._connect() as db:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("""CREATE TABLE IF NOT EXISTS topics (
+                id INTEGER PRIMARY KEY, topic TEXT, normalized TEXT UNIQUE,
+                created_at REAL, accessed_at REAL, hits INTEGER DEFAULT 0)""")
+            db.execute("CREATE TABLE IF NOT EXISTS topic_terms (term TEXT, topic_id INTEGER, PRIMARY KEY (term, topic_id))")
+            db.execute("""CREATE TABLE IF NOT EXISTS artifacts (
+                topic_id INTEGER, name TEXT, digest TEXT, suffix TEXT, size INTEGER,
+                PRIMARY KEY (topic_id, name))""")
+            db.execute("CREATE INDEX IF NOT EXISTS topics_accessed ON topics (accessed_at)")
+
+    def _connect(self):
+        conn = sqlite3.connect(self.root / "index.db", timeout=30)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def blob_path(self, digest: str, suffix: str) -> Path:
+        return self.blob_dir / digest[:2] / f"{digest}{suffix}"
+
+    def _add_blob(self, path: Path) -> tuple:
+        digest = _digest(path)
+        target = self.blob_path(digest, path.suffix)
+        if not target.exists():
+            target.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = target.with_name(f"{target.name}.{os.getpid()}.tmp")
+            # A copy, not a link: rewriting the job's file must not change what other topics are served
+            shutil.copyfile(path, tmp_path)
+            os.chmod(tmp_path, 0o444)
+            os.replace(tmp_path, target)
+        return digest, path.suffix, target.stat().st_size
+
+    def put(self, topic: str, paths: Dict[str, Path]) -> int:
+        """Store a finished topic's artifacts, replacing what its normalized topic had before"""
+        blobs = {name: self._add_blob(Path(paths[name])) for name in ARTIFACT_NAMES
+                 if name in paths and Path(paths[name]).is_file()}
+        normalized = normalize_topic(topic)
+        now = time.time()
+        with self._connect() as db:
+            db.execute("""INSERT INTO topics (topic, normalized, created_at, accessed_at) VALUES (?, ?, ?, ?)
+                          ON CONFLICT (normalized) DO UPDATE SET topic = excluded.topic,
+                          created_at = excluded.created_at, accessed_at = excluded.accessed_at""",
+                       (topic, normalized, now, now))
+            topic_id = db.execute("SELECT id FROM topics WHERE normalized = ?", (normalized,)).fetchone()["id"]
+            db.execute("DELETE FROM artifacts WHERE topic_id = ?", (topic_id,))
+            db.executemany("INSERT INTO artifacts VALUES (?, ?, ?, ?, ?)",
+                           [(topic_id, name, *blob) for name, blob in blobs.items()])
+            db.executemany("INSERT OR IGNORE INTO topic_terms VALUES (?, ?)",
+                           [(term, topic_id) for term in normalized.split()])
+        count("artifact_store_puts")
+        self.evict()
+        return topic_id
+
+    def _record(self, db, row, score: float = 1.0) -> dict:
+        artifacts = {}
+        for artifact in db.execute("SELECT * FROM artifacts WHERE topic_id = ?", (row["id"],)):
+            artifacts[artifact["name"]] = self.blob_path(artifact["digest"], artifact["suffix"])
+        return {"id": row["id"], "topic": row["topic"], "normalized": row["normalized"], "score": score,
+                "created_at": row["created_at"], "artifacts": artifacts}
+
+    def _complete(self, record: dict) -> bool:
+        return all(name in record["artifacts"] and record["artifacts"][name].is_file() for name in ARTIFACT_NAMES)
+
+    def get(self, topic_id: int) -> dict:
+        """A stored topic with the paths of its artifacts, or None"""
+        with self._connect() as db:
+            row = db.execute("SELECT * FROM topics WHERE id = ?", (topic_id,)).fetchone()
+            return self._record(db, row) if row else None
+
+    def lookup(self, topic: str) -> dict:
+        """The stored topic most similar to this one, if it is similar enough and complete"""
+        normalized = normalize_topic(topic)
+        terms = normalized.split()
+        if not terms:
+            return None
+        with self._connect() as db:
+            # Only topics sharing a correctly spelled term are candidates
+            rows = db.execute(f"""SELECT DISTINCT topics.* FROM topics JOIN topic_terms ON topic_id = id
+                                  WHERE term IN ({",".join("?" * len(terms))})""", terms).fetchall()
+            candidates = sorted(((topic_similarity(normalized, row["normalized"]), row) for row in rows),
+                                key=lambda candidate: candidate[0], reverse=True)
+            for score, row in candidates:
+                if score < self.threshold:
+                    break
+                record = self._record(db, row, score)
+                if self._complete(record):
+                    db.execute("UPDATE topics SET accessed_at = ?, hits = hits + 1 WHERE id = ?", (time.time(), row["id"]))
+                    count("artifact_store_lookups", outcome="hit")
+                    return record
+        count("artifact_store_lookups", outcome="miss")
+        return None
+
+    def _delete_topics(self, db, topic_ids: List[int]):
+        for topic_id in topic_ids:
+            for table, column in (("artifacts", "topic_id"), ("topic_terms", "topic_id"), ("topics", "id")):
+                db.execute(f"DELETE FROM {table} WHERE {column} = ?", (topic_id,))
+            count("artifact_store_evictions")
+
+    def evict(self):
+        """Drop topics past retention, then the least recently used until the blobs fit the size bound"""
+        with self._connect() as db:
+            cutoff = time.time() - self.retention
+            self._delete_topics(db, [row["id"] for row in db.execute(
+                "SELECT id FROM topics WHERE accessed_at < ?", (cutoff,))])
+            total = db.execute("SELECT COALESCE(SUM(size), 0) FROM (SELECT DISTINCT digest, size FROM artifacts)").fetchone()[0]
+            for row in db.execute("SELECT id FROM topics ORDER BY accessed_at").fetchall():
+                if total <= self.max_bytes:
+                    break
+                self._delete_topics(db, [row["id"]])
+                total = db.execute("SELECT COALESCE(SUM(size), 0) FROM (SELECT DISTINCT digest, size FROM artifacts)").fetchone()[0]
+            referenced = {row["digest"] for row in db.execute("SELECT DISTINCT digest FROM artifacts")}
+        # Blobs no topic refers to any more, unless a put may still be about to index them
+        cutoff = time.time() - BLOB_MIN_AGE
+        for path in self.blob_dir.glob("*/*"):
+            if path.name.split(".")[0] in referenced or path.suffix == ".tmp":
+                continue
+            stat = path.stat()
+            if max(stat.st_mtime, stat.st_ctime) < cutoff:
+                path.unlink(missing_ok=True)
+
+    def stats(self) -> dict:
+        with self._connect() as db:
+            topics, hits = db.execute("SELECT COUNT(*), COALESCE(SUM(hits), 0) FROM topics").fetchone()
+            size = db.execute("SELECT COALESCE(SUM(size), 0) FROM (SELECT DISTINCT digest, size FROM artifacts)").fetchone()[0]
+        return {"topics": topics, "hits": hits, "bytes": size}
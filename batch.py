@@ -0,0 +1,173 @@
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import statistics
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List
+from dotenv import load_dotenv
+from clients import connection_stats
+from pipeline import (RENDER_BACKEND, RENDER_BACKENDS, Checkpoints, Stage, run_stage_in_thread, run_stages_async,
+                      topic_slug, topic_stages)
+from tracing import tracer, span, flush_metrics
+
+load_dotenv()
+
+# Concurrent calls per network-bound stage; rendering is bounded by its process pool instead
+STAGE_LIMITS = {"research": 3, "illustration": 3, "structure": 3, "voiceover": 3}
+STAGES = ["research", "illustration", "structure", "voiceover", "render"]
+
+def check_slugs(topics: List[str]):
+    """Refuse topics whose artifacts would be written to the same files"""
+    by_slug = {}
+    for topic in topics:
+        by_slug.setdefault(topic_slug(topic), []).append(topic)
+    clashes = [names for names in by_slug.values() if len(names) > 1]
+    if clashes:
+        raise ValueError(f"Topics would share output files, rename or drop duplicates: {clashes}")
+
+def read_topics(path) -> List[str]:
+    """One topic per line; blank lines and lines starting with # are skipped"""
+    lines = Path(path).read_text(encoding="utf-8").splitlines()
+    return [line.strip() for line in lines if line.strip() and not line.strip().startswith("#")]
+
+class BatchRunner:
+    """Pipelines many topics through the pipeline's stages with per-stage limits, renders in a process pool.
+
+    Every topic's stages are tasks on one asyncio loop (``pipeline.run_stages_async``),
+    checkpointed in the topic's manifest so an interrupted batch resumes where each
+    topic stopped. A stage waits for a slot of its limit on the loop and only then
+    takes a worker thread. Research of later topics overlaps the rendering of
+    earlier ones; every stage records how long a topic waited for a slot and how
+    long the stage itself took.
+    """
+
+    def __init__(self, output_dir, limits: Dict[str, int] = None, render_processes: int = 2,
+                 quality: str = "medium_quality", backend: str = RENDER_BACKEND, skip_existing: bool = True):
+        self.output_dir = Path(output_dir)
+        self.limits = {**STAGE_LIMITS, **(limits or {})}
+        self.render_processes = render_processes
+        # Split the cores between concurrent renders so their section workers don't oversubscribe
+        self.render_workers = max(1, (os.cpu_count() or 1) // render_processes)
+        self.quality = quality
+        self.backend = backend
+        self.skip_existing = skip_existing
+
+    async def _run_stage(self, record: dict, stage: Stage, results: dict):
+        queued = time.perf_counter()
+        async with self.semaphores[stage.name]:
+            started = time.perf_counter()
+            try:
+                return await run_stage_in_thread(stage, results)
+            finally:
+                record["stages"][stage.name] = {"wait": started - queued, "seconds": time.perf_counter() - started}
+
+    async def _run_topic(self, topic: str, pool) -> dict:
+        record = {"topic": topic, "status": "done", "stages": {}}
+        stages, paths = topic_stages(topic, self.output_dir, quality=self.quality, render_workers=self.render_workers,
+                                     backend=self.backend, render_pool=pool)
+        record["video"] = str(paths["video"])
+        if self.skip_existing and paths["video"].exists():
+            record["status"] = "skipped"
+            return record
+
+        start = time.perf_counter()
+        try:
+            with span("batch.topic", topic=topic):
+                await run_stages_async(stages, update_status=lambda message: None,
+                                       checkpoints=Checkpoints(paths["manifest"]), resume=self.skip_existing,
+                                       run_stage=lambda stage, results: self._run_stage(record, stage, results))
+            print(f"✅ {topic}")
+        except Exception as e:
+            record["status"] = "failed"
+            record["error"] = str(e)
+            print(f"⚠️ {topic}: {str(e)}")
+        record["seconds"] = time.perf_counter() - start
+        return record
+
+    async def run(self, topics: List[str]) -> dict:
+        check_slugs(topics)
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        self.semaphores = {name: asyncio.Semaphore(limit) for name, limit in self.limits.items()}
+        # Waiting for a render slot is measured like any other stage
+        self.semaphores["render"] = asyncio.Semaphore(self.render_processes)
+        # Stages only take a thread once they hold a slot, so one per slot is enough
+        asyncio.get_running_loop().set_default_executor(ThreadPoolExecutor(
+            max_workers=sum(self.limits.values()) + self.render_processes, thread_name_prefix="stage"))
+
+        start = time.perf_counter()
+        with ProcessPoolExecutor(max_workers=self.render_processes,
+                                 mp_context=multiprocessing.get_context("spawn")) as pool:
+            records = await asyncio.gather(*(self._run_topic(topic, pool) for topic in topics))
+        report = batch_report(records, time.perf_counter() - start, {
+            "limits": self.limits, "render_processes": self.render_processes,
+            "render_workers": self.render_workers, "quality": self.quality, "backend": self.backend,
+        })
+        report["connections"] = connection_stats()
+        (self.output_dir / "batch_report.json").write_text(json.dumps(report, indent=2))
+        tracer.write_trace(self.output_dir / "batch_trace.json")
+        flush_metrics()
+        return report
+
+def batch_report(records: List[dict], wall_seconds: float, settings: dict) -> dict:
+    """Throughput, per-stage timings and overlap of a finished batch"""
+    done = [r for r in records if r["status"] == "done"]
+    stages = {}
+    for name in STAGES:
+        timings = [r["stages"][name] for r in records if name in r["stages"]]
+        if timings:
+            stages[name] = {
+                "runs": len(timings),
+                "mean_seconds": statistics.mean(t["seconds"] for t in timings),
+                "mean_wait": statistics.mean(t["wait"] for t in timings),
+                "busy_seconds": sum(t["seconds"] for t in timings),
+            }
+    return {
+        "settings": settings,
+        "topics": len(records),
+        "done": len(done),
+        "failed": sum(r["status"] == "failed" for r in records),
+        "skipped": sum(r["status"] == "skipped" for r in records),
+        "wall_seconds": wall_seconds,
+        "videos_per_hour": len(done) * 3600 / wall_seconds if wall_seconds else 0.0,
+        "mean_topic_seconds": statistics.mean(r["seconds"] for r in done) if done else None,
+        # Stage time done per second of wall time: above 1 means stages overlapped
+        "overlap": sum(s["busy_seconds"] for s in stages.values()) / wall_seconds if wall_seconds else 0.0,
+        "stages": stages,
+        "records": records,
+    }
+
+def print_report(report: dict):
+    print(f"\n{report['done']}/{report['topics']} videos in {report['wall_seconds']:.0f}s "
+          f"({report['videos_per_hour']:.1f}/hour), {report['failed']} failed, {report['skipped']} skipped, "
+          f"overlap {report['overlap']:.1f}x")
+    print(f"{'stage':<13} {'runs':>4} {'mean (s)':>9} {'wait (s)':>9} {'busy (s)':>9}")
+    for name, stage in report["stages"].items():
+        print(f"{name:<13} {stage['runs']:>4} {stage['mean_seconds']:>9.1f} "
+              f"{stage['mean_wait']:>9.1f} {stage['busy_seconds']:>9.1f}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Produce a video for every topic in a file")
+    parser.add_argument("topics", help="text file with one topic per line")
+    parser.add_argument("--output-dir", default="batch_output")
+    for name, limit in STAGE_LIMITS.items():
+        parser.add_argument(f"--{name}", type=int, default=limit, help=f"concurrent {name} calls")
+    parser.add_argument("--render-processes", type=int, default=2)
+    parser.add_argument("--quality", default="medium_quality", help='a manim quality, or "auto" to plan each render')
+    parser.add_argument("--backend", default=RENDER_BACKEND, choices=list(RENDER_BACKENDS))
+    parser.add_argument("--rerun", action="store_true",
+                        help="redo every stage, also of topics whose video already exists")
+    args = parser.parse_args()
+
+    runner = BatchRunner(
+        args.output_dir,
+        limits={name: getattr(args, name) for name in STAGE_LIMITS},
+        render_processes=args.render_processes,
+        quality=args.quality,
+        backend=args.backend,
+        skip_existing=not args.rerun
+    )
+    print_report(asyncio.run(runner.run(read_topics(args.topics))))
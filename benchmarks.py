@@ -0,0 +1,541 @@
+import argparse
+import functools
+import json
+import multiprocessing
+import os
+import random
+import resource
+import statistics
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+WORDS = (
+    "research material quantum learning model data energy structure network physics "
+    "science discovery property simulation prediction analysis experiment atomic design "
+    "computing algorithm catalyst battery crystal neural training dataset accuracy method"
+).split()
+
+QUALITIES = ["low_quality", "medium_quality", "high_quality"]
+STAGES = ["research", "illustration", "structure", "voiceover", "render"]
+
+def make_essay(num_sections=6, words_per_section=180, seed=0):
+    """Synthetic essay structure shaped like structure_essay output"""
+    rng = random.Random(seed)
+    sections = []
+    for i in range(num_sections):
+        words = [rng.choice(WORDS) for _ in range(rng.randint(words_per_section // 2, words_per_section))]
+        sections.append({
+            "title": f"Section {i + 1}",
+            "text": " ".join(words[:12]),
+            "narration": " ".join(words).capitalize() + "."
+        })
+    return {"sections": sections}
+
+def paragraph_binary_search(sections_data):
+    """The original font-size search: a full Paragraph per section at every probe"""
+    from manim import Paragraph, Text, config
+    from test_video import MARGIN, TITLE_BUFF, LINE_SPACING, MIN_FONT_SIZE, MAX_FONT_SIZE
+    available_width = (config.frame_width / 2) - 2 * MARGIN
+
+    def test_font_size(size):
+        test_title = Text("Test", font_size=72)
+        max_height = config.frame_height - test_title.height - 2 * TITLE_BUFF - 0.5
+        for sec in sections_data["sections"]:
+            test_paragraph = Paragraph(
+                sec["narration"].strip(),
+                font_size=size,
+                width=available_width,
+                line_spacing=LINE_SPACING,
+                alignment="left"
+            )
+            if test_paragraph.height > max_height:
+                return False
+        return True
+
+    left, right = MIN_FONT_SIZE, MAX_FONT_SIZE
+    optimal_size = MIN_FONT_SIZE
+    while left <= right:
+        mid = (left + right) // 2
+        if test_font_size(mid):
+            optimal_size = mid
+            left = mid + 1
+        else:
+            right = mid - 1
+    return optimal_size
+
+def _time(fn, *args, repeats=3):
+    best = float("inf")
+    result = None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = fn(*args)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+def bench_font_size(num_sections=6, essays=3, repeats=3):
+    """Compare the Paragraph binary search with the analytic solver"""
+    from test_video import layout_sections
+    print(f"{'essay':>5} {'search (s)':>11} {'solver (s)':>11} {'speedup':>8} {'sizes':>9}")
+    for seed in range(essays):
+        essay = make_essay(num_sections, seed=seed)
+        search_time, search_size = _time(paragraph_binary_search, essay, repeats=repeats)
+        solver_time, (solver_size, _, _) = _time(layout_sections, essay, repeats=repeats)
+        print(f"{seed:>5} {search_time:>11.3f} {solver_time:>11.3f} "
+              f"{search_time / solver_time:>7.1f}x {search_size:>4}/{solver_size:<4}")
+
+def bench_search_cache(topics=5, subtopics=3, runs=4, latency=0.5):
+    """Repeated research runs against the fake search backend, with and without the cache"""
+    from cache import DiskCache
+    from fakes import FakeSearchClient
+    from search import cached_search
+
+    queries = [f"topic {t}" for t in range(topics)]
+    queries += [f"Topic {t} subtopic {s}" for t in range(topics) for s in range(subtopics)]
+    client = FakeSearchClient(latency=latency)
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        cache = DiskCache(cache_dir, ttl=3600)
+        for run in range(runs):
+            start = time.perf_counter()
+            for query in queries:
+                # Alternate case and spacing: normalization must still produce hits
+                cached_search(query.upper() if run % 2 else f"  {query}  ", client=client, cache=cache)
+            elapsed = time.perf_counter() - start
+            print(f"run {run + 1}: {elapsed:6.2f}s for {len(queries)} queries")
+        stats = cache.stats()
+
+    uncached = len(queries) * runs * latency
+    print(f"backend calls: {client.calls}, hit rate: {stats['hit_rate']:.0%}, "
+          f"entries: {stats['entries']}, bytes: {stats['bytes']}")
+    print(f"network time without cache: {uncached:.1f}s, with cache: {client.calls * latency:.1f}s")
+
+def bench_search_fanout(subtopics=3, latency=0.5):
+    """Subtopic fan-out against the local search server: concurrent vs sequential"""
+    import asyncio
+    import clients
+    import search
+    from fakes import FakeSearchServer
+
+    queries = [f"subtopic {i}" for i in range(subtopics)]
+
+    async def sequential():
+        for query in queries:
+            await search.async_search(query, cache=None)
+
+    async def concurrent():
+        await asyncio.gather(*(search.async_search(query, cache=None) for query in queries))
+
+    async def run(fn):
+        start = time.perf_counter()
+        await fn()
+        return time.perf_counter() - start
+
+    async def main():
+        # Warm the pool so both variants reuse keep-alive connections
+        await concurrent()
+        return await run(sequential), await run(concurrent)
+
+    with FakeSearchServer(latency=latency) as server:
+        search.TAVILY_SEARCH_URL = server.url
+        sequential_time, concurrent_time = clients.run_coroutine(main())
+
+    print(f"{subtopics} searches at {latency:.2f}s each")
+    print(f"sequential: {sequential_time:.2f}s, concurrent: {concurrent_time:.2f}s "
+          f"({sequential_time / concurrent_time:.1f}x)")
+
+def bench_governor(requests=40, rate_limit=4.0, latency=0.2, error_rate=0.05, retry_after=1.0):
+    """A burst of searches against a throttling server, without and with the governor"""
+    import asyncio
+    import httpx
+    import clients
+    from fakes import FakeAPIServer
+    from governor import Governor, service_limits
+    from tracing import tracer
+
+    async def post(url, query):
+        response = await clients.get_async_client().post(url, json={"query": query})
+        response.raise_for_status()
+        return response
+
+    async def burst(url, governor=None):
+        async def one(i):
+            try:
+                if governor:
+                    await governor.acall(post, url, f"query {i}")
+                else:
+                    await post(url, f"query {i}")
+                return True
+            except httpx.HTTPStatusError:
+                return False
+        start = time.perf_counter()
+        results = await asyncio.gather(*(one(i) for i in range(requests)))
+        return sum(results), time.perf_counter() - start
+
+    print(f"{requests} searches, server admits {rate_limit:g}/s, {error_rate:.0%} errors, {latency:.2f}s latency")
+    print(f"{'mode':<10} {'ok':>4} {'429s':>5} {'503s':>5} {'wall (s)':>9}")
+    for mode in ("raw", "governed"):
+        tracer.reset()
+        with FakeAPIServer(search_latency=latency, rate_limit=rate_limit, retry_after=retry_after,
+                           error_rate=error_rate) as server:
+            governor = Governor("bench", **service_limits("search")) if mode == "governed" else None
+            ok, wall = clients.run_coroutine(burst(f"{server.url}/search", governor))
+        print(f"{mode:<10} {ok:>4} {server.rejected['throttled']:>5} {server.rejected['errors']:>5} {wall:>9.1f}")
+    counters = {(name, dict(labels).get("reason")): value for name, labels, value in tracer.export()["counters"]}
+    waits = counters.get(("governor_wait_seconds", None), 0) / max(1, counters.get(("governor_acquired", None), 1))
+    print(f"governed: {counters.get(('governor_retries', 'throttled'), 0):.0f} retries after 429, "
+          f"{counters.get(('governor_retries', 'error'), 0):.0f} after errors, mean wait {waits:.2f}s, "
+          f"final concurrency limit {governor.limit:.1f}")
+
+def bench_connections(calls=20, latency=0.05):
+    """New connections per request for sync and async searches and chat completions through the client registry"""
+    import asyncio
+    import clients
+    import search
+    from fakes import FakeAPIServer
+    from llm_cache import cached_chat_completion
+
+    with FakeAPIServer(search_latency=latency, llm_latency=latency, completion_words=50) as server:
+        os.environ.update(server.environ())
+        search.TAVILY_SEARCH_URL = server.url + "/search"
+        for i in range(calls):
+            search.cached_search(f"sync query {i}", client=clients.TavilySearchClient(search.TAVILY_SEARCH_URL),
+                                 cache=None)
+            cached_chat_completion(clients.get_azure_openai(), use_cache=False, model="gpt-4o-mini",
+                                   messages=[{"role": "user", "content": f"question {i}"}])
+
+        async def concurrent_searches():
+            for batch in range(0, calls, 5):
+                await asyncio.gather(*(search.async_search(f"async query {i}", cache=None)
+                                       for i in range(batch, batch + 5)))
+        clients.run_coroutine(concurrent_searches())
+
+    print(f"{'host':<22} {'requests':>8} {'connections':>11} {'reuse':>6}")
+    for host, stats in clients.connection_stats().items():
+        print(f"{host:<22} {stats['requests']:>8} {stats['connections']:>11} {stats['reuse']:>6.0%}")
+
+def bench_tts(num_sections=6, latency=1.0, max_workers=4):
+    """Pre-synthesis with the fake speech service: sequential, concurrent and cached"""
+    from cache import DiskCache
+    from fake_speech import FakeSpeechService
+    import tts
+
+    texts = [section["narration"] for section in make_essay(num_sections)["sections"]]
+
+    def factory(cache_dir):
+        return FakeSpeechService(latency=latency, cache_dir=cache_dir)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for label, workers, cache_dir in [("sequential", 1, "cold-1"), ("concurrent", max_workers, "cold-2"),
+                                          ("cached", max_workers, "cold-2")]:
+            cache = DiskCache(f"{tmp_dir}/{cache_dir}")
+            start = time.perf_counter()
+            voiceovers = tts.presynthesize(texts, factory, f"{tmp_dir}/{label}", max_workers=workers, cache=cache)
+            elapsed = time.perf_counter() - start
+            audio = sum(v["duration"] for v in voiceovers)
+            print(f"{label:>10}: {elapsed:6.2f}s for {len(texts)} narrations ({audio:.0f}s of audio)")
+
+def record_search_fixture(topic, subtopics, path):
+    """Save real Tavily responses for a topic and its subtopics as a benchmark fixture"""
+    import json
+    from search import cached_search
+    responses = [cached_search(query) for query in [topic, *subtopics]]
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({"topic": topic, "subtopics": subtopics, "responses": responses}, f, indent=2)
+
+def bench_sources(fixture_paths=(), token_budget=None):
+    """Tokens saved by dedup and budget packing on search fixtures"""
+    import json
+    from fakes import make_search_fixture
+    from sources import pack_sources, SOURCE_TOKEN_BUDGET
+
+    fixtures = [json.load(open(path, encoding='utf-8')) for path in fixture_paths]
+    if not fixtures:
+        fixtures = [make_search_fixture(f"topic {i}", [f"topic {i} subtopic {s}" for s in range(3)], seed=i)
+                    for i in range(3)]
+
+    print(f"{'topic':<40} {'results':>7} {'urls':>5} {'dups':>5} {'raw tok':>8} {'packed':>7} {'saved':>6}")
+    for fixture in fixtures:
+        results = [r for response in fixture["responses"] for r in response["results"]]
+        start = time.perf_counter()
+        _, stats = pack_sources(results, " ".join([fixture["topic"], *fixture["subtopics"]]),
+                                token_budget=token_budget or SOURCE_TOKEN_BUDGET)
+        elapsed = time.perf_counter() - start
+        saved = 1 - stats["packed_tokens"] / max(1, stats["raw_tokens"])
+        print(f"{fixture['topic'][:40]:<40} {stats['results']:>7} {stats['duplicate_urls']:>5} {stats['near_duplicates']:>5} "
+              f"{stats['raw_tokens']:>8} {stats['packed_tokens']:>7} {saved:>6.0%}  ({elapsed * 1000:.0f} ms)")
+
+def fake_speech_service(cache_dir, latency=1.0):
+    from fake_speech import FakeSpeechService
+    return FakeSpeechService(latency=latency, cache_dir=cache_dir)
+
+def peak_rss_mb() -> float:
+    """Peak resident memory of this process or of its largest finished child"""
+    usage = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+                resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    return usage / 1024
+
+def _disable_render_cache():
+    """Render every animation for real, here and in spawned render workers"""
+    import render_cache
+    import test_video
+    os.environ["RENDER_CACHE"] = "0"
+    render_cache.RENDER_CACHE_ENABLED = test_video.RENDER_CACHE_ENABLED = False
+
+def bench_render(qualities=QUALITIES, num_sections=2):
+    """Per-section render time at each Manim quality, with fake narration audio"""
+    from cache import DiskCache
+    from fakes import png_bytes
+    from test_video import layout_sections, narration_text, _render_section
+    import tts
+
+    _disable_render_cache()
+
+    essay = make_essay(num_sections, words_per_section=120)
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        image_path = Path(tmp_dir) / "illustration.png"
+        image_path.write_bytes(png_bytes(1024, 1024))
+        voiceover_dir = f"{tmp_dir}/voiceovers"
+        tts.presynthesize([narration_text(sec) for sec in essay["sections"]],
+                          functools.partial(fake_speech_service, latency=0),
+                          voiceover_dir, cache=DiskCache(f"{tmp_dir}/tts"))
+        body_font_size, wrapped, _ = layout_sections(essay)
+
+        print(f"{'quality':>15} {'s/section':>10} {'frames':>7} {'frames/s':>9}")
+        try:
+            for quality in qualities:
+                times, frames = [], 0
+                for i, (section, lines) in enumerate(zip(essay["sections"], wrapped)):
+                    job = (i, section, str(image_path), body_font_size, lines, voiceover_dir,
+                           f"{tmp_dir}/{quality}", quality, None)
+                    start = time.perf_counter()
+                    _, trace = _render_section(job)
+                    times.append(time.perf_counter() - start)
+                    frames += sum(value for name, _, value in trace["counters"] if name == "frames_rendered")
+                print(f"{quality:>15} {statistics.mean(times):>10.2f} {frames:>7.0f} {frames / sum(times):>9.1f}")
+        finally:
+            os.chdir(cwd)
+
+def bench_backends(num_sections=3, quality="low_quality"):
+    """Whole-essay render time of the draft (Pillow+ffmpeg) and manim backends"""
+    from cache import DiskCache
+    from fakes import png_bytes
+    from draft_renderer import render_draft_video
+    from test_video import narration_text, render_essay_video
+    import tts
+
+    _disable_render_cache()
+    essay = make_essay(num_sections, words_per_section=120)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        image_path = Path(tmp_dir) / "illustration.png"
+        image_path.write_bytes(png_bytes(1024, 1024))
+        voiceover_dir = f"{tmp_dir}/voiceovers"
+        voiceovers = tts.presynthesize([narration_text(sec) for sec in essay["sections"]],
+                                       functools.partial(fake_speech_service, latency=0),
+                                       voiceover_dir, cache=DiskCache(f"{tmp_dir}/tts"))
+        audio = sum(v["duration"] for v in voiceovers)
+
+        times = {}
+        for backend, render in [("draft", render_draft_video), ("manim", render_essay_video)]:
+            start = time.perf_counter()
+            render(essay, str(image_path), f"{tmp_dir}/{backend}.mp4", quality=quality, voiceover_dir=voiceover_dir)
+            times[backend] = time.perf_counter() - start
+            print(f"{backend:>6}: {times[backend]:7.2f}s for {num_sections} sections ({audio:.0f}s of narration, {quality})")
+    print(f"draft speedup: {times['manim'] / times['draft']:.1f}x")
+
+def bench_rerender(num_sections=4, quality="low_quality"):
+    """Cold render, identical re-render and re-render after editing one section, through the shared render cache"""
+    from cache import DiskCache
+    from fakes import png_bytes
+    from test_video import narration_text, render_essay_video
+    from tracing import tracer
+    import tts
+
+    # A fresh essay, so the first render starts cold
+    essay = make_essay(num_sections, words_per_section=120, seed=int(time.time()))
+    edited = json.loads(json.dumps(essay))
+    edited["sections"][-1]["narration"] += " This sentence was added in review."
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        image_path = Path(tmp_dir) / "illustration.png"
+        image_path.write_bytes(png_bytes(1024, 1024))
+        for label, sections_data in [("cold", essay), ("unchanged", essay), ("one edited", edited)]:
+            voiceover_dir = f"{tmp_dir}/voiceovers_{label.replace(' ', '_')}"
+            tts.presynthesize([narration_text(sec) for sec in sections_data["sections"]],
+                              functools.partial(fake_speech_service, latency=0),
+                              voiceover_dir, cache=DiskCache(f"{tmp_dir}/tts"))
+            tracer.reset()
+            start = time.perf_counter()
+            render_essay_video(sections_data, str(image_path), f"{tmp_dir}/{label}.mp4",
+                               quality=quality, voiceover_dir=voiceover_dir)
+            elapsed = time.perf_counter() - start
+            counters = {name: value for name, _, value in tracer.export()["counters"]}
+            print(f"{label:>10}: {elapsed:6.2f}s, {counters.get('sections_reused', 0):.0f}/{num_sections} sections "
+                  f"reused, {counters.get('partial_movies_reused', 0):.0f} partial movies reused")
+
+def _pipeline_job(job):
+    """One topic through the whole pipeline against the fakes (runs in a worker process)"""
+    topic, work_dir, quality, tts_latency, render_workers, backend = job
+    from pipeline import run_topic_pipeline
+    from tracing import tracer
+
+    Path(work_dir).mkdir(parents=True, exist_ok=True)
+    os.chdir(work_dir)
+    start = time.perf_counter()
+    paths = run_topic_pipeline(
+        topic, Path(work_dir) / "publication",
+        update_status=lambda message: None,
+        quality=quality,
+        render_workers=render_workers,
+        speech_service_factory=functools.partial(fake_speech_service, latency=tts_latency),
+        backend=backend
+    )
+    elapsed = time.perf_counter() - start
+    trace = json.loads(paths["trace"].read_text())
+    tracer.reset()
+    stages = {event["name"].removeprefix("stage."): event["dur"] / 1e6
+              for event in trace["traceEvents"] if event["name"].startswith("stage.")}
+    return {"seconds": elapsed, "stages": stages, "peak_rss_mb": peak_rss_mb()}
+
+def bench_pipeline(jobs=2, concurrency=(1, 2), quality="low_quality", render_workers=None,
+                   search_latency=0.5, llm_latency=1.0, image_latency=2.0, tts_latency=1.0,
+                   completion_words=600, image_size=1024, backend="manim"):
+    """End-to-end topics against local fake services: stage latency, throughput and memory"""
+    from fakes import FakeAPIServer
+
+    with tempfile.TemporaryDirectory() as tmp_dir, FakeAPIServer(
+            search_latency=search_latency, llm_latency=llm_latency, image_latency=image_latency,
+            completion_words=completion_words, image_size=image_size) as server:
+        # Workers inherit the environment: fake endpoints and cold caches for every run
+        os.environ.update(server.environ())
+        os.environ["CACHE_DIR"] = f"{tmp_dir}/cache"
+        os.environ["METRICS_DB"] = f"{tmp_dir}/metrics.db"
+
+        print(f"{'jobs':>4} {'conc':>4} " + " ".join(f"{stage:>12}" for stage in STAGES)
+              + f" {'e2e (s)':>8} {'jobs/min':>8} {'peak RSS':>9}")
+        for level in concurrency:
+            job_args = [(f"benchmark topic {level} {i}", f"{tmp_dir}/c{level}/job{i}", quality,
+                         tts_latency, render_workers, backend) for i in range(jobs)]
+            start = time.perf_counter()
+            # spawn, like the job queue: every job gets a fresh interpreter and manim config
+            with ProcessPoolExecutor(max_workers=level, mp_context=multiprocessing.get_context("spawn")) as pool:
+                results = list(pool.map(_pipeline_job, job_args))
+            wall = time.perf_counter() - start
+
+            stage_times = " ".join(f"{statistics.mean(r['stages'].get(stage, 0) for r in results):>12.2f}"
+                                   for stage in STAGES)
+            print(f"{jobs:>4} {level:>4} {stage_times} {statistics.mean(r['seconds'] for r in results):>8.2f} "
+                  f"{jobs * 60 / wall:>8.2f} {max(r['peak_rss_mb'] for r in results):>7.0f}MB")
+        print(f"fake API calls: {server.calls}")
+
+def bench_suite():
+    """Every offline benchmark with its defaults"""
+    print("== font size ==")
+    bench_font_size()
+    print("\n== render per quality ==")
+    bench_render()
+    print("\n== render backends ==")
+    bench_backends()
+    print("\n== pipeline ==")
+    bench_pipeline()
+    print(f"\npeak RSS of the benchmark process: {peak_rss_mb():.0f}MB")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Performance benchmarks")
+    subparsers = parser.add_subparsers(dest="benchmark", required=True)
+
+    font_parser = subparsers.add_parser("font-size", help="font-size search vs analytic solver")
+    font_parser.add_argument("--sections", type=int, default=6)
+    font_parser.add_argument("--essays", type=int, default=3)
+    font_parser.add_argument("--repeats", type=int, default=3)
+
+    search_parser = subparsers.add_parser("search-cache", help="search cache hit rate and latency savings")
+    search_parser.add_argument("--topics", type=int, default=5)
+    search_parser.add_argument("--runs", type=int, default=4)
+    search_parser.add_argument("--latency", type=float, default=0.5)
+
+    fanout_parser = subparsers.add_parser("search-fanout", help="concurrent subtopic searches on the pooled client")
+    fanout_parser.add_argument("--subtopics", type=int, default=3)
+    fanout_parser.add_argument("--latency", type=float, default=0.5)
+
+    governor_parser = subparsers.add_parser("governor", help="throttled burst with and without the call governor")
+    governor_parser.add_argument("--requests", type=int, default=40)
+    governor_parser.add_argument("--rate-limit", type=float, default=4.0)
+    governor_parser.add_argument("--latency", type=float, default=0.2)
+    governor_parser.add_argument("--error-rate", type=float, default=0.05)
+    governor_parser.add_argument("--retry-after", type=float, default=1.0)
+
+    connections_parser = subparsers.add_parser("connections", help="connection reuse of the shared clients")
+    connections_parser.add_argument("--calls", type=int, default=20)
+
+    tts_parser = subparsers.add_parser("tts", help="narration pre-synthesis with the fake speech service")
+    tts_parser.add_argument("--sections", type=int, default=6)
+    tts_parser.add_argument("--latency", type=float, default=1.0)
+    tts_parser.add_argument("--workers", type=int, default=4)
+
+    sources_parser = subparsers.add_parser("sources", help="tokens saved by source dedup and packing")
+    sources_parser.add_argument("fixtures", nargs="*", help="fixture JSON files (default: synthetic)")
+    sources_parser.add_argument("--budget", type=int, default=None)
+    sources_parser.add_argument("--record", metavar="TOPIC", help="record a fixture from live searches instead")
+    sources_parser.add_argument("--subtopics", nargs="*", default=[])
+    sources_parser.add_argument("--output", default="search_fixture.json")
+
+    render_parser = subparsers.add_parser("render", help="per-section render time at each quality level")
+    render_parser.add_argument("--qualities", nargs="*", default=QUALITIES, choices=QUALITIES)
+    render_parser.add_argument("--sections", type=int, default=2)
+
+    pipeline_parser = subparsers.add_parser("pipeline", help="end-to-end topics against local fake services")
+    pipeline_parser.add_argument("--jobs", type=int, default=2)
+    pipeline_parser.add_argument("--concurrency", type=int, nargs="*", default=[1, 2])
+    pipeline_parser.add_argument("--quality", default="low_quality", choices=QUALITIES)
+    pipeline_parser.add_argument("--render-workers", type=int, default=None)
+    pipeline_parser.add_argument("--search-latency", type=float, default=0.5)
+    pipeline_parser.add_argument("--llm-latency", type=float, default=1.0)
+    pipeline_parser.add_argument("--image-latency", type=float, default=2.0)
+    pipeline_parser.add_argument("--tts-latency", type=float, default=1.0)
+    pipeline_parser.add_argument("--completion-words", type=int, default=600)
+    pipeline_parser.add_argument("--image-size", type=int, default=1024)
+
+    pipeline_parser.add_argument("--backend", default="manim", choices=["manim", "draft"])
+
+    backends_parser = subparsers.add_parser("backends", help="draft vs manim render backend")
+    backends_parser.add_argument("--sections", type=int, default=3)
+    backends_parser.add_argument("--quality", default="low_quality", choices=QUALITIES)
+
+    rerender_parser = subparsers.add_parser("rerender", help="re-render time with the shared render cache")
+    rerender_parser.add_argument("--sections", type=int, default=4)
+    rerender_parser.add_argument("--quality", default="low_quality", choices=QUALITIES)
+
+    subparsers.add_parser("suite", help="all offline benchmarks with their defaults")
+
+    args = parser.parse_args()
+    if args.benchmark == "font-size":
+        bench_font_size(args.sections, args.essays, args.repeats)
+    elif args.benchmark == "search-cache":
+        bench_search_cache(args.topics, runs=args.runs, latency=args.latency)
+    elif args.benchmark == "search-fanout":
+        bench_search_fanout(args.subtopics, args.latency)
+    elif args.benchmark == "governor":
+        bench_governor(args.requests, args.rate_limit, args.latency, args.error_rate, args.retry_after)
+    elif args.benchmark == "connections":
+        bench_connections(args.calls)
+    elif args.benchmark == "tts":
+        bench_tts(args.sections, args.latency, args.workers)
+    elif args.benchmark == "sources":
+        if args.record:
+            record_search_fixture(args.record, args.subtopics, args.output)
+        else:
+            bench_sources(args.fixtures, args.budget)
+    elif args.benchmark == "render":
+        bench_render(args.qualities, args.sections)
+    elif args.benchmark == "pipeline":
+        bench_pipeline(args.jobs, args.concurrency, args.quality, args.render_workers,
+                       args.search_latency, args.llm_latency, args.image_latency, args.tts_latency,
+                       args.completion_words, args.image_size, args.backend)
+    elif args.benchmark == "backends":
+        bench_backends(args.sections, args.quality)
+    elif args.benchmark == "rerender":
+        bench_rerender(args.sections, args.quality)
+    elif args.benchmark == "suite":
+        bench_suite()
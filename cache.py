@@ -0,0 +1,158 @@
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+import threading
+import time
+from contextlib import closing, contextmanager
+from pathlib import Path
+from tracing import count
+
+# Root for all persistent caches; absolute so per-job working directories share it
+CACHE_ROOT = Path(os.getenv("CACHE_DIR", ".cache")).resolve()
+
+
+def link_or_copy(source, target):
+    """Hard link source at target, or copy it where links are not possible (e.g. across filesystems)"""
+    try:
+        os.link(source, target)
+    except OSError:
+        shutil.copyfile(source, target)
+
+def make_key(*parts) -> str:
+    """Content address for any JSON-serializable combination of inputs"""
+    payload = json.dumps(parts, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class DiskCache:
+    """Content-addressed on-disk cache with TTL expiry and LRU size-based eviction.
+
+    Payloads are stored as files under ``directory`` and indexed in a small SQLite
+    database, which also keeps the hit/miss counters. SQLite locking plus atomic
+    file renames make it safe to share between threads and processes.
+    """
+
+    def __init__(self, directory, ttl: float = None, max_bytes: int = 1 << 30):
+        self.directory = Path(directory)
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._ready = False
+
+    @contextmanager
+    def _connect(self):
+        """A connection for one transaction, committed and closed when the block ends"""
+        if not self._ready:
+            with self._lock:
+                self.directory.mkdir(parents=True, exist_ok=True)
+                with closing(sqlite3.connect(self.directory / "index.db", timeout=30)) as db, db:
+                    db.execute("PRAGMA journal_mode=WAL")
+                    db.execute("""CREATE TABLE IF NOT EXISTS entries (
+                        key TEXT PRIMARY KEY, size INTEGER, created_at REAL, accessed_at REAL)""")
+                    db.execute("CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER)")
+                self._ready = True
+        with closing(sqlite3.connect(self.directory / "index.db", timeout=30)) as db, db:
+            yield db
+
+    def _payload_path(self, key: str) -> Path:
+        return self.directory / key[:2] / key
+
+    def _count(self, db, name: str):
+        db.execute("INSERT INTO counters VALUES (?, 1) ON CONFLICT(name) DO UPDATE SET value = value + 1", (name,))
+
+    def get_path(self, key: str):
+        """Path of a fresh cached payload, or None on a miss"""
+        now = time.time()
+        path = self._payload_path(key)
+        with self._connect() as db:
+            row = db.execute("SELECT created_at FROM entries WHERE key = ?", (key,)).fetchone()
+            expired = row is not None and self.ttl is not None and now - row[0] > self.ttl
+            if row is None or expired or not path.exists():
+                if row is not None:
+                    db.execute("DELETE FROM entries WHERE key = ?", (key,))
+                    path.unlink(missing_ok=True)
+                self._count(db, "misses")
+                count("cache_misses", cache=self.directory.name)
+                return None
+            db.execute("UPDATE entries SET accessed_at = ? WHERE key = ?", (now, key))
+            self._count(db, "hits")
+        count("cache_hits", cache=self.directory.name)
+        return path
+
+    def contains(self, key: str) -> bool:
+        """Whether a fresh payload is cached, without counting a hit or miss"""
+        with self._connect() as db:
+            row = db.execute("SELECT created_at FROM entries WHERE key = ?", (key,)).fetchone()
+        expired = row is not None and self.ttl is not None and time.time() - row[0] > self.ttl
+        return row is not None and not expired and self._payload_path(key).exists()
+
+    def get(self, key: str):
+        path = self.get_path(key)
+        if path is None:
+            return None
+        try:
+            return path.read_bytes()
+        except FileNotFoundError:
+            # Evicted by another process between the lookup and the read
+            return None
+
+    def _store(self, key: str, write) -> Path:
+        path = self._payload_path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(f"{key}.{os.getpid()}.{threading.get_ident()}.tmp")
+        write(tmp_path)
+        size = tmp_path.stat().st_size
+        os.replace(tmp_path, path)
+        self._index(key, size)
+        return path
+
+    def set(self, key: str, data: bytes) -> Path:
+        return self._store(key, lambda tmp_path: tmp_path.write_bytes(data))
+
+    def set_file(self, key: str, source) -> Path:
+        """Copy an existing file into the cache without reading it into memory"""
+        return self._store(key, lambda tmp_path: shutil.copyfile(source, tmp_path))
+
+    def get_json(self, key: str):
+        data = self.get(key)
+        return json.loads(data) if data is not None else None
+
+    def set_json(self, key: str, value) -> Path:
+        return self.set(key, json.dumps(value).encode("utf-8"))
+
+    def _index(self, key: str, size: int):
+        now = time.time()
+        with self._connect() as db:
+            db.execute("INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?)", (key, size, now, now))
+            self._evict(db, keep=key)
+
+    def _evict(self, db, keep: str = None):
+        total = db.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        # Least recently used entries go first; the one just written stays, its caller is about to use it
+        for key, size in db.execute("SELECT key, size FROM entries ORDER BY accessed_at").fetchall():
+            if total <= self.max_bytes:
+                break
+            if key == keep:
+                continue
+            db.execute("DELETE FROM entries WHERE key = ?", (key,))
+            self._payload_path(key).unlink(missing_ok=True)
+            total -= size
+            self._count(db, "evictions")
+
+    def stats(self) -> dict:
+        with self._connect() as db:
+            counters = dict(db.execute("SELECT name, value FROM counters").fetchall())
+            entries, size = db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries").fetchone()
+        hits, misses = counters.get("hits", 0), counters.get("misses", 0)
+        return {
+            "hits": hits,
+            "misses": misses,
+            "evictions": counters.get("evictions", 0),
+            "hit_rate": hits / (hits + misses) if hits + misses else 0.0,
+            "entries": entries,
+            "bytes": size,
+        }
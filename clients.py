@@ -0,0 +1,154 @@
+import asyncio
+import os
+import threading
+import weakref
+import httpx
+from llama_index.llms.azure_openai import AzureOpenAI
+from openai import AsyncOpenAI, AzureOpenAI as AzureOpenAIClient
+from tracing import count
+
+# Every client below shares these pools; retries are the governor's job, so the SDKs' own are off
+HTTP_TIMEOUT = httpx.Timeout(60.0, connect=10.0)
+HTTP_LIMITS = httpx.Limits(max_connections=20, max_keepalive_connections=10, keepalive_expiry=120)
+
+_lock = threading.RLock()
+_stats = {}
+
+def _record(host: str, kind: str):
+    with _lock:
+        host_stats = _stats.setdefault(host, {"requests": 0, "connections": 0, "tls_handshakes": 0})
+        host_stats[kind] += 1
+    count(f"http_{kind}", host=host)
+
+def _trace_hook(host: str):
+    # httpcore reports every new connection through the request's "trace" extension
+    def trace(event_name, info):
+        if event_name == "connection.connect_tcp.complete":
+            _record(host, "connections")
+        elif event_name == "connection.start_tls.complete":
+            _record(host, "tls_handshakes")
+    return trace
+
+def _atrace_hook(host: str):
+    trace = _trace_hook(host)
+
+    async def atrace(event_name, info):
+        trace(event_name, info)
+    return atrace
+
+def _on_request(request: httpx.Request):
+    _record(request.url.host, "requests")
+    request.extensions["trace"] = _trace_hook(request.url.host)
+
+async def _on_arequest(request: httpx.Request):
+    _record(request.url.host, "requests")
+    request.extensions["trace"] = _atrace_hook(request.url.host)
+
+def connection_stats() -> dict:
+    """Requests, new connections and TLS handshakes per host, with the share of requests on reused connections"""
+    with _lock:
+        stats = {host: dict(host_stats) for host, host_stats in _stats.items()}
+    for host_stats in stats.values():
+        requests = host_stats["requests"]
+        host_stats["reuse"] = 1 - host_stats["connections"] / requests if requests else 0.0
+    return stats
+
+_http_client = None
+
+def get_http_client() -> httpx.Client:
+    """Process-wide keep-alive client for synchronous calls; httpx clients are thread-safe"""
+    global _http_client
+    with _lock:
+        if _http_client is None or _http_client.is_closed:
+            _http_client = httpx.Client(timeout=HTTP_TIMEOUT, limits=HTTP_LIMITS,
+                                        event_hooks={"request": [_on_request]})
+        return _http_client
+
+# Async clients are kept per event loop: httpx connections cannot cross loops
+_async_clients = weakref.WeakKeyDictionary()
+_loop_clients = weakref.WeakKeyDictionary()
+
+def get_async_client() -> httpx.AsyncClient:
+    """Keep-alive HTTP client shared by every call running on the current event loop"""
+    loop = asyncio.get_running_loop()
+    with _lock:
+        client = _async_clients.get(loop)
+        if client is None or client.is_closed:
+            client = httpx.AsyncClient(timeout=HTTP_TIMEOUT, limits=HTTP_LIMITS,
+                                       event_hooks={"request": [_on_arequest]})
+            _async_clients[loop] = client
+            _loop_clients[loop] = {}
+        return client
+
+def _loop_registry() -> dict:
+    """SDK clients built for the running event loop, or for synchronous use outside any loop"""
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        return _sync_clients
+    get_async_client()
+    return _loop_clients[loop]
+
+_sync_clients = {}
+
+def _registered(key, factory):
+    registry = _loop_registry()
+    with _lock:
+        if key not in registry:
+            registry[key] = factory()
+        return registry[key]
+
+def get_llm(model: str, engine: str = None, **settings) -> AzureOpenAI:
+    """llama-index Azure OpenAI LLM over the shared pools, built once per settings and event loop"""
+    def build():
+        clients = {"http_client": get_http_client()}
+        try:
+            clients["async_http_client"] = get_async_client()
+        except RuntimeError:
+            pass
+        return AzureOpenAI(engine=engine or model, model=model, max_retries=0, **clients, **settings)
+    return _registered(("llm", model, engine, tuple(sorted(settings.items()))), build)
+
+def get_azure_openai() -> AzureOpenAIClient:
+    """Azure OpenAI SDK client for synchronous chat completions"""
+    return _registered(("azure_openai",), lambda: AzureOpenAIClient(
+        api_key=os.getenv("AZURE_OPENAI_KEY"),
+        api_version=os.getenv("AZURE_OPENAI_API_VERSION"),
+        azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT"),
+        http_client=get_http_client(),
+        max_retries=0
+    ))
+
+def get_openai() -> AsyncOpenAI:
+    """OpenAI SDK client (image generation) on the current event loop's pool"""
+    return _registered(("openai",), lambda: AsyncOpenAI(
+        api_key=os.getenv("OPENAI_API_KEY_REGULAR"), http_client=get_async_client(), max_retries=0))
+
+class TavilySearchClient:
+    """TavilyClient.search over the shared keep-alive pool instead of a fresh connection per call"""
+
+    def __init__(self, url: str = None):
+        self.url = url or os.getenv("TAVILY_SEARCH_URL", "https://api.tavily.com/search")
+
+    def search(self, query: str, **params) -> dict:
+        payload = {"api_key": os.getenv("TAVILY_API_KEY"), "query": query, **params}
+        response = get_http_client().post(self.url, json=payload)
+        response.raise_for_status()
+        count("bytes_downloaded", len(response.content), source="search")
+        return response.json()
+
+def get_tavily() -> TavilySearchClient:
+    return _registered(("tavily",), TavilySearchClient)
+
+# Long-lived loop so pooled clients survive across workflow runs and Streamlit sessions
+_loop = None
+_loop_lock = threading.Lock()
+
+def run_coroutine(coro):
+    """Run a coroutine to completion on the process-wide background event loop"""
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name="async-io", daemon=True).start()
+    return asyncio.run_coroutine_threadsafe(coro, _loop).result()
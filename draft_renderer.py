@@ -0,0 +1,248 @@
+import argparse
+import json
+import os
+import subprocess
+from pathlib import Path
+from typing import List
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont
+from frame_geometry import QUALITIES, FRAME_UNITS, MARGIN, illustration_size
+from tracing import span, count
+
+DRAFT_FONT = os.getenv("DRAFT_FONT", "DejaVuSans.ttf")
+# Layout in manim's frame units, so drafts look like the real render
+TITLE_BUFF = 0.5
+LINE_SPACING = 0.3
+TITLE_SIZE = 0.45
+MIN_BODY_SIZE, MAX_BODY_SIZE = 0.16, 0.4
+
+TITLE_SECONDS_PER_CHAR = 0.05
+HOLD_SECONDS = 1.0
+# Narration length assumed when no audio was synthesized
+READING_CHARS_PER_SECOND = 15
+
+def load_font(size: int):
+    try:
+        return ImageFont.truetype(DRAFT_FONT, size)
+    except OSError:
+        return ImageFont.load_default(size=size)
+
+def wrap_text(text: str, font, width: float) -> List[str]:
+    """Greedy line breaking with Pillow's glyph advances"""
+    lines = []
+    for paragraph in text.split("\n"):
+        current = ""
+        for word in paragraph.split():
+            candidate = f"{current} {word}" if current else word
+            if current and font.getlength(candidate) > width:
+                lines.append(current)
+                current = word
+            else:
+                current = candidate
+        if current:
+            lines.append(current)
+    return lines
+
+_font_advances = {}
+
+def _advances(font) -> dict:
+    return _font_advances.setdefault(id(font), {})
+
+class GlyphRun:
+    """One line of text rasterized once, revealed character by character"""
+
+    def __init__(self, text: str, font):
+        self.text = text
+        left, top, right, bottom = font.getbbox(text)
+        self.mask = Image.new("L", (max(1, int(right) + 1), max(1, int(bottom) + 1)))
+        ImageDraw.Draw(self.mask).text((0, 0), text, font=font, fill=255)
+        # Right edge of every prefix from per-character advances, so reveals need no further layout
+        advances = _advances(font)
+        edges, x = [0], 0.0
+        for char in text:
+            if char not in advances:
+                advances[char] = font.getlength(char)
+            x += advances[char]
+            edges.append(min(int(round(x)), self.mask.width))
+        edges[-1] = self.mask.width
+        self.edges = edges
+        self.coverage = np.asarray(self.mask, dtype=np.uint16)[..., None]
+
+    def reveal(self, canvas: np.ndarray, position, start: int, end: int):
+        """Paint characters [start, end) in white onto an RGB frame array"""
+        x, y = position[0] + self.edges[start], position[1]
+        right = min(position[0] + self.edges[end], canvas.shape[1])
+        bottom = min(y + self.coverage.shape[0], canvas.shape[0])
+        if right <= x or bottom <= y:
+            return
+        region = canvas[y:bottom, x:right]
+        coverage = self.coverage[:bottom - y, self.edges[start]:self.edges[start] + right - x]
+        region += ((255 - region) * coverage // 255).astype(np.uint8)
+
+class TypedBlock:
+    """Wrapped lines at a position, typed onto a canvas a few characters per frame"""
+
+    def __init__(self, lines: List[str], font, position, line_pitch: int):
+        self.runs = []
+        for i, line in enumerate(lines):
+            self.runs.append(((position[0], position[1] + i * line_pitch), GlyphRun(line, font)))
+        self.num_chars = sum(len(run.text) for _, run in self.runs)
+        self.height = line_pitch * (len(lines) - 1) + (self.runs[-1][1].mask.height if self.runs else 0)
+        self.shown = 0
+
+    def type_to(self, canvas: np.ndarray, chars: int):
+        """Reveal up to the first ``chars`` characters; only newly revealed glyphs are painted"""
+        chars = min(chars, self.num_chars)
+        offset = 0
+        for position, run in self.runs:
+            line_start, line_end = offset, offset + len(run.text)
+            start, end = max(self.shown, line_start), min(chars, line_end)
+            if start < end:
+                run.reveal(canvas, position, start - line_start, end - line_start)
+            offset = line_end
+        self.shown = max(self.shown, chars)
+
+class DraftLayout:
+    """Pixel layout of the essay slides for one frame size"""
+
+    def __init__(self, sections: List[dict], width: int, height: int):
+        self.width, self.height = width, height
+        self.unit = height / FRAME_UNITS
+        self.text_left = int(width / 2 + MARGIN * self.unit)
+        self.text_width = width / 2 - 2 * MARGIN * self.unit
+        self.title_font = load_font(int(TITLE_SIZE * self.unit))
+        self.title_top = int(TITLE_BUFF * self.unit / 2)
+        title_height = self.title_font.getbbox("Test")[3]
+        self.body_top = int(self.title_top + title_height + TITLE_BUFF * self.unit)
+        max_height = height - self.body_top - MARGIN * self.unit / 2
+        self.body_size = self._fit_body_size([sec["narration"].strip() for sec in sections], max_height)
+        self.body_font = load_font(self.body_size)
+
+    def line_pitch(self, font) -> int:
+        ascent, descent = font.getmetrics()
+        return int((ascent + descent) * (1 + LINE_SPACING))
+
+    def _fit_body_size(self, texts: List[str], max_height: float) -> int:
+        """Largest body font size (in pixels) at which every narration fits"""
+        left, right = int(MIN_BODY_SIZE * self.unit), int(MAX_BODY_SIZE * self.unit)
+        size = left
+        while left <= right:
+            mid = (left + right) // 2
+            font = load_font(mid)
+            if all(len(wrap_text(text, font, self.text_width)) * self.line_pitch(font) <= max_height for text in texts):
+                size = mid
+                left = mid + 1
+            else:
+                right = mid - 1
+        return size
+
+    def background(self, image_path) -> Image.Image:
+        """Black frame with the illustration fitted to the left half"""
+        canvas = Image.new("RGB", (self.width, self.height))
+        if image_path and Path(image_path).exists():
+            image = Image.open(image_path).convert("RGB")
+            size = illustration_size(image.size, self.width, self.height)
+            if image.size != size:
+                image = image.resize(size, Image.LANCZOS)
+            canvas.paste(image, (int(self.width / 4 - image.width / 2), int(self.height / 2 - image.height / 2)))
+        return canvas
+
+    def title(self, text: str) -> TypedBlock:
+        width = self.title_font.getlength(text)
+        left = int(3 * self.width / 4 - width / 2)
+        return TypedBlock([text], self.title_font, (left, self.title_top), self.line_pitch(self.title_font))
+
+    def paragraph(self, text: str) -> TypedBlock:
+        lines = wrap_text(text, self.body_font, self.text_width)
+        return TypedBlock(lines, self.body_font, (self.text_left, self.body_top), self.line_pitch(self.body_font))
+
+def _load_voiceovers(voiceover_dir) -> List[dict]:
+    # Manifest written by tts.presynthesize; read directly to keep manim out of this process
+    manifest = Path(voiceover_dir) / "voiceovers.json" if voiceover_dir else None
+    return json.loads(manifest.read_text()) if manifest and manifest.exists() else None
+
+def _type_frames(canvas: np.ndarray, block: TypedBlock, num_frames: int, write):
+    for frame in range(1, num_frames + 1):
+        block.type_to(canvas, round(block.num_chars * frame / num_frames))
+        # The contiguous frame array goes to the pipe without a copy
+        write(canvas.data)
+
+def render_draft_video(sections_data, image_path: str, output_path: str,
+                       quality: str = "medium_quality", max_workers: int = None,
+                       voiceover_dir: str = None, frame_rate: float = None, preset: str = "veryfast") -> Path:
+    """Render the essay slides with Pillow, piping raw frames and the narration into ffmpeg.
+
+    Same inputs and slide timing as the manim backend; ``max_workers`` is accepted
+    for a common signature and unused, since a single process keeps up with the encoder.
+    ``frame_rate`` overrides the quality's own rate and ``preset`` is the x264 preset.
+    """
+    output_path = Path(output_path).resolve()
+    width, height, quality_rate = QUALITIES[quality]
+    frame_rate = frame_rate or quality_rate
+    sections = sections_data["sections"]
+    voiceovers = _load_voiceovers(voiceover_dir)
+    layout = DraftLayout(sections, width, height)
+    base = np.asarray(layout.background(image_path), dtype=np.uint8)
+
+    # Frame counts of every phase first: they fix the audio offsets
+    timeline = []
+    for i, sec in enumerate(sections):
+        text = sec["narration"].strip()
+        narration = voiceovers[i]["duration"] if voiceovers else len(text) / READING_CHARS_PER_SECOND
+        timeline.append({
+            "title": max(1, round(len(sec["title"]) * TITLE_SECONDS_PER_CHAR * frame_rate)),
+            # The paragraph is typed over the whole narration, as in the manim scene
+            "type": max(1, round(narration * frame_rate)),
+            "hold": round(HOLD_SECONDS * frame_rate),
+        })
+
+    command = ["ffmpeg", "-y", "-loglevel", "error",
+               "-f", "rawvideo", "-pix_fmt", "rgb24", "-s", f"{width}x{height}", "-r", str(frame_rate), "-i", "-"]
+    if voiceovers:
+        filters = []
+        for i, frames in enumerate(timeline):
+            command += ["-i", str(Path(voiceover_dir) / voiceovers[i]["audio"])]
+            # Narration starts once the title is typed and is cut to the section's length
+            delay = frames["title"] / frame_rate
+            duration = sum(frames.values()) / frame_rate
+            filters.append(f"[{i + 1}:a]adelay={int(delay * 1000)}:all=1,"
+                           f"apad=whole_dur={duration:.6f},atrim=0:{duration:.6f}[a{i}]")
+        filters.append("".join(f"[a{i}]" for i in range(len(timeline))) + f"concat=n={len(timeline)}:v=0:a=1[aout]")
+        command += ["-filter_complex", ";".join(filters), "-map", "0:v", "-map", "[aout]", "-c:a", "aac"]
+    command += ["-c:v", "libx264", "-preset", preset, "-pix_fmt", "yuv420p",
+                "-movflags", "+faststart", str(output_path)]
+
+    with span("video.draft_render", quality=quality, sections=len(sections)):
+        process = subprocess.Popen(command, stdin=subprocess.PIPE)
+        write = process.stdin.write
+        try:
+            for sec, frames in zip(sections, timeline):
+                canvas = base.copy()
+                _type_frames(canvas, layout.title(sec["title"]), frames["title"], write)
+                _type_frames(canvas, layout.paragraph(sec["narration"].strip()), frames["type"], write)
+                for _ in range(frames["hold"]):
+                    write(canvas.data)
+                count("frames_rendered", sum(frames.values()), backend="draft")
+        finally:
+            process.stdin.close()
+            process.wait()
+    if process.returncode != 0:
+        raise RuntimeError(f"ffmpeg exited with status {process.returncode}")
+    return output_path
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Render a structured essay into a video")
+    parser.add_argument("structure", help="structured content JSON")
+    parser.add_argument("image", help="illustration")
+    parser.add_argument("output", help="output mp4")
+    parser.add_argument("--backend", choices=["draft", "manim"], default="draft")
+    parser.add_argument("--quality", default="medium_quality", choices=list(QUALITIES))
+    parser.add_argument("--voiceovers", default=None, help="directory with pre-synthesized narration")
+    args = parser.parse_args()
+
+    sections_data = json.loads(Path(args.structure).read_text(encoding="utf-8"))
+    if args.backend == "manim":
+        from test_video import render_essay_video as render
+    else:
+        render = render_draft_video
+    print(f"Video saved to {render(sections_data, args.image, args.output, quality=args.quality, voiceover_dir=args.voiceovers)}")
@@ -0,0 +1,83 @@
+import re
+from typing import TypedDict, List
+
+# Slides per video; structure_essay never returns more
+MAX_SECTIONS = 6
+
+class Section(TypedDict):
+    title: str
+    narration: str
+
+class EssayStructure(TypedDict):
+    sections: List[Section]
+
+_HEADING = re.compile(r"^#{1,6}\s+\S", re.MULTILINE)
+
+def validate_structure(data, max_sections: int = MAX_SECTIONS) -> EssayStructure:
+    """Check structured content against EssayStructure, raising ValueError on a mismatch.
+
+    ``max_sections=None`` checks only the shape, e.g. before merging sections down to the limit.
+    """
+    sections = data.get("sections") if isinstance(data, dict) else None
+    if not isinstance(sections, list) or not sections:
+        raise ValueError("Structured content needs a non-empty 'sections' list")
+    if max_sections is not None and len(sections) > max_sections:
+        raise ValueError(f"Structured content has {len(sections)} sections, at most {max_sections} allowed")
+    for i, section in enumerate(sections):
+        if not isinstance(section, dict):
+            raise ValueError(f"Section {i} is not an object")
+        for key in Section.__annotations__:
+            if not isinstance(section.get(key), str) or not section[key].strip():
+                raise ValueError(f"Section {i} is missing a '{key}' string")
+    return data
+
+def split_at_headings(essay: str) -> List[str]:
+    """Markdown essay cut before every heading; text before the first heading stays with it"""
+    starts = [m.start() for m in _HEADING.finditer(essay)]
+    if not starts or starts[0] != 0:
+        starts = [0] + starts
+    chunks = [essay[start:end].strip() for start, end in zip(starts, starts[1:] + [len(essay)])]
+    chunks = [chunk for chunk in chunks if chunk]
+    # A chunk that is only a heading (the essay title) is folded into the next one
+    merged = []
+    for chunk in chunks:
+        if merged and "\n" not in merged[-1].strip():
+            merged[-1] = f"{merged[-1]}\n\n{chunk}"
+        else:
+            merged.append(chunk)
+    return merged
+
+def has_body(chunk: str) -> bool:
+    """Whether a chunk has any text besides headings"""
+    return any(line.strip() and not _HEADING.match(line.strip()) for line in chunk.splitlines())
+
+def group_chunks(chunks: List[str], max_chunks: int = MAX_SECTIONS) -> List[str]:
+    """Join the adjacent pair with the fewest words until at most max_chunks remain"""
+    chunks = list(chunks)
+    while len(chunks) > max_chunks:
+        sizes = [len(a.split()) + len(b.split()) for a, b in zip(chunks, chunks[1:])]
+        i = sizes.index(min(sizes))
+        chunks[i:i + 2] = [f"{chunks[i]}\n\n{chunks[i + 1]}"]
+    return chunks
+
+def section_quotas(chunks: List[str], max_sections: int = MAX_SECTIONS) -> List[int]:
+    """Sections each chunk may produce: one each, the rest shared out by length"""
+    quotas = [1] * len(chunks)
+    words = [len(chunk.split()) for chunk in chunks]
+    for _ in range(max_sections - len(chunks)):
+        i = max(range(len(chunks)), key=lambda j: words[j] / (quotas[j] + 1))
+        quotas[i] += 1
+    return quotas
+
+def merge_sections(sections: List[Section], max_sections: int = MAX_SECTIONS) -> EssayStructure:
+    """Sections of all chunks in essay order, joining the shortest neighbours down to max_sections"""
+    sections = [dict(section) for section in sections]
+    while len(sections) > max_sections:
+        sizes = [len(a["narration"].split()) + len(b["narration"].split()) for a, b in zip(sections, sections[1:])]
+        i = sizes.index(min(sizes))
+        first, second = sections[i], sections[i + 1]
+        first["narration"] = f"{first['narration'].strip()} {second['narration'].strip()}"
+        if "text" in first or "text" in second:
+            first["text"] = " ".join(s.get("text", "").strip() for s in (first, second)).strip()
+        del sections[i + 1]
+    return {"sections": sections}
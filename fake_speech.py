@@ -0,0 +1,21 @@
+import time
+from pathlib import Path
+from manim_voiceover.services.base import SpeechService
+from fakes import write_silent_wav
+
+class FakeSpeechService(SpeechService):
+    """Speech service writing silent WAVs as long as the text would take to read"""
+
+    def __init__(self, latency: float = 1.0, chars_per_second: float = 15.0, **kwargs):
+        self.latency = latency
+        self.chars_per_second = chars_per_second
+        self.voice = "fake"
+        super().__init__(**kwargs)
+
+    def generate_from_text(self, text, cache_dir=None, path=None, **kwargs) -> dict:
+        cache_dir = Path(cache_dir or self.cache_dir)
+        input_data = {"input_text": text, "service": "fake"}
+        audio_path = path or f"{self.get_audio_basename(input_data)}.wav"
+        time.sleep(self.latency)
+        write_silent_wav(cache_dir / audio_path, len(text) / self.chars_per_second)
+        return {"input_text": text, "input_data": input_data, "original_audio": str(audio_path)}
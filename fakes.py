@@ -0,0 +1,350 @@
+import hashlib
+import json
+import random
+import struct
+import threading
+import time
+import wave
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+FILLER = (
+    "researchers report that the approach improves accuracy while reducing cost and "
+    "several groups have reproduced the results on larger datasets with similar findings"
+).split()
+
+class FakeSearchClient:
+    """Drop-in for TavilyClient.search returning deterministic results after a fixed latency"""
+
+    def __init__(self, latency: float = 0.5, num_results: int = 5):
+        self.latency = latency
+        self.num_results = num_results
+        self.calls = 0
+
+    def search(self, query: str, **params) -> dict:
+        self.calls += 1
+        time.sleep(self.latency)
+        return fake_search_response(query, params.get("max_results", self.num_results))
+
+def fake_search_response(query: str, num_results: int = 5, words_per_result: int = 120) -> dict:
+    """Tavily-shaped response whose content overlaps between related queries"""
+    seed = int(hashlib.sha256(query.lower().encode("utf-8")).hexdigest(), 16)
+    rng = random.Random(seed)
+    words = query.lower().split()
+    results = []
+    for i in range(num_results):
+        body = " ".join(rng.choice(words + FILLER) for _ in range(words_per_result))
+        results.append({
+            "title": f"{query.title()} ({i + 1})",
+            "url": f"https://example.org/{'-'.join(words)}/{i + 1}",
+            "content": body,
+            "score": round(1 - i / (num_results + 1), 3),
+        })
+    return {"query": query, "results": results}
+
+def make_search_fixture(topic: str, subtopics: list, overlap: float = 0.4, seed: int = 0) -> dict:
+    """Responses for a topic and its subtopic searches with the overlap real searches show.
+
+    A share of each subtopic's results are the topic's articles again, either at the
+    same URL or syndicated elsewhere with light edits.
+    """
+    rng = random.Random(seed)
+    topic_response = fake_search_response(topic)
+    responses = [topic_response]
+    for subtopic in subtopics:
+        response = fake_search_response(subtopic)
+        for i, result in enumerate(response["results"]):
+            if rng.random() >= overlap:
+                continue
+            source = rng.choice(topic_response["results"])
+            words = source["content"].split()
+            # Syndicated copy: a couple of words changed, different URL
+            for _ in range(2):
+                words[rng.randrange(len(words))] = rng.choice(FILLER)
+            same_url = rng.random() < 0.5
+            response["results"][i] = {
+                **source,
+                "url": source["url"] if same_url else f"https://mirror.example.net/{i}/{source['url'].rsplit('/', 2)[-2]}",
+                "content": " ".join(words),
+            }
+        responses.append(response)
+    return {"topic": topic, "subtopics": subtopics, "responses": responses}
+
+class _FakeSearchHandler(BaseHTTPRequestHandler):
+    # Keep-alive, like the real APIs
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+        time.sleep(self.server.latency)
+        body = json.dumps(fake_search_response(payload["query"], payload.get("max_results", 5))).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+class FakeSearchServer:
+    """Tavily-compatible HTTP search endpoint on localhost with artificial latency"""
+
+    def __init__(self, latency: float = 0.5, port: int = 0):
+        self.server = ThreadingHTTPServer(("127.0.0.1", port), _FakeSearchHandler)
+        self.server.latency = latency
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/search"
+
+    def __enter__(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+_ROUTES = {"search": "/search", "chat": "/chat/completions", "images": "/images/generations"}
+
+class _FakeAPIHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        path = self.path.split("?")[0]
+        kind = next((k for k, suffix in _ROUTES.items() if path.endswith(suffix)), None)
+        rejection = self.server.fake.admit(kind) if kind else None
+        if rejection:
+            self._reject(*rejection)
+        elif path.endswith("/search"):
+            self._respond(self.server.fake.search(payload))
+        elif path.endswith("/chat/completions"):
+            self._respond(self.server.fake.chat(payload))
+        elif path.endswith("/images/generations"):
+            self._respond(self.server.fake.images(payload, f"http://{self.headers['Host']}"))
+        else:
+            self.send_error(404)
+
+    def do_GET(self):
+        if not self.path.startswith("/files/"):
+            self.send_error(404)
+            return
+        body = self.server.fake.image_file()
+        self.send_response(200)
+        self.send_header("Content-Type", "image/png")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _reject(self, status: int, retry_after: float):
+        body = json.dumps({"error": {"code": str(status), "message": "Rate limit exceeded" if status == 429
+                                     else "Service unavailable"}}).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        if status == 429:
+            self.send_header("Retry-After", f"{retry_after:g}")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _respond(self, data):
+        body = json.dumps(data).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        try:
+            self.wfile.write(body)
+        except (BrokenPipeError, ConnectionResetError):
+            # The client gave up on the request, e.g. a hedged copy that lost
+            pass
+
+    def log_message(self, format, *args):
+        pass
+
+class FakeAPIServer:
+    """Local stand-in for Tavily search, (Azure) OpenAI chat completions and DALL-E.
+
+    Latencies are in seconds per call; payload sizes set the words per search
+    result and per completion and the generated image's side in pixels.
+    With ``rate_limit`` set, each endpoint admits that many requests per second
+    and answers the rest with 429 and a Retry-After of ``retry_after`` seconds;
+    ``error_rate`` is the share of requests failing with a 503.
+    ``environ()`` has the settings that point the pipeline's clients here.
+    """
+
+    def __init__(self, search_latency: float = 0.5, llm_latency: float = 1.0, image_latency: float = 2.0,
+                 result_words: int = 120, completion_words: int = 600, image_size: int = 1024, port: int = 0,
+                 rate_limit: float = None, retry_after: float = 1.0, error_rate: float = 0.0, seed: int = 0):
+        self.search_latency = search_latency
+        self.llm_latency = llm_latency
+        self.image_latency = image_latency
+        self.result_words = result_words
+        self.completion_words = completion_words
+        self.image_size = image_size
+        self.calls = {"search": 0, "chat": 0, "images": 0}
+        self.rejected = {"throttled": 0, "errors": 0}
+        self.rate_limit = rate_limit
+        self.retry_after = retry_after
+        self.error_rate = error_rate
+        self._rng = random.Random(seed)
+        self._buckets = {}
+        self._lock = threading.Lock()
+        self._image = None
+        self.server = ThreadingHTTPServer(("127.0.0.1", port), _FakeAPIHandler)
+        self.server.daemon_threads = True
+        self.server.fake = self
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    def environ(self) -> dict:
+        return {
+            "TAVILY_SEARCH_URL": f"{self.url}/search",
+            "TAVILY_API_KEY": "fake",
+            "AZURE_OPENAI_ENDPOINT": self.url,
+            "AZURE_OPENAI_KEY": "fake",
+            "AZURE_OPENAI_API_VERSION": "2024-08-01-preview",
+            "AZURE_OPENAI_DEPLOYMENT_NAME": "gpt-4o-mini",
+            "OPENAI_BASE_URL": f"{self.url}/v1",
+            "OPENAI_API_KEY_REGULAR": "fake",
+        }
+
+    def admit(self, kind: str):
+        """None to serve the request, or the (status, retry_after) to reject it with"""
+        with self._lock:
+            if self.error_rate and self._rng.random() < self.error_rate:
+                self.rejected["errors"] += 1
+                return 503, 0
+            if not self.rate_limit:
+                return None
+            # Token bucket per endpoint holding one second's worth of requests
+            now = time.monotonic()
+            tokens, updated = self._buckets.get(kind, (self.rate_limit, now))
+            tokens = min(self.rate_limit, tokens + (now - updated) * self.rate_limit)
+            if tokens < 1:
+                self._buckets[kind] = (tokens, now)
+                self.rejected["throttled"] += 1
+                return 429, self.retry_after
+            self._buckets[kind] = (tokens - 1, now)
+            return None
+
+    def _count(self, kind: str):
+        with self._lock:
+            self.calls[kind] += 1
+
+    def search(self, payload: dict) -> dict:
+        self._count("search")
+        time.sleep(self.search_latency)
+        return fake_search_response(payload["query"], payload.get("max_results", 5), self.result_words)
+
+    def chat(self, payload: dict) -> dict:
+        self._count("chat")
+        time.sleep(self.llm_latency)
+        prompt = "\n".join(str(m.get("content") or "") for m in payload.get("messages", []))
+        message = {"role": "assistant", "content": None}
+        if payload.get("tools"):
+            # Structured output: fill every field of the requested tool's schema
+            function = payload["tools"][0]["function"]
+            arguments = fake_arguments(function.get("parameters", {}), prompt)
+            message["tool_calls"] = [{"id": "call_0", "type": "function",
+                                      "function": {"name": function["name"], "arguments": json.dumps(arguments)}}]
+        elif (payload.get("response_format") or {}).get("type") == "json_object":
+            essay = prompt.rsplit("into sections:", 1)[-1]
+            message["content"] = json.dumps(fake_structure(essay))
+        else:
+            message["content"] = fake_text(prompt, self.completion_words)
+        completion_tokens = len((message["content"] or "").split()) + 20
+        return {
+            "id": "chatcmpl-fake", "object": "chat.completion", "created": int(time.time()),
+            "model": payload.get("model") or "fake",
+            "choices": [{"index": 0, "message": message,
+                         "finish_reason": "tool_calls" if message.get("tool_calls") else "stop"}],
+            "usage": {"prompt_tokens": len(prompt.split()), "completion_tokens": completion_tokens,
+                      "total_tokens": len(prompt.split()) + completion_tokens},
+        }
+
+    def images(self, payload: dict, base_url: str) -> dict:
+        self._count("images")
+        time.sleep(self.image_latency)
+        return {"created": int(time.time()),
+                "data": [{"url": f"{base_url}/files/illustration.png", "revised_prompt": payload.get("prompt")}]}
+
+    def image_file(self) -> bytes:
+        with self._lock:
+            if self._image is None:
+                self._image = png_bytes(self.image_size, self.image_size)
+            return self._image
+
+    def __enter__(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+def fake_text(seed: str, num_words: int, paragraph_words: int = 60) -> str:
+    """Deterministic filler prose in paragraphs of sentences"""
+    rng = random.Random(hashlib.sha256(seed.encode("utf-8")).hexdigest())
+    words = [rng.choice(FILLER) for _ in range(num_words)]
+    paragraphs = []
+    for start in range(0, num_words, paragraph_words):
+        chunk = words[start:start + paragraph_words]
+        sentences = [" ".join(chunk[i:i + 12]).capitalize() + "." for i in range(0, len(chunk), 12)]
+        paragraphs.append(" ".join(sentences))
+    return "\n\n".join(paragraphs)
+
+def fake_arguments(schema: dict, seed: str, name: str = "", defs: dict = None, items: int = 3):
+    """Value matching a JSON schema (as pydantic emits for tools), with filler strings"""
+    defs = schema.get("$defs", {}) if defs is None else defs
+    if "$ref" in schema:
+        return fake_arguments(defs[schema["$ref"].rsplit("/", 1)[-1]], seed, name, defs, items)
+    if "anyOf" in schema or "allOf" in schema:
+        return fake_arguments((schema.get("anyOf") or schema["allOf"])[0], seed, name, defs, items)
+    kind = schema.get("type", "object" if "properties" in schema else "string")
+    if kind == "object":
+        return {key: fake_arguments(value, seed + key, key, defs, items)
+                for key, value in schema.get("properties", {}).items()}
+    if kind == "array":
+        return [fake_arguments(schema.get("items", {}), f"{seed}{i}", name, defs, items) for i in range(items)]
+    if kind in ("integer", "number"):
+        return items
+    if kind == "boolean":
+        return True
+    return f"{name.replace('_', ' ')} {fake_text(seed, 5)}".rstrip(".")
+
+def fake_structure(essay: str, num_sections: int = 4, max_words: int = 150) -> dict:
+    """structure_essay-shaped sections cut from the essay text"""
+    words = essay.split("## References")[0].split()
+    per_section = max(1, -(-len(words) // num_sections))
+    sections = []
+    for i in range(0, len(words), per_section):
+        narration = " ".join(words[i:i + per_section][:max_words])
+        sections.append({"title": f"Part {len(sections) + 1}", "text": " ".join(narration.split()[:12]),
+                         "narration": narration})
+    return {"sections": sections}
+
+def png_bytes(width: int, height: int, seed: int = 0) -> bytes:
+    """RGB PNG with a simple gradient, built without an imaging library"""
+    red = bytes(x * 255 // max(1, width - 1) for x in range(width))
+    rows = []
+    for y in range(height):
+        row = bytearray(3 * width)
+        row[0::3] = red
+        row[1::3] = bytes([y * 255 // max(1, height - 1)]) * width
+        row[2::3] = bytes([seed % 256]) * width
+        rows.append(b"\x00" + bytes(row))
+
+    def chunk(kind, data):
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data) & 0xffffffff)
+
+    return (b"\x89PNG\r\n\x1a\n"
+            + chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0))
+            + chunk(b"IDAT", zlib.compress(b"".join(rows), 6))
+            + chunk(b"IEND", b""))
+
+def write_silent_wav(path, duration: float, sample_rate: int = 24000):
+    """Mono 16-bit WAV of silence with the given length in seconds"""
+    with wave.open(str(path), 'wb') as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(sample_rate)
+        f.writeframes(b"\x00\x00" * int(duration * sample_rate))
@@ -0,0 +1,19 @@
+# Same frame sizes and rates as manim's quality presets
+QUALITIES = {
+    "low_quality": (854, 480, 15),
+    "medium_quality": (1280, 720, 30),
+    "high_quality": (1920, 1080, 60),
+    "production_quality": (1920, 1080, 60),
+    "fourk_quality": (3840, 2160, 60),
+}
+
+# EssayVideo's layout in manim's frame units (the frame is 8 units tall)
+FRAME_UNITS = 8
+MARGIN = 0.8
+
+def illustration_size(image_size, width: int, height: int):
+    """Pixel size of the illustration on the left half of a width x height frame, as EssayVideo scales it"""
+    unit = height / FRAME_UNITS
+    scale = (width / 2 - MARGIN * unit) / image_size[0]
+    scale = min(scale, (height - MARGIN * unit) / image_size[1])
+    return max(1, int(image_size[0] * scale)), max(1, int(image_size[1] * scale))
@@ -0,0 +1,303 @@
+import asyncio
+import os
+import random
+import threading
+import time
+from collections import deque
+from email.utils import parsedate_to_datetime
+import httpx
+import openai
+from tracing import count, gauge
+
+# Per-service defaults; override any of them with GOVERNOR_<SERVICE>_<SETTING>, e.g. GOVERNOR_LLM_RATE=2
+# Hedging duplicates requests, so it is opt-in: e.g. GOVERNOR_SEARCH_HEDGE_AFTER=3 hedges searches slower than 3s
+SERVICE_DEFAULTS = {
+    "llm": {"rate": 5.0, "burst": 10, "max_concurrency": 8, "max_retries": 5, "hedge_after": None},
+    "images": {"rate": 0.5, "burst": 2, "max_concurrency": 2, "max_retries": 5, "hedge_after": None},
+    "search": {"rate": 5.0, "burst": 10, "max_concurrency": 8, "max_retries": 4, "hedge_after": None},
+    "tts": {"rate": 5.0, "burst": 5, "max_concurrency": 4, "max_retries": 5, "hedge_after": None},
+}
+DEFAULT_LIMITS = {"rate": 5.0, "burst": 5, "max_concurrency": 4, "max_retries": 3, "hedge_after": None}
+_INTEGER_SETTINGS = ("burst", "max_concurrency", "max_retries")
+_OPTIONAL_SETTINGS = ("hedge_after",)
+_POSITIVE_SETTINGS = ("rate", "hedge_after")
+_MINIMUMS = {"burst": 1, "max_concurrency": 1, "max_retries": 0}
+
+RETRY_STATUSES = {408, 409, 429, 500, 502, 503, 504}
+TRANSIENT_ERRORS = (httpx.TransportError, openai.APIConnectionError, ConnectionError, TimeoutError)
+BASE_BACKOFF = 0.5
+MAX_BACKOFF = 30.0
+# How often a caller waiting for a free slot looks again
+POLL_INTERVAL = 0.05
+# Latencies needed before hedging switches from hedge_after to the observed p95
+HEDGE_MIN_SAMPLES = 20
+
+def status_code(error):
+    """HTTP status behind an exception from httpx, requests or the OpenAI SDK, if any"""
+    status = getattr(error, "status_code", None)
+    if status is None:
+        status = getattr(getattr(error, "response", None), "status_code", None)
+    return status
+
+def retry_after(error):
+    """Seconds the server asked for in Retry-After-Ms or Retry-After, if it did"""
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    try:
+        if headers.get("retry-after-ms"):
+            return max(0.0, float(headers["retry-after-ms"]) / 1000)
+        value = headers.get("retry-after")
+        if value is None:
+            return None
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+def is_throttled(error) -> bool:
+    if status_code(error) == 429:
+        return True
+    # SDKs without a status (Azure speech) only say so in the message
+    message = str(error).lower()
+    return "429" in message or "too many requests" in message or "rate limit" in message
+
+def is_retryable(error) -> bool:
+    status = status_code(error)
+    if status is not None:
+        return status in RETRY_STATUSES
+    return is_throttled(error) or isinstance(error, TRANSIENT_ERRORS)
+
+class Governor:
+    """Rate and concurrency limits for one external service, with retries and hedged requests.
+
+    A token bucket caps the request rate. The concurrency limit grows by one call
+    per limit's worth of successes and halves on every 429, and a Retry-After
+    pauses all callers of the service. Failed calls are retried with full-jitter
+    exponential backoff. Async calls can be hedged: a second copy starts if the
+    first is slower than the service's p95 (or ``hedge_after`` until enough
+    calls were seen), and the first to finish wins. Limits are shared by
+    threads and event loops alike.
+    """
+
+    def __init__(self, service: str, rate: float, burst: int, max_concurrency: int, min_concurrency: int = 1,
+                 max_retries: int = 3, hedge_after: float = None, base_backoff: float = BASE_BACKOFF):
+        self.service = service
+        self.rate = rate
+        self.burst = burst
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min_concurrency
+        self.max_retries = max_retries
+        self.hedge_after = hedge_after
+        self.base_backoff = base_backoff
+        self.limit = float(max_concurrency)
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.in_flight = 0
+        self.waiting = 0
+        self.latencies = deque(maxlen=200)
+        self._lock = threading.Lock()
+
+    def _try_acquire(self) -> float:
+        """Take a slot and a token, or return how long to wait before trying again"""
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if now < self.paused_until:
+                return self.paused_until - now
+            if self.in_flight >= int(self.limit):
+                return POLL_INTERVAL
+            if self.tokens < 1:
+                return (1 - self.tokens) / self.rate
+            self.tokens -= 1
+            self.in_flight += 1
+            return 0.0
+
+    def _queue(self, delta: int):
+        with self._lock:
+            self.waiting += delta
+            waiting = self.waiting
+        gauge("governor_queue_depth", waiting, service=self.service)
+
+    def _waited(self, seconds: float):
+        count("governor_wait_seconds", seconds, service=self.service)
+        count("governor_acquired", service=self.service)
+
+    def acquire(self):
+        start = time.monotonic()
+        delay = self._try_acquire()
+        if delay:
+            self._queue(1)
+            try:
+                while delay:
+                    time.sleep(delay)
+                    delay = self._try_acquire()
+            finally:
+                self._queue(-1)
+        self._waited(time.monotonic() - start)
+
+    async def aacquire(self):
+        start = time.monotonic()
+        delay = self._try_acquire()
+        if delay:
+            self._queue(1)
+            try:
+                while delay:
+                    await asyncio.sleep(delay)
+                    delay = self._try_acquire()
+            finally:
+                self._queue(-1)
+        self._waited(time.monotonic() - start)
+
+    def _finish(self, started: float, error: BaseException = None):
+        """Free the slot and adapt the concurrency limit to how the call went"""
+        with self._lock:
+            self.in_flight -= 1
+            if error is None:
+                self.limit = min(self.max_concurrency, self.limit + 1 / self.limit)
+                self.latencies.append(time.monotonic() - started)
+            elif isinstance(error, Exception) and is_throttled(error):
+                self.limit = max(self.min_concurrency, self.limit / 2)
+                # Spend the burst too, so callers resume at the steady rate
+                self.tokens = min(self.tokens, 0.0)
+                pause = retry_after(error)
+                if pause:
+                    self.paused_until = max(self.paused_until, time.monotonic() + pause)
+            limit, in_flight = self.limit, self.in_flight
+        gauge("governor_concurrency_limit", limit, service=self.service)
+        gauge("governor_in_flight", in_flight, service=self.service)
+
+    def _backoff(self, attempt: int, error: Exception) -> float:
+        count("governor_retries", service=self.service, reason="throttled" if is_throttled(error) else "error")
+        jitter = random.uniform(0, min(MAX_BACKOFF, self.base_backoff * 2 ** attempt))
+        return max(retry_after(error) or 0.0, jitter)
+
+    def _give_up(self, attempt: int, error: Exception) -> bool:
+        if attempt < self.max_retries and is_retryable(error):
+            return False
+        count("governor_calls", service=self.service, outcome="failed")
+        return True
+
+    def call(self, fn, *args, **kwargs):
+        """fn(*args, **kwargs) within the service's limits, retried on throttling and transient errors"""
+        for attempt in range(self.max_retries + 1):
+            self.acquire()
+            started = time.monotonic()
+            try:
+                result = fn(*args, **kwargs)
+            except Exception as e:
+                self._finish(started, e)
+                if self._give_up(attempt, e):
+                    raise
+                time.sleep(self._backoff(attempt, e))
+                continue
+            except BaseException as e:
+                self._finish(started, e)
+                raise
+            self._finish(started)
+            count("governor_calls", service=self.service, outcome="ok")
+            return result
+
+    async def _attempt(self, fn, args, kwargs, running: asyncio.Event = None):
+        await self.aacquire()
+        if running:
+            running.set()
+        started = time.monotonic()
+        try:
+            result = await fn(*args, **kwargs)
+        except BaseException as e:
+            self._finish(started, e)
+            raise
+        self._finish(started)
+        return result
+
+    def hedge_delay(self):
+        """Seconds after which a slow async call gets a second copy, or None for no hedging"""
+        if self.hedge_after is None:
+            return None
+        with self._lock:
+            latencies = sorted(self.latencies)
+        if len(latencies) < HEDGE_MIN_SAMPLES:
+            return self.hedge_after
+        return latencies[int(len(latencies) * 0.95)]
+
+    async def _hedged(self, fn, args, kwargs):
+        delay = self.hedge_delay()
+        if delay is None:
+            return await self._attempt(fn, args, kwargs)
+        running = asyncio.Event()
+        first = asyncio.ensure_future(self._attempt(fn, args, kwargs, running))
+        # Time spent queueing for a slot doesn't count towards the hedge delay
+        waiter = asyncio.ensure_future(running.wait())
+        await asyncio.wait({first, waiter}, return_when=asyncio.FIRST_COMPLETED)
+        waiter.cancel()
+        done, _ = await asyncio.wait({first}, timeout=delay)
+        # A second copy would only add load while other calls are queued or the service is throttling
+        if done or self.waiting or self.paused_until > time.monotonic():
+            return await first
+
+        count("governor_hedges", service=self.service)
+        tasks = {first, asyncio.ensure_future(self._attempt(fn, args, kwargs))}
+        try:
+            while tasks:
+                done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+            # Both copies failed: report the last error
+            return task.result()
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def acall(self, fn, *args, **kwargs):
+        """await fn(*args, **kwargs) within the service's limits, retried and optionally hedged"""
+        for attempt in range(self.max_retries + 1):
+            try:
+                result = await self._hedged(fn, args, kwargs)
+            except Exception as e:
+                if self._give_up(attempt, e):
+                    raise
+                await asyncio.sleep(self._backoff(attempt, e))
+                continue
+            count("governor_calls", service=self.service, outcome="ok")
+            return result
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"service": self.service, "limit": self.limit, "in_flight": self.in_flight,
+                    "waiting": self.waiting, "tokens": self.tokens}
+
+def service_limits(service: str) -> dict:
+    """Defaults for the service, overridden by GOVERNOR_<SERVICE>_<SETTING> environment variables"""
+    limits = dict(SERVICE_DEFAULTS.get(service, DEFAULT_LIMITS))
+    for name in limits:
+        variable = f"GOVERNOR_{service.upper()}_{name.upper()}"
+        value = os.getenv(variable)
+        if value is None:
+            continue
+        # Only hedging can be switched off; a service without a rate or slot limit has no governor
+        if name in _OPTIONAL_SETTINGS and value.lower() in ("", "none", "off"):
+            limits[name] = None
+            continue
+        try:
+            limits[name] = int(float(value)) if name in _INTEGER_SETTINGS else float(value)
+        except ValueError:
+            raise ValueError(f"{variable} must be a number, got '{value}'") from None
+        if name in _POSITIVE_SETTINGS and limits[name] <= 0:
+            raise ValueError(f"{variable} must be above 0, got '{value}'")
+        if limits[name] < _MINIMUMS.get(name, 0):
+            raise ValueError(f"{variable} must be at least {_MINIMUMS[name]}, got '{value}'")
+    return limits
+
+_governors = {}
+_governors_lock = threading.Lock()
+
+def get_governor(service: str) -> Governor:
+    """The process-wide governor of an external service"""
+    with _governors_lock:
+        if service not in _governors:
+            _governors[service] = Governor(service, **service_limits(service))
+        return _governors[service]
@@ -0,0 +1,198 @@
+import json
+import multiprocessing
+import os
+import sqlite3
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+from artifact_store import ArtifactStore
+from tracing import flush_metrics
+
+JOBS_DIR = Path(os.getenv("JOBS_DIR", "jobs")).resolve()
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", 2))
+# "auto" lets the render planner trade quality for time as the queue grows; or a fixed manim quality
+JOB_QUALITY = os.getenv("JOB_QUALITY", "auto")
+
+class JobStore:
+    """Job state and progress persisted in SQLite, shared by the UI and worker processes"""
+
+    def __init__(self, db_path):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        with self._connect() as db:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("""CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY, topic TEXT, status TEXT, progress TEXT DEFAULT '',
+                work_dir TEXT, result TEXT, error TEXT,
+                created_at REAL, started_at REAL, finished_at REAL)""")
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def create(self, topic: str, work_dir: Path) -> str:
+        job_id = uuid.uuid4().hex[:12]
+        with self._connect() as db:
+            db.execute("INSERT INTO jobs (id, topic, status, work_dir, created_at) VALUES (?, ?, 'queued', ?, ?)",
+                       (job_id, topic, str(work_dir / job_id), time.time()))
+        return job_id
+
+    def get(self, job_id: str) -> dict:
+        with self._connect() as db:
+            row = db.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = dict(row)
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        return job
+
+    def list(self, limit: int = 20) -> list:
+        with self._connect() as db:
+            rows = db.execute("SELECT id FROM jobs ORDER BY created_at DESC LIMIT ?", (limit,)).fetchall()
+        return [self.get(row["id"]) for row in rows]
+
+    def unfinished(self) -> list:
+        with self._connect() as db:
+            rows = db.execute("SELECT id FROM jobs WHERE status IN ('queued', 'running') ORDER BY created_at").fetchall()
+        return [self.get(row["id"]) for row in rows]
+
+    def queued(self) -> int:
+        """Jobs waiting for a worker"""
+        with self._connect() as db:
+            return db.execute("SELECT COUNT(*) FROM jobs WHERE status = 'queued'").fetchone()[0]
+
+    def start(self, job_id: str):
+        with self._connect() as db:
+            db.execute("UPDATE jobs SET status = 'running', started_at = ? WHERE id = ?", (time.time(), job_id))
+
+    def append_progress(self, job_id: str, message: str):
+        with self._connect() as db:
+            db.execute("UPDATE jobs SET progress = progress || ? WHERE id = ?", (f"{message}\n", job_id))
+
+    def finish(self, job_id: str, result: dict):
+        with self._connect() as db:
+            db.execute("UPDATE jobs SET status = 'done', result = ?, finished_at = ? WHERE id = ?",
+                       (json.dumps(result), time.time(), job_id))
+
+    def requeue(self, job_id: str):
+        with self._connect() as db:
+            db.execute("""UPDATE jobs SET status = 'queued', error = NULL, finished_at = NULL,
+                          progress = progress || ? WHERE id = ?""", ("🔁 Retrying from checkpoints\n", job_id))
+
+    def fail(self, job_id: str, error: str):
+        with self._connect() as db:
+            db.execute("UPDATE jobs SET status = 'failed', error = ?, finished_at = ? WHERE id = ?",
+                       (error, time.time(), job_id))
+
+def _run_job(db_path: str, job_id: str, render_workers: int):
+    """Run one topic in its own working directory (executes in a worker process)"""
+    store = JobStore(db_path)
+    job = store.get(job_id)
+    work_dir = Path(job["work_dir"])
+    work_dir.mkdir(parents=True, exist_ok=True)
+    # Manim, manim-slides and the pipeline write relative paths; keep them inside the job
+    os.chdir(work_dir)
+    store.start(job_id)
+    try:
+        from pipeline import run_topic_pipeline
+        paths = run_topic_pipeline(
+            job["topic"],
+            work_dir / "publication",
+            update_status=lambda message: store.append_progress(job_id, message),
+            render_workers=render_workers,
+            quality=JOB_QUALITY,
+            queue_depth=store.queued,
+            # Fresh jobs have no checkpoints; retried ones skip the stages that already finished
+            resume=True
+        )
+        try:
+            # Later submissions of the same (or a near-duplicate) topic are answered from the store
+            ArtifactStore(Path(db_path).parent / "artifacts").put(job["topic"], paths)
+        except (OSError, sqlite3.Error) as e:
+            store.append_progress(job_id, f"⚠️ Could not store artifacts: {str(e)}")
+        store.append_progress(job_id, "✨ All processing complete!")
+        store.finish(job_id, {name: str(path) for name, path in paths.items()})
+    except Exception as e:
+        store.append_progress(job_id, f"⚠️ {str(e)}")
+        store.fail(job_id, traceback.format_exc())
+    finally:
+        # Workers are reused across jobs; hand this job's metrics to the shared store
+        flush_metrics()
+
+class JobQueue:
+    """Runs topic jobs on a pool of worker processes, each job in its own directory"""
+
+    def __init__(self, jobs_dir=JOBS_DIR, workers: int = JOB_WORKERS):
+        self.jobs_dir = Path(jobs_dir)
+        self.store = JobStore(self.jobs_dir / "jobs.db")
+        # Below jobs_dir, so the media server serves stored artifacts as well
+        self.artifacts = ArtifactStore(self.jobs_dir / "artifacts")
+        self.artifacts.evict()
+        # Split the cores between concurrent jobs so parallel section renders don't oversubscribe
+        self.render_workers = max(1, (os.cpu_count() or 1) // workers)
+        self.workers = workers
+        self._pool_lock = threading.Lock()
+        self.pool = self._new_pool()
+        # Jobs left over from a previous server process start again from the queue
+        for job in self.store.unfinished():
+            if job["status"] == "running":
+                self.store.requeue(job["id"])
+            self._dispatch(job["id"])
+
+    def _new_pool(self) -> ProcessPoolExecutor:
+        return ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"))
+
+    def _replace_pool(self, broken: ProcessPoolExecutor):
+        """Swap a pool whose worker died (e.g. OOM in a render) for a fresh one, once"""
+        with self._pool_lock:
+            if self.pool is broken:
+                print("⚠️ A job worker died; restarting the worker pool")
+                self.pool = self._new_pool()
+                broken.shutdown(wait=False, cancel_futures=True)
+
+    def _dispatch(self, job_id: str):
+        pool = self.pool
+        try:
+            future = pool.submit(_run_job, str(self.store.db_path), job_id, self.render_workers)
+        except BrokenProcessPool:
+            self._replace_pool(pool)
+            pool = self.pool
+            future = pool.submit(_run_job, str(self.store.db_path), job_id, self.render_workers)
+        future.add_done_callback(lambda f: self._on_done(job_id, pool, f))
+
+    def _on_done(self, job_id: str, pool: ProcessPoolExecutor, future):
+        # _run_job records its own failures; an exception here means the worker process itself died
+        error = None if future.cancelled() else future.exception()
+        if error is None and not future.cancelled():
+            return
+        if isinstance(error, BrokenProcessPool) or future.cancelled():
+            self._replace_pool(pool)
+        job = self.store.get(job_id)
+        if job["status"] == "queued":
+            # Never started: it only shared the broken pool, so it runs on the new one
+            self._dispatch(job_id)
+        elif job["status"] == "running":
+            reason = "".join(traceback.format_exception(error)) if error else "Job worker was stopped"
+            self.store.append_progress(job_id, "⚠️ The job's worker process died")
+            self.store.fail(job_id, reason)
+
+    def submit(self, topic: str) -> str:
+        job_id = self.store.create(topic, self.jobs_dir)
+        self._dispatch(job_id)
+        return job_id
+
+    def retry(self, job_id: str):
+        """Run a failed job again in the same directory, resuming from its checkpoints"""
+        self.store.requeue(job_id)
+        self._dispatch(job_id)
+
+    def status(self, job_id: str) -> dict:
+        return self.store.get(job_id)
+
+    def recent(self, limit: int = 20) -> list:
+        return self.store.list(limit)
@@ -0,0 +1,93 @@
+import os
+from cache import CACHE_ROOT, DiskCache, make_key
+from governor import get_governor
+from tracing import span, record_usage
+
+# Set LLM_CACHE=0 for runs that should get fresh, non-deterministic completions
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE", "1") != "0"
+
+llm_cache = DiskCache(
+    CACHE_ROOT / "llm",
+    ttl=float(os.getenv("LLM_CACHE_TTL", 30 * 24 * 3600)),
+    max_bytes=int(os.getenv("LLM_CACHE_MAX_BYTES", 512 * 1024 * 1024))
+)
+
+def _llm_settings(llm) -> dict:
+    """Settings of a llama-index LLM that change its output"""
+    return {
+        "model": getattr(llm, "model", None),
+        "engine": getattr(llm, "engine", None),
+        "temperature": getattr(llm, "temperature", None),
+        "max_tokens": getattr(llm, "max_tokens", None),
+    }
+
+def _usage(response):
+    """Token usage reported with a llama-index response, if any"""
+    raw = getattr(response, "raw", None)
+    if raw is None:
+        return None
+    return raw.get("usage") if isinstance(raw, dict) else getattr(raw, "usage", None)
+
+def _lookup(key: str, use_cache: bool):
+    if not (use_cache and LLM_CACHE_ENABLED):
+        return None
+    data = llm_cache.get(key)
+    return data.decode("utf-8") if data is not None else None
+
+def _store(key: str, text: str, use_cache: bool) -> str:
+    if use_cache and LLM_CACHE_ENABLED:
+        llm_cache.set(key, text.encode("utf-8"))
+    return text
+
+def cached_complete(llm, prompt: str, use_cache: bool = True) -> str:
+    """llm.complete(prompt) as text, memoized on the model settings and prompt"""
+    key = make_key("complete", _llm_settings(llm), prompt)
+    text = _lookup(key, use_cache)
+    if text is None:
+        with span("llm.complete", model=getattr(llm, "model", None)):
+            response = get_governor("llm").call(llm.complete, prompt)
+        record_usage(_usage(response), getattr(llm, "model", None))
+        text = _store(key, str(response), use_cache)
+    return text
+
+async def cached_acomplete(llm, prompt: str, use_cache: bool = True) -> str:
+    """await llm.acomplete(prompt) as text, memoized on the model settings and prompt"""
+    key = make_key("complete", _llm_settings(llm), prompt)
+    text = _lookup(key, use_cache)
+    if text is None:
+        with span("llm.complete", model=getattr(llm, "model", None)):
+            response = await get_governor("llm").acall(llm.acomplete, prompt)
+        record_usage(_usage(response), getattr(llm, "model", None))
+        text = _store(key, str(response), use_cache)
+    return text
+
+def cached_chat(llm, messages, use_cache: bool = True) -> str:
+    """Message content of llm.chat(messages); works for structured LLMs too"""
+    output_cls = getattr(llm, "output_cls", None)
+    settings = _llm_settings(getattr(llm, "llm", llm))
+    key = make_key(
+        "chat",
+        settings,
+        getattr(output_cls, "__name__", None),
+        # A changed output model must not be served replies shaped for the old one
+        output_cls.model_json_schema() if output_cls is not None else None,
+        [(str(message.role), message.content) for message in messages]
+    )
+    text = _lookup(key, use_cache)
+    if text is None:
+        with span("llm.chat", model=settings["model"]):
+            response = get_governor("llm").call(llm.chat, messages)
+        record_usage(_usage(response), settings["model"])
+        text = _store(key, response.message.content, use_cache)
+    return text
+
+def cached_chat_completion(client, use_cache: bool = True, **request) -> str:
+    """Message content of client.chat.completions.create(**request) for an OpenAI client"""
+    key = make_key("chat.completions", request)
+    text = _lookup(key, use_cache)
+    if text is None:
+        with span("llm.chat_completion", model=request.get("model")):
+            response = get_governor("llm").call(client.chat.completions.create, **request)
+        record_usage(response.usage, request.get("model"))
+        text = _store(key, response.choices[0].message.content, use_cache)
+    return text
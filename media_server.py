@@ -0,0 +1,115 @@
+import ipaddress
+import mimetypes
+import os
+import re
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import quote, unquote, urlsplit, parse_qs
+
+# Local only by default; set MEDIA_HOST=0.0.0.0 (or front it with a proxy) to serve other machines
+MEDIA_HOST = os.getenv("MEDIA_HOST", "127.0.0.1")
+# 0 picks a free port, so it never takes the 8502+ ports Streamlit falls back to
+MEDIA_PORT = int(os.getenv("MEDIA_PORT", 0))
+# Address viewers' browsers use to reach the server; required unless it only listens on loopback
+MEDIA_BASE_URL = os.getenv("MEDIA_BASE_URL")
+
+_RANGE = re.compile(r"bytes=(\d*)-(\d*)$")
+# Only finished artifacts are served: never job databases, checkpoints, voiceovers or traces
+MEDIA_SUFFIXES = {".mp4", ".png", ".jpg", ".md"}
+
+def is_published(relative: Path) -> bool:
+    """Whether a path below the jobs root is a published artifact: <job>/publication/<file> or a stored blob"""
+    parts = relative.parts
+    return relative.suffix.lower() in MEDIA_SUFFIXES and (
+        (len(parts) == 3 and parts[1] == "publication")
+        or (len(parts) == 4 and parts[:2] == ("artifacts", "blobs")))
+
+def is_loopback(host: str) -> bool:
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return host == "localhost"
+
+class MediaHandler(BaseHTTPRequestHandler):
+    """Serves published artifacts below the server root straight from disk, with HTTP Range support"""
+
+    def do_HEAD(self):
+        self._serve(send_body=False)
+
+    def do_GET(self):
+        self._serve(send_body=True)
+
+    def _resolve(self):
+        url = urlsplit(self.path)
+        path = (self.server.root / unquote(url.path).lstrip("/")).resolve()
+        if (not path.is_relative_to(self.server.root) or not path.is_file()
+                or not is_published(path.relative_to(self.server.root))):
+            return None, url
+        return path, url
+
+    def _serve(self, send_body: bool):
+        path, url = self._resolve()
+        if path is None:
+            self.send_error(404)
+            return
+
+        size = path.stat().st_size
+        start, end = 0, size - 1
+        status = 200
+        match = _RANGE.match(self.headers.get("Range", "").strip())
+        if match and (match.group(1) or match.group(2)):
+            if match.group(1):
+                start = int(match.group(1))
+                end = min(int(match.group(2)), size - 1) if match.group(2) else size - 1
+            else:
+                # Suffix range: the last N bytes
+                start = max(0, size - int(match.group(2)))
+            if start > end or start >= size:
+                self.send_response(416)
+                self.send_header("Content-Range", f"bytes */{size}")
+                self.end_headers()
+                return
+            status = 206
+
+        self.send_response(status)
+        self.send_header("Content-Type", mimetypes.guess_type(path.name)[0] or "application/octet-stream")
+        self.send_header("Accept-Ranges", "bytes")
+        self.send_header("Content-Length", str(end - start + 1))
+        if status == 206:
+            self.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+        if "download" in parse_qs(url.query):
+            self.send_header("Content-Disposition", f"attachment; filename=\"{path.name}\"")
+        self.end_headers()
+
+        if send_body:
+            with open(path, 'rb') as f:
+                try:
+                    # sendfile copies in the kernel; the file is never held in memory
+                    self.connection.sendfile(f, offset=start, count=end - start + 1)
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+
+    def log_message(self, format, *args):
+        pass
+
+class MediaServer:
+    """Background HTTP server for finished artifacts below ``root``"""
+
+    def __init__(self, root, host: str = MEDIA_HOST, port: int = MEDIA_PORT, base_url: str = MEDIA_BASE_URL):
+        # A localhost URL would point other machines' browsers at themselves
+        if not base_url and not is_loopback(host):
+            raise ValueError(f"MEDIA_BASE_URL must be set when the media server listens on {host}")
+        self.server = ThreadingHTTPServer((host, port), MediaHandler)
+        self.server.daemon_threads = True
+        self.server.root = Path(root).resolve()
+        self.base_url = (base_url or f"http://localhost:{self.server.server_address[1]}").rstrip("/")
+        threading.Thread(target=self.server.serve_forever, name="media-server", daemon=True).start()
+
+    def url_for(self, path, download: bool = False) -> str:
+        relative = Path(path).resolve().relative_to(self.server.root)
+        return f"{self.base_url}/{quote(relative.as_posix())}" + ("?download=1" if download else "")
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
@@ -0,0 +1,357 @@
+import asyncio
+import contextvars
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import Executor, ThreadPoolExecutor, wait, FIRST_COMPLETED
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, List, Tuple
+from cache import make_key
+from clients import run_coroutine
+from test_research_workflow import research_topic, RESEARCH_MODE, RESEARCH_DEFAULTS
+from test_illustrator import generate_illustration
+from test_research_to_slides import structure_essay
+from test_video import render_essay_video, synthesize_voiceovers, make_speech_service
+from draft_renderer import render_draft_video
+from render_planner import RenderPlanner, RENDER_DEADLINE, RENDER_MAX_QUALITY, plan_label
+from tts import MANIFEST_NAME, load_voiceovers
+from tracing import tracer, span, count, run_tracer
+
+# "draft" renders with Pillow+ffmpeg for previews and high-volume runs, "manim" is the full scene
+RENDER_BACKENDS = {"manim": render_essay_video, "draft": render_draft_video}
+RENDER_BACKEND = os.getenv("RENDER_BACKEND", "manim")
+
+class Stage:
+    """One node of the pipeline graph.
+
+    ``fn`` receives the dict of results produced so far (at least those of its
+    dependencies) and returns this stage's result. Stages with ``inputs`` are
+    checkpointed: ``inputs(results)`` describes everything the stage depends on,
+    ``outputs`` are the files it writes and ``load()`` rebuilds its result from them.
+    """
+
+    def __init__(self, name: str, fn: Callable[[dict], object], deps: List[str] = (),
+                 start_message: str = None, done_message: str = None,
+                 inputs: Callable[[dict], object] = None, outputs: List[Path] = (),
+                 load: Callable[[], object] = None):
+        self.name = name
+        self.fn = fn
+        self.deps = list(deps)
+        self.start_message = start_message
+        self.done_message = done_message
+        self.inputs = inputs
+        self.outputs = list(outputs)
+        self.load = load
+
+def file_digest(path) -> str:
+    """sha256 of a file or, for a directory, of all files in it"""
+    path = Path(path)
+    if not path.exists():
+        return None
+    digest = hashlib.sha256()
+    files = sorted(p for p in path.rglob("*") if p.is_file()) if path.is_dir() else [path]
+    for file in files:
+        digest.update(str(file.relative_to(path) if path.is_dir() else file.name).encode("utf-8"))
+        with open(file, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                digest.update(chunk)
+    return digest.hexdigest()
+
+class Checkpoints:
+    """Manifest of finished stages with the hash of the inputs each one ran on"""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.stages = json.loads(self.path.read_text()) if self.path.exists() else {}
+
+    def is_fresh(self, stage: Stage, input_hash: str) -> bool:
+        entry = self.stages.get(stage.name)
+        return (entry is not None and entry["input_hash"] == input_hash
+                and all(Path(output).exists() for output in stage.outputs))
+
+    def record(self, stage: Stage, input_hash: str):
+        self.stages[stage.name] = {
+            "input_hash": input_hash,
+            "outputs": [str(output) for output in stage.outputs],
+            "finished_at": time.time(),
+        }
+        tmp_path = self.path.with_suffix(".tmp")
+        tmp_path.write_text(json.dumps(self.stages, indent=2))
+        os.replace(tmp_path, self.path)
+
+def _run_traced(stage: Stage, results: dict):
+    with span(f"stage.{stage.name}"):
+        return stage.fn(results)
+
+def _check_deps(stages: List[Stage]):
+    by_name = {stage.name: stage for stage in stages}
+    for stage in stages:
+        missing = [dep for dep in stage.deps if dep not in by_name]
+        if missing:
+            raise ValueError(f"Stage '{stage.name}' depends on unknown stages: {missing}")
+
+def _start(stage: Stage, results: dict, input_hashes: dict, checkpoints: Checkpoints, resume: bool,
+           update_status: Callable[[str], None]) -> bool:
+    """Restore the stage from its checkpoint if it is fresh; whether it still has to run"""
+    if checkpoints and stage.inputs:
+        input_hashes[stage.name] = make_key(stage.name, stage.inputs(results))
+        if resume and stage.load and checkpoints.is_fresh(stage, input_hashes[stage.name]):
+            results[stage.name] = stage.load()
+            update_status(f"⏭ {stage.name} unchanged, reusing checkpoint")
+            return False
+    if stage.start_message:
+        update_status(stage.start_message)
+    return True
+
+def _finish(stage: Stage, result, results: dict, input_hashes: dict, checkpoints: Checkpoints,
+            update_status: Callable[[str], None]):
+    results[stage.name] = result
+    if stage.name in input_hashes:
+        checkpoints.record(stage, input_hashes[stage.name])
+    message = stage.done_message(result) if callable(stage.done_message) else stage.done_message
+    if message:
+        update_status(message)
+
+def _raise_if_stuck(pending: List[Stage], results: dict):
+    # Stages restored from checkpoints may have unblocked others
+    if not any(all(dep in results for dep in s.deps) for s in pending):
+        raise ValueError(f"Dependency cycle between stages: {[s.name for s in pending]}")
+
+def run_stages(stages: List[Stage], update_status: Callable[[str], None] = print,
+               max_workers: int = 4, checkpoints: Checkpoints = None,
+               resume: bool = False) -> Dict[str, object]:
+    """Run stages as soon as their dependencies finish, independent ones concurrently.
+
+    With ``checkpoints``, every finished stage is recorded; with ``resume`` as well,
+    stages whose inputs are unchanged since their checkpoint are loaded, not rerun.
+    Status updates are sent from the calling thread only, which keeps them safe
+    for Streamlit elements.
+    """
+    _check_deps(stages)
+    results = {}
+    input_hashes = {}
+    pending = list(stages)
+    running = {}
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        while pending or running:
+            for stage in [s for s in pending if all(dep in results for dep in s.deps)]:
+                pending.remove(stage)
+                if _start(stage, results, input_hashes, checkpoints, resume, update_status):
+                    # Each stage runs in a copy of this context so its span nests under the caller's
+                    running[executor.submit(contextvars.copy_context().run, _run_traced, stage, dict(results))] = stage
+
+            if not running:
+                _raise_if_stuck(pending, results)
+                continue
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                stage = running.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    update_status(f"⚠️ Error during {stage.name}: {str(e)}")
+                    for other in running:
+                        other.cancel()
+                    raise
+                _finish(stage, result, results, input_hashes, checkpoints, update_status)
+    return results
+
+async def run_stage_in_thread(stage: Stage, results: dict):
+    """Run a stage in a worker thread of the event loop, traced like run_stages does"""
+    return await asyncio.to_thread(_run_traced, stage, results)
+
+async def run_stages_async(stages: List[Stage], update_status: Callable[[str], None] = print,
+                           checkpoints: Checkpoints = None, resume: bool = False,
+                           run_stage: Callable[[Stage, dict], Awaitable] = run_stage_in_thread) -> Dict[str, object]:
+    """run_stages as a coroutine: stages are tasks on the running event loop.
+
+    ``run_stage(stage, results)`` runs one stage, by default in a worker thread; a
+    wrapper can wait for a slot first without tying up a thread meanwhile.
+    """
+    _check_deps(stages)
+    results = {}
+    input_hashes = {}
+    pending = list(stages)
+    running = {}
+    while pending or running:
+        for stage in [s for s in pending if all(dep in results for dep in s.deps)]:
+            pending.remove(stage)
+            if _start(stage, results, input_hashes, checkpoints, resume, update_status):
+                running[asyncio.ensure_future(run_stage(stage, dict(results)))] = stage
+
+        if not running:
+            _raise_if_stuck(pending, results)
+            continue
+
+        done, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            stage = running.pop(task)
+            try:
+                result = task.result()
+            except Exception as e:
+                update_status(f"⚠️ Error during {stage.name}: {str(e)}")
+                for other in running:
+                    other.cancel()
+                await asyncio.gather(*running, return_exceptions=True)
+                raise
+            _finish(stage, result, results, input_hashes, checkpoints, update_status)
+    return results
+
+def topic_slug(topic: str) -> str:
+    """File name stem of a topic's artifacts"""
+    return topic.replace(' ', '_').lower()
+
+def artifact_paths(topic: str, output_dir: Path) -> Dict[str, Path]:
+    """Where each artifact of a topic is written"""
+    slug = topic_slug(topic)
+    return {
+        "essay": output_dir / f"{slug}_essay.md",
+        "illustration": output_dir / f"{slug}_illustration.jpg",
+        "render_image": output_dir / f"{slug}_illustration_render.png",
+        "structure": output_dir / f"{slug}_structured_content.json",
+        "voiceovers": output_dir / f"{slug}_voiceovers",
+        "video": output_dir / f"{slug}_video.mp4",
+        "manifest": output_dir / f"{slug}_manifest.json",
+        "trace": output_dir / f"{slug}_trace.json",
+    }
+
+def render_image(paths: Dict[str, Path]) -> Path:
+    """Illustration pre-sized for the render, or the original if there is none"""
+    return paths["render_image"] if paths["render_image"].exists() else paths["illustration"]
+
+def render_video(job) -> int:
+    """Render a topic's video; returns how many sections came from the render cache.
+
+    Module-level so it can run in a render process as well as in-process.
+    """
+    backend, structured_content, image_path, video_path, render_workers, voiceover_dir, settings = job
+    reused = tracer.counters.get(("sections_reused", ()), 0)
+    RENDER_BACKENDS[backend](structured_content, image_path, video_path, max_workers=render_workers,
+                             voiceover_dir=voiceover_dir, **settings)
+    return tracer.counters.get(("sections_reused", ()), 0) - reused
+
+def topic_stages(topic: str, output_dir: Path, quality: str = "medium_quality", render_workers: int = None,
+                 speech_service_factory=make_speech_service, backend: str = RENDER_BACKEND,
+                 render_deadline: float = RENDER_DEADLINE, queue_depth: Callable[[], int] = None,
+                 render_pool: Executor = None) -> Tuple[List[Stage], Dict[str, Path]]:
+    """The stages that turn a topic into a video, and the paths of their artifacts.
+
+    With ``quality="auto"`` the render planner picks resolution, frame rate and
+    encoder preset to finish within ``render_deadline``, shared with the
+    ``queue_depth()`` jobs waiting behind this one. With ``render_pool`` the
+    render runs there instead of in the stage's thread.
+    """
+    if backend not in RENDER_BACKENDS:
+        raise ValueError(f"Unknown render backend '{backend}', expected one of {list(RENDER_BACKENDS)}")
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    paths = artifact_paths(topic, output_dir)
+    # Planned renders never exceed the planner's ceiling, so the illustration is sized for it
+    image_quality = RENDER_MAX_QUALITY if quality == "auto" else quality
+
+    def research(results):
+        essay = run_coroutine(research_topic(topic))
+        paths["essay"].write_text(str(essay), encoding='utf-8')
+        return str(essay)
+
+    def illustrate(results):
+        return generate_illustration(results["research"], str(paths["illustration"]),
+                                     render_path=str(paths["render_image"]), quality=image_quality)
+
+    def structure(results):
+        structured_content = structure_essay(results["research"])
+        with open(paths["structure"], 'w', encoding='utf-8') as f:
+            json.dump(structured_content, f, indent=2)
+        return structured_content
+
+    def voiceover(results):
+        return synthesize_voiceovers(results["structure"], str(paths["voiceovers"]),
+                                     service_factory=speech_service_factory)
+
+    def render(results):
+        settings, plan, planner = {"quality": quality}, None, None
+        if quality == "auto":
+            planner = RenderPlanner()
+            plan = planner.plan(results["structure"], deadline=render_deadline,
+                                queue_depth=queue_depth() if queue_depth else 0, voiceovers=results["voiceover"],
+                                workers=render_workers, backend=backend)
+            settings = {"quality": plan["quality"], "frame_rate": plan["frame_rate"], "preset": plan["preset"]}
+        job = (backend, results["structure"], str(render_image(paths)), str(paths["video"]),
+               render_workers, str(paths["voiceovers"]), settings)
+        try:
+            start = time.perf_counter()
+            reused = render_pool.submit(render_video, job).result() if render_pool else render_video(job)
+            if plan is None:
+                return "✅ Video generation complete"
+            # Sections from the render cache would make the render look faster than the model predicts
+            if not reused:
+                planner.record(plan, time.perf_counter() - start)
+            else:
+                count("render_plans_unrecorded", reason="sections_reused")
+            return f"✅ Video generation complete ({plan_label(plan)})"
+        except Exception:
+            # Check if video was actually generated despite the error
+            if paths["video"].exists():
+                return "✅ Video generated successfully despite some non-critical errors"
+            raise
+
+    stages = [
+        Stage("research", research,
+              start_message=f"🔍 Starting research on topic: {topic}",
+              done_message="✅ Research complete\n📝 Essay generated and saved",
+              # The essay depends on how it was researched, not just on the topic
+              inputs=lambda results: [topic, RESEARCH_MODE, RESEARCH_DEFAULTS],
+              outputs=[paths["essay"]],
+              load=lambda: paths["essay"].read_text(encoding='utf-8')),
+        Stage("illustration", illustrate, deps=["research"],
+              start_message="🎨 Creating illustration...",
+              done_message=lambda ok: "✅ Illustration created successfully" if ok else "⚠️ Using default illustration",
+              inputs=lambda results: [results["research"], quality],
+              outputs=[paths["illustration"], paths["render_image"]],
+              load=lambda: True),
+        Stage("structure", structure, deps=["research"],
+              start_message="📏 Structuring content into presentation format...",
+              done_message="✅ Content structure complete",
+              inputs=lambda results: results["research"],
+              outputs=[paths["structure"]],
+              load=lambda: json.loads(paths["structure"].read_text(encoding='utf-8'))),
+        Stage("voiceover", voiceover, deps=["structure"],
+              start_message="🎙 Synthesizing narration...",
+              done_message="✅ Narration ready",
+              inputs=lambda results: results["structure"],
+              outputs=[paths["voiceovers"] / MANIFEST_NAME],
+              load=lambda: load_voiceovers(paths["voiceovers"])),
+        Stage("render", render, deps=["illustration", "structure", "voiceover"],
+              start_message="🎞 Generating video presentation...",
+              done_message=lambda message: message,
+              inputs=lambda results: [results["structure"], file_digest(paths["illustration"]),
+                                      results["voiceover"], quality, backend],
+              outputs=[paths["video"]],
+              load=lambda: "✅ Video generation complete"),
+    ]
+    return stages, paths
+
+def run_topic_pipeline(topic: str, output_dir: Path, update_status: Callable[[str], None] = print,
+                       quality: str = "medium_quality", render_workers: int = None,
+                       resume: bool = False, speech_service_factory=make_speech_service,
+                       backend: str = RENDER_BACKEND, render_deadline: float = RENDER_DEADLINE,
+                       queue_depth: Callable[[], int] = None) -> Dict[str, Path]:
+    """Research, illustrate, structure, voice and render a topic into a video.
+
+    Every stage is checkpointed in the topic's manifest; with ``resume`` a retry
+    only reruns the stages whose inputs changed (e.g. just a failed render).
+    The spans and counters of the run are written to the topic's trace file.
+    """
+    stages, paths = topic_stages(topic, output_dir, quality=quality, render_workers=render_workers,
+                                 speech_service_factory=speech_service_factory, backend=backend,
+                                 render_deadline=render_deadline, queue_depth=queue_depth)
+    # Concurrent runs in one process each write only their own spans
+    with run_tracer() as run:
+        try:
+            with span("pipeline", topic=topic):
+                run_stages(stages, update_status, checkpoints=Checkpoints(paths["manifest"]), resume=resume)
+        finally:
+            run.write_trace(paths["trace"])
+    return paths
@@ -0,0 +1,158 @@
+import hashlib
+import os
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from manim import config
+from manim.mobject.text import text_mobject
+from cache import CACHE_ROOT, DiskCache, make_key, link_or_copy
+from tracing import count
+
+# Set RENDER_CACHE=0 to render every animation from scratch, as manim does with flush_cache
+RENDER_CACHE_ENABLED = os.getenv("RENDER_CACHE", "1") != "0"
+
+# Partial movies and finished section videos, shared by every job; least recently used go first
+render_cache = DiskCache(
+    CACHE_ROOT / "render",
+    max_bytes=int(os.getenv("RENDER_CACHE_MAX_BYTES", 4 * 1024 * 1024 * 1024))
+)
+
+# Manim hashes mobjects together with their file paths, so Text SVGs and images
+# need the same absolute path in every job for partial movies to be reusable
+TEXT_DIR = CACHE_ROOT / "manim_texts"
+ASSET_DIR = CACHE_ROOT / "render_assets"
+FILE_CACHE_MAX_BYTES = int(os.getenv("RENDER_FILE_CACHE_MAX_BYTES", 512 * 1024 * 1024))
+# Files touched more recently than this are never pruned: a running render may still read them
+PRUNE_MIN_AGE = 3600
+
+def _touch(path):
+    """Mark a shared file as just used, so prune_files keeps it"""
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+
+def _publish(source, target: Path):
+    """Atomically place a copy of source at target, leaving an existing target alone; either way it was used now"""
+    if not target.exists():
+        target.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = target.with_name(f"{target.name}.{os.getpid()}.tmp")
+        link_or_copy(source, tmp_path)
+        os.replace(tmp_path, target)
+    # A link keeps the source's mtime, however old
+    _touch(target)
+
+def file_digest(path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def shared_asset(path) -> Path:
+    """Content-addressed copy of an image, so equal illustrations give equal animation hashes"""
+    path = Path(path)
+    target = ASSET_DIR / f"{file_digest(path)}{path.suffix}"
+    _publish(path, target)
+    return target
+
+def _atomic_text2svg(text2svg):
+    # Pango writes the SVG in place; concurrent renders must never see it half written
+    def write(settings, size, line_spacing, disable_liga, file_name, *args):
+        tmp_path = f"{file_name}.{os.getpid()}.tmp"
+        text2svg(settings, size, line_spacing, disable_liga, tmp_path, *args)
+        os.replace(tmp_path, file_name)
+        return file_name
+    return write
+
+def _touching_text2svg(method):
+    # Text returns an SVG that already exists without writing it again
+    def text2svg(self, *args, **kwargs):
+        svg_file = method(self, *args, **kwargs)
+        _touch(svg_file)
+        return svg_file
+    return text2svg
+
+_text_dir_lock = threading.Lock()
+_text_dir_users = 0
+_saved_text_settings = None
+
+@contextmanager
+def shared_text_dir():
+    """While rendering with the cache, keep manim's Text SVGs in the shared directory.
+
+    New SVGs are written atomically and reused ones touched; manim's own
+    text directory and functions are restored when the last user leaves.
+    """
+    global _text_dir_users, _saved_text_settings
+    if not RENDER_CACHE_ENABLED:
+        yield
+        return
+    with _text_dir_lock:
+        if _text_dir_users == 0:
+            TEXT_DIR.mkdir(parents=True, exist_ok=True)
+            _saved_text_settings = (config.text_dir, text_mobject.manimpango.text2svg, text_mobject.Text._text2svg)
+            config.text_dir = str(TEXT_DIR)
+            text_mobject.manimpango.text2svg = _atomic_text2svg(_saved_text_settings[1])
+            text_mobject.Text._text2svg = _touching_text2svg(_saved_text_settings[2])
+        _text_dir_users += 1
+    try:
+        yield
+    finally:
+        with _text_dir_lock:
+            _text_dir_users -= 1
+            if _text_dir_users == 0:
+                config.text_dir, text_mobject.manimpango.text2svg, text_mobject.Text._text2svg = _saved_text_settings
+
+def prune_files(max_bytes: int = FILE_CACHE_MAX_BYTES):
+    """Delete the least recently used text SVGs and assets beyond the size bound"""
+    files = []
+    for directory in (TEXT_DIR, ASSET_DIR):
+        if directory.is_dir():
+            for path in directory.iterdir():
+                if path.suffix != ".tmp":
+                    stat = path.stat()
+                    # Every reuse touches the file, so this holds even on noatime mounts
+                    files.append((max(stat.st_atime, stat.st_mtime), stat.st_size, path))
+    total = sum(size for _, size, _ in files)
+    cutoff = time.time() - PRUNE_MIN_AGE
+    for used_at, size, path in sorted(files):
+        if total <= max_bytes or used_at > cutoff:
+            break
+        path.unlink(missing_ok=True)
+        total -= size
+        count("render_cache_evictions", kind="file")
+
+def _partial_key(animation_hash: str) -> str:
+    # The hash covers camera settings (resolution, frame rate) already
+    return make_key("partial", animation_hash, config.movie_file_extension)
+
+def hydrate_partial(file_writer, animation_hash: str) -> bool:
+    """Link a cached partial movie into the scene's partial movie directory; whether it is there now"""
+    if not RENDER_CACHE_ENABLED or not hasattr(file_writer, "partial_movie_directory"):
+        return False
+    target = Path(file_writer.partial_movie_directory) / f"{animation_hash}{config.movie_file_extension}"
+    if target.exists():
+        return True
+    cached = render_cache.get_path(_partial_key(animation_hash))
+    if cached is None:
+        return False
+    try:
+        link_or_copy(cached, target)
+    except FileNotFoundError:
+        # Evicted by another process since the lookup: render it
+        return False
+    count("partial_movies_reused")
+    return True
+
+def publish_partials(file_writer):
+    """Add the scene's newly rendered partial movies to the shared cache"""
+    if not RENDER_CACHE_ENABLED:
+        return
+    for path in file_writer.partial_movie_files:
+        if path is None or not Path(path).exists():
+            continue
+        key = _partial_key(Path(path).stem)
+        if not render_cache.contains(key):
+            render_cache.set_file(key, path)
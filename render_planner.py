@@ -0,0 +1,150 @@
+import os
+import sqlite3
+import statistics
+import time
+from pathlib import Path
+from typing import List
+from cache import CACHE_ROOT
+from draft_renderer import TITLE_SECONDS_PER_CHAR, HOLD_SECONDS, READING_CHARS_PER_SECOND
+from essay_structure import EssayStructure
+from frame_geometry import QUALITIES
+from tracing import count, gauge
+
+# Best first; the planner takes the first plan predicted to meet the deadline, else the last one
+RENDER_PLANS = [
+    {"quality": "high_quality", "frame_rate": 60, "preset": "medium"},
+    {"quality": "high_quality", "frame_rate": 30, "preset": "fast"},
+    {"quality": "medium_quality", "frame_rate": 30, "preset": "veryfast"},
+    {"quality": "medium_quality", "frame_rate": 24, "preset": "veryfast"},
+    {"quality": "low_quality", "frame_rate": 15, "preset": "ultrafast"},
+]
+# Jobs never render above this quality, however much time there is
+RENDER_MAX_QUALITY = os.getenv("RENDER_MAX_QUALITY", "medium_quality")
+# Seconds a job's render should take when nothing else is queued
+RENDER_DEADLINE = float(os.getenv("RENDER_DEADLINE", 600))
+PLANNER_DB = Path(os.getenv("RENDER_PLANNER_DB", CACHE_ROOT / "render_plans.db")).resolve()
+
+# Seconds per section, per animated frame and per held frame (frames per megapixel) before anything was measured
+DEFAULT_COSTS = {"manim": (4.0, 0.05, 0.002), "draft": (0.3, 0.004, 0.002)}
+# x264 time of a preset relative to "fast"; it matters for held frames, which are mostly encoding
+PRESET_COSTS = {"ultrafast": 0.5, "superfast": 0.6, "veryfast": 0.7, "faster": 0.85, "fast": 1.0, "medium": 1.2}
+# Measured renders the correction of a prediction is based on
+HISTORY_SIZE = 30
+MIN_SAMPLES = 3
+
+def section_timeline(sections_data: EssayStructure, voiceovers: List[dict] = None) -> List[dict]:
+    """Animated (typing) and held seconds of every section, timed as both render backends time them"""
+    timeline = []
+    for i, sec in enumerate(sections_data["sections"]):
+        text = sec["narration"].strip()
+        narration = voiceovers[i]["duration"] if voiceovers else len(text) / READING_CHARS_PER_SECOND
+        # The paragraph is typed over the whole narration, then the slide holds briefly
+        timeline.append({"animated": len(sec["title"]) * TITLE_SECONDS_PER_CHAR + narration,
+                         "held": HOLD_SECONDS})
+    return timeline
+
+def plan_label(plan: dict) -> str:
+    _, height, _ = QUALITIES[plan["quality"]]
+    return f"{height}p{plan['frame_rate']} {plan['preset']}"
+
+class RenderPlanner:
+    """Predicts render time from an essay's structure and picks the best plan that meets a deadline.
+
+    A section costs a fixed setup time plus a time per frame that grows with
+    the frame's pixels; typed frames are rasterized, held frames mostly just
+    encoded. Sections render in parallel on ``workers`` processes. Every
+    measured render is stored, and predictions are scaled by the median ratio
+    of actual to modelled time of recent renders on this host, per backend
+    and quality once there are enough of them.
+    """
+
+    def __init__(self, db_path=PLANNER_DB):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        with self._connect() as db:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("""CREATE TABLE IF NOT EXISTS renders (
+                backend TEXT, quality TEXT, frame_rate REAL, preset TEXT, sections INTEGER, workers INTEGER,
+                predicted REAL, model REAL, actual REAL, recorded_at REAL)""")
+
+    def _connect(self):
+        return sqlite3.connect(self.db_path, timeout=30)
+
+    def _history(self, backend: str, quality: str = None) -> List[tuple]:
+        query = "SELECT predicted, model, actual FROM renders WHERE backend = ?"
+        params = [backend]
+        if quality:
+            query += " AND quality = ?"
+            params.append(quality)
+        with self._connect() as db:
+            return db.execute(query + " ORDER BY recorded_at DESC LIMIT ?", (*params, HISTORY_SIZE)).fetchall()
+
+    def correction(self, backend: str, quality: str) -> float:
+        """Median ratio of actual to modelled time of recent renders, the same quality's if there are enough"""
+        for history in (self._history(backend, quality), self._history(backend)):
+            if len(history) >= MIN_SAMPLES:
+                return statistics.median(actual / model for _, model, actual in history)
+        return 1.0
+
+    def model_estimate(self, timeline: List[dict], plan: dict, workers: int, backend: str = "manim") -> float:
+        """Uncorrected wall seconds of rendering the sections with the plan"""
+        width, height, _ = QUALITIES[plan["quality"]]
+        megapixels = width * height / 1e6
+        setup, animated_cost, held_cost = DEFAULT_COSTS[backend]
+        held_cost *= PRESET_COSTS.get(plan["preset"], 1.0)
+        sections = [setup + plan["frame_rate"] * megapixels * (s["animated"] * animated_cost + s["held"] * held_cost)
+                    for s in timeline]
+        if backend != "manim":
+            # The draft backend renders every section in one process
+            return sum(sections)
+        # Sections are spread over the workers; the longest one bounds the wall time
+        return max(max(sections, default=0.0), sum(sections) / max(1, min(workers, len(sections))))
+
+    def estimate(self, sections_data: EssayStructure, plan: dict, voiceovers: List[dict] = None,
+                 workers: int = None, backend: str = "manim") -> float:
+        """Predicted wall seconds of the render, corrected by how past predictions turned out"""
+        timeline = section_timeline(sections_data, voiceovers)
+        predicted = self.model_estimate(timeline, plan, workers or os.cpu_count() or 1, backend)
+        return predicted * self.correction(backend, plan["quality"])
+
+    def plan(self, sections_data: EssayStructure, deadline: float = RENDER_DEADLINE, queue_depth: int = 0,
+             voiceovers: List[dict] = None, workers: int = None, backend: str = "manim",
+             max_quality: str = RENDER_MAX_QUALITY) -> dict:
+        """Best plan predicted to render within the deadline, shared with the jobs waiting behind this one"""
+        # Every queued job waits for this render too, so a longer queue leaves each render less time
+        budget = deadline / (1 + queue_depth)
+        max_pixels = QUALITIES[max_quality][0] * QUALITIES[max_quality][1]
+        candidates = [plan for plan in RENDER_PLANS
+                      if QUALITIES[plan["quality"]][0] * QUALITIES[plan["quality"]][1] <= max_pixels]
+        workers = workers or os.cpu_count() or 1
+        timeline = section_timeline(sections_data, voiceovers)
+        for plan in candidates:
+            model = self.model_estimate(timeline, plan, workers, backend)
+            predicted = model * self.correction(backend, plan["quality"])
+            if predicted <= budget or plan is candidates[-1]:
+                break
+        print(f"Render plan: {plan_label(plan)}, predicted {predicted:.0f}s of a {budget:.0f}s budget "
+              f"({queue_depth} queued)")
+        count("render_plans", quality=plan["quality"], frame_rate=plan["frame_rate"])
+        return {**plan, "predicted_seconds": predicted, "model_seconds": model, "backend": backend,
+                "sections": len(timeline), "workers": workers}
+
+    def record(self, plan: dict, actual_seconds: float):
+        """Store how long a planned render really took"""
+        with self._connect() as db:
+            db.execute("INSERT INTO renders VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                       (plan["backend"], plan["quality"], plan["frame_rate"], plan["preset"], plan["sections"],
+                        plan["workers"], plan["predicted_seconds"], plan["model_seconds"], actual_seconds, time.time()))
+        error = actual_seconds / plan["predicted_seconds"] - 1 if plan["predicted_seconds"] else 0.0
+        print(f"Render took {actual_seconds:.0f}s, predicted {plan['predicted_seconds']:.0f}s ({error:+.0%})")
+        gauge("render_prediction_error", error, backend=plan["backend"])
+
+    def accuracy(self, backend: str = "manim") -> dict:
+        """How far off recent predictions were, relative to the actual render times"""
+        history = self._history(backend)
+        if not history:
+            return {"renders": 0}
+        return {"renders": len(history),
+                "mean_abs_error": statistics.mean(abs(actual - predicted) / actual for predicted, _, actual in history),
+                "model_mean_abs_error": statistics.mean(abs(actual - model) / actual for _, model, actual in history),
+                "correction": self.correction(backend, None)}
@@ -0,0 +1,68 @@
+import asyncio
+import os
+from cache import CACHE_ROOT, DiskCache, make_key
+from clients import get_async_client, get_tavily
+from governor import get_governor
+from tracing import span, count
+
+TAVILY_SEARCH_URL = os.getenv("TAVILY_SEARCH_URL", "https://api.tavily.com/search")
+
+# Same defaults as TavilyClient.search, so sync and async calls share cache entries
+DEFAULT_SEARCH_PARAMS = {"search_depth": "basic", "max_results": 5}
+
+# Search results are reused for a week by default; topics rarely change faster than that
+search_cache = DiskCache(
+    CACHE_ROOT / "search",
+    ttl=float(os.getenv("SEARCH_CACHE_TTL", 7 * 24 * 3600)),
+    max_bytes=int(os.getenv("SEARCH_CACHE_MAX_BYTES", 256 * 1024 * 1024))
+)
+
+def normalize_query(query: str) -> str:
+    """Case- and whitespace-insensitive form of a search query"""
+    return " ".join(query.lower().split())
+
+def _search_params(params: dict) -> dict:
+    """Parameters actually sent to Tavily, which both paths key their cache entries by"""
+    return {**DEFAULT_SEARCH_PARAMS, **params}
+
+def _cache_key(query: str, params: dict) -> str:
+    return make_key("tavily", normalize_query(query), params)
+
+def cached_search(query: str, client=None, cache: DiskCache = search_cache, **params) -> dict:
+    """Tavily search that serves repeated queries from the on-disk cache"""
+    params = _search_params(params)
+    key = _cache_key(query, params)
+    response = cache.get_json(key) if cache else None
+    if response is not None:
+        return response
+
+    client = client or get_tavily()
+    with span("search", query=query):
+        response = get_governor("search").call(client.search, query, **params)
+    if cache:
+        cache.set_json(key, response)
+    return response
+
+async def async_search(query: str, cache: DiskCache = search_cache, **params) -> dict:
+    """Non-blocking Tavily search over the pooled client, served from cache when possible"""
+    params = _search_params(params)
+    key = _cache_key(query, params)
+    # The cache is SQLite and disk I/O, so it runs off the event loop
+    response = await asyncio.to_thread(cache.get_json, key) if cache else None
+    if response is not None:
+        return response
+
+    payload = {"api_key": os.getenv("TAVILY_API_KEY"), "query": query, **params}
+
+    async def post():
+        http_response = await get_async_client().post(TAVILY_SEARCH_URL, json=payload)
+        http_response.raise_for_status()
+        return http_response
+
+    with span("search", query=query):
+        http_response = await get_governor("search").acall(post)
+    count("bytes_downloaded", len(http_response.content), source="search")
+    response = http_response.json()
+    if cache:
+        await asyncio.to_thread(cache.set_json, key, response)
+    return response
@@ -0,0 +1,151 @@
+import hashlib
+import math
+import os
+import re
+from collections import Counter
+from typing import List, Tuple
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+from llama_index.core.utils import get_tokenizer
+
+# Token budget for the source materials that go into the write_story prompt
+SOURCE_TOKEN_BUDGET = int(os.getenv("SOURCE_TOKEN_BUDGET", 6000))
+
+SHINGLE_SIZE = 5
+NUM_PERMUTATIONS = 64
+DUPLICATE_THRESHOLD = 0.6
+PASSAGE_WORDS = 120
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_PERMUTATIONS = [
+    (int.from_bytes(hashlib.sha256(f"a{i}".encode()).digest()[:8], "big") % _MERSENNE_PRIME | 1,
+     int.from_bytes(hashlib.sha256(f"b{i}".encode()).digest()[:8], "big") % _MERSENNE_PRIME)
+    for i in range(NUM_PERMUTATIONS)
+]
+_WORD = re.compile(r"\w+")
+_REFERENCES_HEADING = re.compile(r"^#+\s*(references|sources|bibliography)\s*$", re.IGNORECASE | re.MULTILINE)
+_STOPWORDS = set("a an and are as at be by for from has have in is it its of on or that the to was were will with".split())
+
+def count_tokens(text: str) -> int:
+    return len(get_tokenizer()(text))
+
+def strip_references(essay: str) -> str:
+    """Essay text without the references section research_topic appends"""
+    match = _REFERENCES_HEADING.search(essay)
+    return essay[:match.start()].rstrip() if match else essay
+
+def normalize_url(url: str) -> str:
+    """URL without fragment, tracking parameters, default ports or trailing slash"""
+    parts = urlsplit(url.strip())
+    query = urlencode([(k, v) for k, v in parse_qsl(parts.query) if not k.lower().startswith("utm_")])
+    netloc = parts.netloc.lower().removeprefix("www.").removesuffix(":80").removesuffix(":443")
+    return urlunsplit((parts.scheme.lower(), netloc, parts.path.rstrip("/"), query, ""))
+
+def unique_urls(urls: List[str]) -> List[str]:
+    """First occurrence of every distinct URL, in order"""
+    seen, unique = set(), []
+    for url in urls:
+        key = normalize_url(url)
+        if key not in seen:
+            seen.add(key)
+            unique.append(url)
+    return unique
+
+def split_passages(text: str, max_words: int = PASSAGE_WORDS) -> List[str]:
+    """Split result content into passages of whole sentences, about max_words long"""
+    sentences = re.split(r"(?<=[.!?])\s+", " ".join(text.split()))
+    passages, current = [], []
+    for sentence in sentences:
+        current.append(sentence)
+        if sum(len(s.split()) for s in current) >= max_words:
+            passages.append(" ".join(current))
+            current = []
+    if current:
+        passages.append(" ".join(current))
+    return [p for p in passages if p]
+
+def minhash(text: str) -> Tuple[int, ...]:
+    """MinHash signature over word shingles"""
+    words = _WORD.findall(text.lower())
+    shingles = {" ".join(words[i:i + SHINGLE_SIZE]) for i in range(max(1, len(words) - SHINGLE_SIZE + 1))}
+    hashes = [int.from_bytes(hashlib.blake2b(s.encode(), digest_size=8).digest(), "big") for s in shingles]
+    return tuple(min((a * h + b) % _MERSENNE_PRIME for h in hashes) for a, b in _PERMUTATIONS)
+
+def similarity(sig_a: Tuple[int, ...], sig_b: Tuple[int, ...]) -> float:
+    """Estimated Jaccard similarity of two MinHash signatures"""
+    return sum(a == b for a, b in zip(sig_a, sig_b)) / len(sig_a)
+
+def novel_passages(results: List[dict], signatures: List[Tuple[int, ...]]) -> List[str]:
+    """Passages of search results unlike any seen before; their signatures are added to ``signatures``"""
+    novel = []
+    for result in results:
+        for text in split_passages(result.get("content", "")):
+            signature = minhash(text)
+            if any(similarity(signature, other) >= DUPLICATE_THRESHOLD for other in signatures):
+                continue
+            signatures.append(signature)
+            novel.append(text)
+    return novel
+
+def _terms(text: str) -> List[str]:
+    return [w for w in _WORD.findall(text.lower()) if w not in _STOPWORDS]
+
+def rank_passages(passages: List[dict], query: str) -> List[dict]:
+    """Order passages by BM25 relevance to the query, blended with the search engine's score"""
+    query_terms = set(_terms(query))
+    docs = [Counter(_terms(p["text"])) for p in passages]
+    avg_len = sum(sum(d.values()) for d in docs) / max(1, len(docs))
+    doc_freq = Counter(term for d in docs for term in d)
+    k1, b = 1.5, 0.75
+
+    for passage, doc in zip(passages, docs):
+        length = sum(doc.values())
+        bm25 = 0.0
+        for term in query_terms & doc.keys():
+            idf = math.log(1 + (len(docs) - doc_freq[term] + 0.5) / (doc_freq[term] + 0.5))
+            bm25 += idf * doc[term] * (k1 + 1) / (doc[term] + k1 * (1 - b + b * length / max(1, avg_len)))
+        passage["relevance"] = bm25 * (0.5 + passage.get("score", 0.5))
+    return sorted(passages, key=lambda p: p["relevance"], reverse=True)
+
+def pack_sources(results: List[dict], query: str, token_budget: int = SOURCE_TOKEN_BUDGET) -> Tuple[str, dict]:
+    """Deduplicate search results and pack the most relevant passages into a token budget.
+
+    Returns the packed source text and statistics about what was dropped.
+    """
+    # Exact URL duplicates across searches are dropped before any text work
+    seen_urls, passages, duplicate_urls = set(), [], 0
+    for result in results:
+        url = normalize_url(result.get("url", ""))
+        if url and url in seen_urls:
+            duplicate_urls += 1
+            continue
+        seen_urls.add(url)
+        for text in split_passages(result.get("content", "")):
+            passages.append({"text": text, "url": result.get("url"), "score": result.get("score", 0.5)})
+
+    kept, signatures = [], []
+    for passage in rank_passages(passages, query):
+        signature = minhash(passage["text"])
+        if any(similarity(signature, other) >= DUPLICATE_THRESHOLD for other in signatures):
+            continue
+        signatures.append(signature)
+        kept.append(passage)
+
+    packed, used_tokens = [], 0
+    for passage in kept:
+        tokens = count_tokens(passage["text"])
+        if used_tokens + tokens > token_budget:
+            continue
+        packed.append(passage["text"])
+        used_tokens += tokens
+
+    raw_tokens = count_tokens("\n".join(result.get("content", "") for result in results))
+    stats = {
+        "results": len(results),
+        "duplicate_urls": duplicate_urls,
+        "passages": len(passages),
+        "near_duplicates": len(passages) - len(kept),
+        "packed_passages": len(packed),
+        "raw_tokens": raw_tokens,
+        "packed_tokens": used_tokens,
+    }
+    return "\n".join(packed), stats
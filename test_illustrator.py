@@ -1,9 +1,17 @@
 import os
-from llama_index.llms.azure_openai import AzureOpenAI 
+import shutil
+import tempfile
+from pathlib import Path
 from llama_index.llms.openai import OpenAI
-from openai import OpenAI as oai
-import requests
+from PIL import Image
 from dotenv import load_dotenv
+from cache import CACHE_ROOT, DiskCache, make_key
+from frame_geometry import QUALITIES, illustration_size
+from governor import get_governor
+from llm_cache import cached_acomplete
+from clients import get_async_client, get_llm, get_openai, run_coroutine
+from sources import strip_references
+from tracing import span, count, traced
 
 
 load_dotenv()
@@ -13,49 +21,92 @@ os.environ["OPENAI_API_KEY"] = os.getenv("AZURE_OPENAI_KEY")
 os.environ["AZURE_OPENAI_ENDPOINT"] = os.getenv("AZURE_OPENAI_ENDPOINT")
 os.environ["OPENAI_API_VERSION"] = os.getenv("AZURE_OPENAI_API_VERSION")
 
-def download_image(url, save_path):
-    """Download an image from a URL and save it to disk"""
-    response = requests.get(url)
-    if response.status_code == 200:
-        with open(save_path, 'wb') as file:
-            file.write(response.content)
-        print('Illustration successfully downloaded and saved')
-        return True
-    else:
-        print('Failed to download illustration')
-        return False
-
-def generate_illustration(story_text, output_path="story_illustration.jpg"):
-    """Generate an illustration for a given story text using DALL-E"""
-    # First, generate the prompt using GPT-4
-    llm = AzureOpenAI(
-        engine="gpt-4o-mini",
-        model="gpt-4o-mini",
-        temperature=0.7
-    )
+# Generated images are kept by prompt: the same prompt is never paid for twice
+image_cache = DiskCache(
+    CACHE_ROOT / "images",
+    max_bytes=int(os.getenv("IMAGE_CACHE_MAX_BYTES", 512 * 1024 * 1024))
+)
+
+IMAGE_SETTINGS = {"model": "dall-e-3", "size": "1024x1024", "quality": "standard"}
+
+async def download_image(url, save_path):
+    """Stream an image to disk over the pooled HTTP client"""
+    save_path = Path(save_path)
+    part_path = save_path.with_name(save_path.name + ".part")
+    with span("illustration.download"):
+        async with get_async_client().stream("GET", url) as response:
+            if response.status_code != 200:
+                print('Failed to download illustration')
+                return False
+            with open(part_path, 'wb') as file:
+                async for chunk in response.aiter_bytes(1 << 16):
+                    file.write(chunk)
+                    count("bytes_downloaded", len(chunk), source="illustration")
+    os.replace(part_path, save_path)
+    print('Illustration successfully downloaded and saved')
+    return True
+
+def prepare_render_image(image_path, output_path, quality: str):
+    """Illustration resized to exactly the pixels it covers in a video of the given quality"""
+    width, height, _ = QUALITIES[quality]
+    with Image.open(image_path) as image:
+        image = image.convert("RGB")
+        size = illustration_size(image.size, width, height)
+        if image.size != size:
+            image = image.resize(size, Image.LANCZOS)
+        image.save(output_path, format="PNG")
+    return output_path
+
+@traced("illustration")
+async def async_generate_illustration(story_text, output_path="story_illustration.jpg",
+                                      render_path=None, quality="medium_quality"):
+    """Generate an illustration for a given story text using DALL-E, served from cache when possible.
+
+    With ``render_path``, also writes a copy pre-sized for rendering at ``quality``.
+    """
+    # First, generate the prompt using GPT-4; the references add nothing to it
+    llm = get_llm("gpt-4o-mini", temperature=0.7)
     
-    prompt_response = llm.complete(f'''You are a veteran illustration artist for long form articles. 
-                                   Here is an article: {story_text}. Think of concept for an anime style illustration for this article 
+    draw_prompt = await cached_acomplete(llm, f'''You are a veteran illustration artist for long form articles. 
+                                   Here is an article: {strip_references(story_text)}. Think of concept for an anime style illustration for this article 
                                    and write a prompt for DALL-E-3 to draw it. Your prompt:''')
     
-    draw_prompt = str(prompt_response)
     print(f"Generated prompt: {draw_prompt}")
-    
-    # Generate the image using DALL-E
-    client = oai(api_key=os.getenv("OPENAI_API_KEY_REGULAR"))
-    response = client.images.generate(
-        model="dall-e-3",
-        prompt=draw_prompt,
-        size="1024x1024",
-        quality="standard",
-        n=1
-    )
-
-    image_url = response.data[0].url
-    print(f"Generated image URL: {image_url}")
-    
-    # Download and save the image
-    return download_image(image_url, output_path)
+
+    key = make_key(IMAGE_SETTINGS, draw_prompt)
+    cached_path = image_cache.get_path(key)
+    if cached_path is not None:
+        try:
+            shutil.copyfile(cached_path, output_path)
+            print("Using cached illustration")
+        except FileNotFoundError:
+            # Evicted by another process since the lookup
+            cached_path = None
+    if cached_path is None:
+        # Generate the image using DALL-E, over the same pooled connections as the download
+        client = get_openai()
+        with span("illustration.generate", model=IMAGE_SETTINGS["model"]):
+            response = await get_governor("images").acall(client.images.generate, prompt=draw_prompt, n=1, **IMAGE_SETTINGS)
+        count("images_generated", model=IMAGE_SETTINGS["model"])
+
+        image_url = response.data[0].url
+        print(f"Generated image URL: {image_url}")
+
+        # Download and save the image
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            download_path = Path(tmp_dir) / "illustration"
+            if not await download_image(image_url, download_path):
+                return False
+            image_cache.set_file(key, download_path)
+            shutil.copyfile(download_path, output_path)
+
+    if render_path:
+        prepare_render_image(output_path, render_path, quality)
+    return True
+
+def generate_illustration(story_text, output_path="story_illustration.jpg", render_path=None, quality="medium_quality"):
+    """Blocking async_generate_illustration, run on the shared background event loop"""
+    return run_coroutine(async_generate_illustration(story_text, output_path, render_path, quality))
 
 def main():
     
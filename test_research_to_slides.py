@@ -1,21 +1,23 @@
 import os
-from openai import AzureOpenAI
 from dotenv import load_dotenv
 import json
+from concurrent.futures import ThreadPoolExecutor
+from clients import get_azure_openai
+from essay_structure import (EssayStructure, MAX_SECTIONS, validate_structure, split_at_headings,
+                             has_body, group_chunks, section_quotas, merge_sections)
+from llm_cache import cached_chat_completion
+from sources import strip_references
+from tracing import span, traced
 
 # Load environment variables
 load_dotenv()
 
-# Configure Azure OpenAI
-client = AzureOpenAI(
-    api_key=os.getenv("AZURE_OPENAI_KEY"),
-    api_version=os.getenv("AZURE_OPENAI_API_VERSION"),
-    azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT")
-)
+# "chunked" structures heading-delimited parts of the essay concurrently, "single" sends it in one call;
+# "auto" chunks essays longer than STRUCTURE_CHUNK_WORDS
+STRUCTURE_MODE = os.getenv("STRUCTURE_MODE", "auto")
+STRUCTURE_CHUNK_WORDS = int(os.getenv("STRUCTURE_CHUNK_WORDS", 1200))
 
-def structure_essay(essay_content: str) -> dict:
-    """Structure the essay into sections using Azure OpenAI."""
-    system_prompt = """
+SYSTEM_PROMPT = """
     Your task is to analyze the essay and structure it into logical sections. For each section:
     1. Create an appropriate title that reflects the section's content
     2. Provide a concise version of the content suitable for presentation slides
@@ -24,31 +26,63 @@ def structure_essay(essay_content: str) -> dict:
     Organize the sections in a way that best presents the essay's flow and main arguments.
     The number of sections should be determined by the natural structure of the content.
     The title should be no longer than 3 words.
-    There should be no more than 6 sections.
+    There should be no more than {max_sections} sections.
     
 
     
 
     Return ONLY a JSON object with this structure:
-    {
+    {{
         "sections": [
-            {"title": "Section Title", "text": "Concise slide content", "narration": "Full section content"},
+            {{"title": "Section Title", "text": "Concise slide content", "narration": "Full section content"}},
             // ... additional sections as needed
         ]
-    }
+    }}
     DO NOT INCLUDE THE CHARACTER & IN THE NARRATION.
     """
-    
-    response = client.chat.completions.create(
+
+def _structure_call(content: str, max_sections: int, user_prefix: str) -> dict:
+    response = cached_chat_completion(
+        get_azure_openai(),
         model=os.getenv("AZURE_OPENAI_DEPLOYMENT_NAME"),
         messages=[
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": f"Structure this essay into sections:\n\n{essay_content}"}
+            {"role": "system", "content": SYSTEM_PROMPT.format(max_sections=max_sections)},
+            {"role": "user", "content": f"{user_prefix}\n\n{content}"}
         ],
         response_format={ "type": "json_object" }
     )
-    
-    return json.loads(response.choices[0].message.content)
+    return json.loads(response)
+
+def structure_chunked(essay_content: str) -> EssayStructure:
+    """Structure heading-delimited parts of the essay concurrently and merge them in order"""
+    # Parts that are only headings have nothing to narrate
+    chunks = group_chunks([chunk for chunk in split_at_headings(essay_content) if has_body(chunk)]) or [essay_content]
+    quotas = section_quotas(chunks)
+    with span("structure.chunks", chunks=len(chunks)):
+        with ThreadPoolExecutor(max_workers=len(chunks)) as pool:
+            results = list(pool.map(
+                lambda args: _structure_call(args[0], args[1], "Structure this part of an essay into sections:"),
+                zip(chunks, quotas)
+            ))
+    sections = [section for result in results for section in result.get("sections", [])]
+    return merge_sections(sections)
+
+@traced("structure")
+def structure_essay(essay_content: str, mode: str = STRUCTURE_MODE) -> EssayStructure:
+    """Structure the essay into sections using Azure OpenAI."""
+    essay_content = strip_references(essay_content)
+    if mode == "auto":
+        chunked = len(essay_content.split()) > STRUCTURE_CHUNK_WORDS and len(split_at_headings(essay_content)) > 1
+        mode = "chunked" if chunked else "single"
+    if mode == "chunked":
+        structured_content = structure_chunked(essay_content)
+    elif mode == "single":
+        structured_content = _structure_call(essay_content, MAX_SECTIONS, "Structure this essay into sections:")
+    else:
+        raise ValueError(f"Unknown structure mode '{mode}', expected auto, chunked or single")
+    # A reply with a few sections too many is merged down rather than failing the stage
+    structured_content = merge_sections(validate_structure(structured_content, max_sections=None)["sections"])
+    return validate_structure(structured_content)
 
 if __name__ == "__main__":
     # Read the essay file
@@ -1,6 +1,10 @@
 import os
 from dotenv import load_dotenv
-from tavily import TavilyClient
+from clients import get_llm
+from search import async_search
+from llm_cache import cached_chat, cached_acomplete
+from sources import pack_sources, unique_urls, novel_passages, split_passages, count_tokens, SOURCE_TOKEN_BUDGET
+from tracing import traced, count
 from llama_index.core.workflow import (
     Event,
     StartEvent,
@@ -9,7 +13,6 @@ from llama_index.core.workflow import (
     step,
     Context
 )
-from llama_index.llms.azure_openai import AzureOpenAI
 from llama_index.core.llms import ChatMessage
 from pydantic import BaseModel
 import json
@@ -26,9 +29,14 @@ os.environ["OPENAI_API_VERSION"] = os.getenv("AZURE_OPENAI_API_VERSION")
 class SubtopicPackage(Event):
     subtopic: str
 
+class ResearchDeadline(Event):
+    seconds: float
+
 class SubtopicSourceMaterialPackage(Event):
     subtopic_source_materials: str
     urls: List[str]
+    results: List[Dict] = []
+    deadline: bool = False
     
 class SourceMaterialPackage(Event):
     source_materials: str
@@ -44,88 +52,219 @@ class EditorCommentaryPackage(Event):
 class FinalStoryPackage(Event):
     final_story: str
 
+class SectionTask(Event):
+    index: int
+    heading: str
+    brief: str
+
+class SectionDraft(Event):
+    index: int
+    heading: str
+    draft: str
+
+class SectionCritique(Event):
+    index: int
+    heading: str
+    draft: str
+    critique: str
+
+class RefinedSection(Event):
+    index: int
+    heading: str
+    text: str
+
 class ContentSubtopics(BaseModel):
     """List of subtopics for deeper research on a topic"""
-    subtopic_one: str
-    subtopic_two: str
-    subtopic_three: str
+    subtopics: List[str]
+
+class OutlineSection(BaseModel):
+    """One section of the article: its heading and what it should cover"""
+    heading: str
+    brief: str
+
+class ArticleOutline(BaseModel):
+    """Title and ordered sections of a long form article"""
+    title: str
+    sections: List[OutlineSection]
+
+# Token budget for the topic overview that goes into the subtopic prompt
+SUBTOPIC_PROMPT_BUDGET = 1500
+
+# Research fan-out per run; research_topic's keyword arguments override these defaults.
+# width: subtopics searched, search_depth/max_results: Tavily settings of every search,
+# workers: concurrent subtopic searches, deadline: seconds after the subtopic searches start at
+# which collection continues with what has arrived (0 waits for all of them), coverage: stop early once this many token budgets of
+# novel material are in, min_novelty: or once a search adds less than this share of new passages
+RESEARCH_DEFAULTS = {
+    "width": int(os.getenv("RESEARCH_WIDTH", 3)),
+    "search_depth": os.getenv("RESEARCH_SEARCH_DEPTH", "basic"),
+    "max_results": int(os.getenv("RESEARCH_MAX_RESULTS", 5)),
+    "workers": int(os.getenv("RESEARCH_WORKERS", 3)),
+    "deadline": float(os.getenv("RESEARCH_DEADLINE", 60)),
+    "coverage": float(os.getenv("RESEARCH_COVERAGE", 2.0)),
+    "min_novelty": float(os.getenv("RESEARCH_MIN_NOVELTY", 0.1)),
+}
+# Upper bound on the subtopic search step's workers; each run's own limit is a semaphore below it
+MAX_RESEARCH_WORKERS = 16
+# Searches that must come back before novelty may end collection early
+MIN_SUBTOPIC_SEARCHES = 2
+
+# "single" writes and edits the whole article in one pass each; "sectioned" drafts,
+# critiques and refines outlined sections concurrently
+RESEARCH_MODE = os.getenv("RESEARCH_MODE", "single")
+MAX_OUTLINE_SECTIONS = int(os.getenv("MAX_OUTLINE_SECTIONS", 6))
+SECTION_MAX_TOKENS = 2500
+
+def collection_done(ev, num_collected, num_packages, signatures, novel_tokens, token_budget, settings):
+    """Why subtopic collection can stop after this event (None to keep waiting), and the novel tokens so far"""
+    if ev.deadline:
+        return "deadline", novel_tokens
+    if num_collected >= num_packages:
+        return "complete", novel_tokens
+    passages = sum(len(split_passages(result.get('content', ''))) for result in ev.results)
+    novel = novel_passages(ev.results, signatures)
+    novel_tokens += sum(count_tokens(text) for text in novel)
+    # Packing keeps token_budget tokens at most, so material well beyond it buys little
+    if novel_tokens >= settings['coverage'] * token_budget:
+        return "coverage", novel_tokens
+    if num_collected >= MIN_SUBTOPIC_SEARCHES and passages and len(novel) < settings['min_novelty'] * passages:
+        return "saturated", novel_tokens
+    return None, novel_tokens
+
+class SourceResearchWorkflow(Workflow):
+    """Searches the topic and its subtopics and packs the results into source materials"""
 
-class ResearchWorkflow(Workflow):
     @step
-    async def research_source_materials(self, ctx: Context, ev: StartEvent) -> SubtopicPackage: 
+    @traced("research.research_source_materials")
+    async def research_source_materials(self, ctx: Context, ev: StartEvent) -> SubtopicPackage | ResearchDeadline | SourceMaterialPackage:
         topic = ev.query
         print(f'topic: {topic}')
+        settings = {name: ev.get(name) if ev.get(name) is not None else default
+                    for name, default in RESEARCH_DEFAULTS.items()}
+        settings["workers"] = max(1, min(settings["workers"], MAX_RESEARCH_WORKERS))
         await ctx.set('topic', topic)
+        await ctx.set('token_budget', ev.get('token_budget') or SOURCE_TOKEN_BUDGET)
+        await ctx.set('settings', settings)
+        # A new workflow runs every topic, so the semaphore belongs to this run alone
+        self.search_slots = asyncio.Semaphore(settings["workers"])
 
-        tavily_client = TavilyClient()
-        response = tavily_client.search(topic)
-        source_materials = '\n'.join(result['content'] for result in response['results'])
+        search_params = {"search_depth": settings["search_depth"], "max_results": settings["max_results"]}
+        await ctx.set('search_params', search_params)
+        response = await async_search(topic, **search_params)
+        # The subtopic prompt only needs an overview, so it gets a small slice of the budget
+        source_materials, _ = pack_sources(response['results'], topic, token_budget=SUBTOPIC_PROMPT_BUDGET)
         
-        # Store initial URLs
+        # Store initial URLs and results for the final source packing
         initial_urls = [result['url'] for result in response['results']]
         await ctx.set('initial_urls', initial_urls)
+        await ctx.set('initial_results', response['results'])
+        # Passages seen so far, to tell how much new material each subtopic search brings
+        signatures = []
+        novel = novel_passages(response['results'], signatures)
+        await ctx.set('signatures', signatures)
+        await ctx.set('novel_tokens', sum(count_tokens(text) for text in novel))
 
-        llm = AzureOpenAI(
-            engine="o3-mini",
-            model="o3-mini",
-            temperature=0.3
-        )
-        sllm = llm.as_structured_llm(output_cls=ContentSubtopics)
-        input_msg = ChatMessage.from_str(f'''Generate a list of 3 searchable subtopics to be passed into a search engine for deeper research based on these info about the topic '{topic}': {source_materials}
-                                            The subtopics should be closely related to the topic but not overlap and together provide a comprehensive research of the topic.
-                                            The subtopics should not be longer than 10 words''')
-        response = sllm.chat([input_msg])
-        
-        subtopics = json.loads(response.message.content)
+        subtopics = []
+        if settings['width'] > 0:
+            llm = get_llm("o3-mini", temperature=0.3)
+            sllm = llm.as_structured_llm(output_cls=ContentSubtopics)
+            input_msg = ChatMessage.from_str(f'''Generate a list of {settings['width']} searchable subtopics to be passed into a search engine for deeper research based on these info about the topic '{topic}': {source_materials}
+                                                The subtopics should be closely related to the topic but not overlap and together provide a comprehensive research of the topic.
+                                                The subtopics should not be longer than 10 words''')
+            # Off the event loop, so concurrent topics (e.g. in a batch) keep searching meanwhile
+            response = await asyncio.to_thread(cached_chat, sllm, [input_msg])
+            subtopics = list(dict.fromkeys(json.loads(response)['subtopics']))[:settings['width']]
         print(f'subtopics: {subtopics}')
         
         await ctx.set('subtopics', subtopics)
         await ctx.set('num_subtopics', len(subtopics))
-        for subtopic in subtopics.values():
+        await ctx.set('collected', [])
+        if not subtopics:
+            # No search would ever reach combine_research_subtopics, so the topic's own results are all there is
+            await ctx.set('combined', True)
+            count("research_collection_stops", reason="no_subtopics")
+            return await self.pack_source_materials(ctx, [])
+        await ctx.set('combined', False)
+        for subtopic in subtopics:
             ctx.send_event(SubtopicPackage(subtopic = subtopic))
+        if settings['deadline'] > 0:
+            ctx.send_event(ResearchDeadline(seconds=settings['deadline']))
+
+    @step
+    async def research_deadline(self, ctx: Context, ev: ResearchDeadline) -> SubtopicSourceMaterialPackage:
+        # Sent with the subtopic searches, so the initial search and the subtopic prompt don't count
+        await asyncio.sleep(ev.seconds)
+        return SubtopicSourceMaterialPackage(subtopic_source_materials='', urls=[], deadline=True)
     
-    @step(num_workers=3)
+    @step(num_workers=MAX_RESEARCH_WORKERS)
+    @traced("research.research_subtopics")
     async def research_subtopics(self, ctx: Context, ev: SubtopicPackage) -> SubtopicSourceMaterialPackage:
         subtopic = ev.subtopic
-        tavily_client = TavilyClient()
-        response = tavily_client.search(subtopic)
+        async with self.search_slots:
+            if await ctx.get('combined'):
+                return None
+            response = await async_search(subtopic, **await ctx.get('search_params'))
         subtopic_materials = '\n'.join(result['content'] for result in response['results'])
         subtopic_urls = [result['url'] for result in response['results']]
-        return SubtopicSourceMaterialPackage(subtopic_source_materials=subtopic_materials, urls=subtopic_urls)
+        return SubtopicSourceMaterialPackage(subtopic_source_materials=subtopic_materials, urls=subtopic_urls,
+                                             results=response['results'])
     
     @step
+    @traced("research.combine_research_subtopics")
     async def combine_research_subtopics(self, ctx: Context, ev: SubtopicSourceMaterialPackage) -> SourceMaterialPackage:
-        num_packages = await ctx.get('num_subtopics')
-        
-        source_materials = ctx.collect_events(ev, [SubtopicSourceMaterialPackage] * num_packages)
-        if source_materials is None:
+        # Searches that finish after the material was combined are dropped
+        if await ctx.get('combined'):
             return None
-        
-        # Combine all source materials and URLs
-        combined_materials = '\n'.join(result.subtopic_source_materials for result in source_materials)
+        source_materials = await ctx.get('collected')
+        if not ev.deadline:
+            source_materials.append(ev)
+        signatures = await ctx.get('signatures')
+        reason, novel_tokens = collection_done(ev, len(source_materials), await ctx.get('num_subtopics'),
+                                               signatures, await ctx.get('novel_tokens'),
+                                               await ctx.get('token_budget'), await ctx.get('settings'))
+        if reason is None:
+            await ctx.set('signatures', signatures)
+            await ctx.set('novel_tokens', novel_tokens)
+            await ctx.set('collected', source_materials)
+            return None
+        await ctx.set('combined', True)
+        print(f'combining {len(source_materials)}/{await ctx.get("num_subtopics")} subtopic searches: {reason}')
+        count("research_collection_stops", reason=reason)
+        return await self.pack_source_materials(ctx, source_materials)
+
+    async def pack_source_materials(self, ctx: Context, source_materials: list) -> SourceMaterialPackage:
+        """Deduplicate the results of the topic's and the collected subtopic searches and pack the most relevant passages"""
+        topic = await ctx.get('topic')
+        subtopics = await ctx.get('subtopics')
+        initial_results = await ctx.get('initial_results')
+        all_results = initial_results + [r for result in source_materials for r in result.results]
+        combined_materials, stats = pack_sources(
+            all_results,
+            ' '.join([topic, *subtopics]),
+            token_budget=await ctx.get('token_budget')
+        )
+        print(f'source packing: {stats}')
+
         initial_urls = await ctx.get('initial_urls')
-        all_urls = initial_urls + [url for result in source_materials for url in result.urls]
+        all_urls = unique_urls(initial_urls + [url for result in source_materials for url in result.urls])
         return SourceMaterialPackage(source_materials=combined_materials, all_urls=all_urls)
 
+class ResearchWorkflow(SourceResearchWorkflow):
     @step
+    @traced("research.write_story")
     async def write_story(self, ctx: Context, ev: SourceMaterialPackage| EditorCommentaryPackage) -> DraftStoryPackage| StopEvent:
         if isinstance(ev, SourceMaterialPackage):
             print('writing story')
             topic = await ctx.get('topic')
             source_materials = ev.source_materials
             reference_urls = ev.all_urls
-            llm = AzureOpenAI(
-                engine="gpt-4o-mini",
-                model="gpt-4o-mini",
-                temperature=0.7,
-                max_tokens=10000
-            )
-            response = await llm.acomplete(f'''you are a world famous journalist. 
+            llm = get_llm("gpt-4o-mini", temperature=0.7, max_tokens=10000)
+            response = await cached_acomplete(llm, f'''you are a world famous journalist. 
                                         you are tasked with writing a very detailed long form article about {topic}.
                                         these are some source materials for you to choose from and use to write the article: {source_materials}''')
-            await ctx.set('draft_story', str(response))
+            await ctx.set('draft_story', response)
             await ctx.set('reference_urls', reference_urls)
-            return DraftStoryPackage(draft_story=str(response), reference_urls=reference_urls)
+            return DraftStoryPackage(draft_story=response, reference_urls=reference_urls)
         
         else:
             print('writer refining draft story')
@@ -133,43 +272,121 @@ class ResearchWorkflow(Workflow):
             editor_commentary = ev.editor_commentary
             draft_story = await ctx.get('draft_story')
             reference_urls = await ctx.get('reference_urls')
-            llm = AzureOpenAI(
-                engine="gpt-4o-mini",
-                model="gpt-4o-mini",
-                temperature=0.7,
-                max_tokens=10000
-            )
-            response = await llm.acomplete(f'''you are a world famous journalist. 
+            llm = get_llm("gpt-4o-mini", temperature=0.7, max_tokens=10000)
+            response = await cached_acomplete(llm, f'''you are a world famous journalist. 
                                         you are tasked with writing a very detailed long form article about {topic}.
                                         
                                         here is a draft of the report you wrote: {draft_story}
                                         here is the commentary from the editor: {editor_commentary}
                                         refine it to make it more engaging and interesting. your refined report, only put in name and content of the report.
                                         NO other commentary or metadata:''')
-            return StopEvent(result={"story": str(response), "references": reference_urls})
+            return StopEvent(result={"story": response, "references": reference_urls})
     
     @step
+    @traced("research.refine_draft_story")
     async def refine_draft_story(self, ctx: Context, ev: DraftStoryPackage) -> EditorCommentaryPackage:
         print('editor refining draft story')
         topic = await ctx.get('topic')
         draft_story = ev.draft_story
         
-        llm = AzureOpenAI(
-            engine="gpt-4o-mini",  
-            model="gpt-4o-mini",
-            temperature=0.7,
-            max_tokens=10000
-        )
-        response = await llm.acomplete(f'''you are a veteran newspaper editor. here is a draft of a long form article about {topic}: {draft_story}. 
+        llm = get_llm("gpt-4o-mini", temperature=0.7, max_tokens=10000)
+        response = await cached_acomplete(llm, f'''you are a veteran newspaper editor. here is a draft of a long form article about {topic}: {draft_story}. 
                                            read it carefully and suggest ideas for improvement.''')
-        return EditorCommentaryPackage(editor_commentary = str(response))
+        return EditorCommentaryPackage(editor_commentary = response)
+
+class SectionedResearchWorkflow(SourceResearchWorkflow):
+    """Outlines the article, then drafts, critiques and refines every section concurrently"""
+
+    @step
+    @traced("research.outline_story")
+    async def outline_story(self, ctx: Context, ev: SourceMaterialPackage) -> SectionTask:
+        print('outlining story')
+        topic = await ctx.get('topic')
+        await ctx.set('source_materials', ev.source_materials)
+        await ctx.set('reference_urls', ev.all_urls)
+
+        sllm = get_llm("gpt-4o-mini", temperature=0.7).as_structured_llm(output_cls=ArticleOutline)
+        input_msg = ChatMessage.from_str(f'''you are a world famous journalist planning a very detailed long form article about {topic}.
+                                            write the article's title and an outline of 3 to {MAX_OUTLINE_SECTIONS} sections in reading order,
+                                            each with a heading and a brief of what it covers. the sections should not overlap.
+                                            these are the source materials for the article: {ev.source_materials}''')
+        response = await asyncio.to_thread(cached_chat, sllm, [input_msg])
+
+        outline = ArticleOutline.model_validate_json(response)
+        sections = outline.sections[:MAX_OUTLINE_SECTIONS]
+        if not sections:
+            # Nothing to fan out would leave assemble_story waiting forever; write it as one section
+            sections = [OutlineSection(heading="Overview", brief=f"the whole article about {topic}")]
+        print(f'outline: {[section.heading for section in sections]}')
+        await ctx.set('title', outline.title)
+        await ctx.set('headings', [section.heading for section in sections])
+        await ctx.set('num_sections', len(sections))
+        for index, section in enumerate(sections):
+            ctx.send_event(SectionTask(index=index, heading=section.heading, brief=section.brief))
+
+    @step(num_workers=MAX_OUTLINE_SECTIONS)
+    @traced("research.draft_section")
+    async def draft_section(self, ctx: Context, ev: SectionTask) -> SectionDraft:
+        topic = await ctx.get('topic')
+        title = await ctx.get('title')
+        headings = await ctx.get('headings')
+        source_materials = await ctx.get('source_materials')
+        llm = get_llm("gpt-4o-mini", temperature=0.7, max_tokens=SECTION_MAX_TOKENS)
+        response = await cached_acomplete(llm, f'''you are a world famous journalist writing a very detailed long form article about {topic}, titled "{title}".
+                                    the article's sections are: {'; '.join(headings)}.
+                                    write only the section "{ev.heading}", which covers: {ev.brief}
+                                    these are some source materials for you to choose from: {source_materials}
+                                    only put in the content of the section, without its heading. NO other commentary or metadata:''')
+        return SectionDraft(index=ev.index, heading=ev.heading, draft=response)
+
+    @step(num_workers=MAX_OUTLINE_SECTIONS)
+    @traced("research.critique_section")
+    async def critique_section(self, ctx: Context, ev: SectionDraft) -> SectionCritique:
+        topic = await ctx.get('topic')
+        llm = get_llm("gpt-4o-mini", temperature=0.7, max_tokens=SECTION_MAX_TOKENS)
+        response = await cached_acomplete(llm, f'''you are a veteran newspaper editor. here is a draft of the section "{ev.heading}" of a long form article about {topic}: {ev.draft}.
+                                           read it carefully and suggest ideas for improvement.''')
+        return SectionCritique(index=ev.index, heading=ev.heading, draft=ev.draft, critique=response)
+
+    @step(num_workers=MAX_OUTLINE_SECTIONS)
+    @traced("research.refine_section")
+    async def refine_section(self, ctx: Context, ev: SectionCritique) -> RefinedSection:
+        topic = await ctx.get('topic')
+        llm = get_llm("gpt-4o-mini", temperature=0.7, max_tokens=SECTION_MAX_TOKENS)
+        response = await cached_acomplete(llm, f'''you are a world famous journalist writing a very detailed long form article about {topic}.
+                                    here is a draft of the section "{ev.heading}" you wrote: {ev.draft}
+                                    here is the commentary from the editor: {ev.critique}
+                                    refine it to make it more engaging and interesting. your refined section, only put in its content, without its heading.
+                                    NO other commentary or metadata:''')
+        return RefinedSection(index=ev.index, heading=ev.heading, text=response)
+
+    @step
+    @traced("research.assemble_story")
+    async def assemble_story(self, ctx: Context, ev: RefinedSection) -> StopEvent:
+        num_sections = await ctx.get('num_sections')
+        sections = ctx.collect_events(ev, [RefinedSection] * num_sections)
+        if sections is None:
+            return None
+
+        title = await ctx.get('title')
+        body = "\n\n".join(f"## {section.heading}\n\n{section.text.strip()}"
+                            for section in sorted(sections, key=lambda section: section.index))
+        return StopEvent(result={"story": f"# {title}\n\n{body}", "references": await ctx.get('reference_urls')})
+
+RESEARCH_WORKFLOWS = {"single": ResearchWorkflow, "sectioned": SectionedResearchWorkflow}
 
-async def research_topic(topic: str):
+async def research_topic(topic: str, token_budget: int = None, mode: str = RESEARCH_MODE, **research_settings):
+    """Researched markdown article on the topic; research_settings override RESEARCH_DEFAULTS for this run"""
+    if mode not in RESEARCH_WORKFLOWS:
+        raise ValueError(f"Unknown research mode '{mode}', expected one of {list(RESEARCH_WORKFLOWS)}")
+    unknown = set(research_settings) - set(RESEARCH_DEFAULTS)
+    if unknown:
+        raise ValueError(f"Unknown research settings {sorted(unknown)}, expected some of {list(RESEARCH_DEFAULTS)}")
     # Create output directory if it doesn't exist
     os.makedirs('output', exist_ok=True)
     
-    w = ResearchWorkflow(timeout=10000, verbose=False)
-    result = await w.run(query=topic)
+    w = RESEARCH_WORKFLOWS[mode](timeout=10000, verbose=False)
+    result = await w.run(query=topic, token_budget=token_budget, **research_settings)
     
     # Combine story and references into a single markdown string
     story = result["story"]
@@ -1,98 +1,201 @@
+import manim
 from manim import *
 from manim_slides import Slide
 from manim_voiceover import VoiceoverScene
 from manim_voiceover.services.azure import AzureService
 import os
 from dotenv import load_dotenv
+import hashlib
 import json
+import shutil
+import subprocess
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
-from typing import TypedDict, List
+from typing import List
+from PIL import Image
+from cache import make_key
+from essay_structure import EssayStructure, Section
+from render_cache import (RENDER_CACHE_ENABLED, render_cache, file_digest, link_or_copy, shared_asset,
+                          shared_text_dir, prune_files, hydrate_partial, publish_partials)
+from text_layout import solve_font_size, layout_lines
+from tts import presynthesize, load_voiceovers, normalize_text, PresynthesizedService
+from tracing import tracer, span, count, traced
 
 # Load environment variables
 load_dotenv()
 
-class Section(TypedDict):
-    title: str
-    narration: str
+# Layout parameters shared by the font-size solver and the scene
+MARGIN = 0.8
+TITLE_BUFF = 0.5
+LINE_SPACING = 0.3
+MIN_FONT_SIZE = 120
+MAX_FONT_SIZE = 200
 
-class EssayStructure(TypedDict):
-    sections: List[Section]
+# Set ELIDE_STATIC_HOLDS=0 to rasterize and encode held frames one by one, as manim does.
+# Still segments mirror manim 0.18's ffmpeg partial movie writer; other versions, or a renderer
+# without the bookkeeping EssayVideo.wait updates, render holds normally
+ELIDE_STATIC_HOLDS = os.getenv("ELIDE_STATIC_HOLDS", "1") != "0" and manim.__version__.startswith("0.18.")
+
+@traced("video.font_search")
+def layout_sections(sections_data: EssayStructure):
+    """Pick the body font size for the whole essay and lay out every narration at it"""
+    # Available space calculations for right half of screen
+    available_width = (config.frame_width / 2) - 2 * MARGIN
+
+    # Create a test title to account for its space
+    test_title = Text("Test", font_size=72)
+    max_height = config.frame_height - test_title.height - 2 * TITLE_BUFF - 0.5
+
+    return solve_font_size(
+        [sec["narration"] for sec in sections_data["sections"]],
+        width=available_width,
+        max_height=max_height,
+        min_size=MIN_FONT_SIZE,
+        max_size=MAX_FONT_SIZE,
+        line_spacing=LINE_SPACING
+    )
+
+def find_optimal_font_size(sections_data: EssayStructure) -> int:
+    """Find the largest body font size at which every section's narration fits"""
+    body_font_size, _, _ = layout_sections(sections_data)
+    return body_font_size
+
+def make_speech_service(cache_dir=None):
+    """Azure TTS service for the narration, optionally caching audio in cache_dir"""
+    return AzureService(
+        api_key=os.getenv("AZURE_SUBSCRIPTION_KEY"),
+        region=os.getenv("AZURE_SERVICE_REGION"),
+        cache_dir=cache_dir
+    )
+
+def narration_text(section: Section) -> str:
+    """Text that is actually spoken for a section"""
+    return section["narration"].strip().replace("&", "and")
+
+def synthesize_voiceovers(sections_data: EssayStructure, voiceover_dir: str,
+                          service_factory=make_speech_service, max_workers: int = 4):
+    """Generate every section's narration audio concurrently, ahead of rendering"""
+    texts = [narration_text(sec) for sec in sections_data["sections"]]
+    with span("video.tts", sections=len(texts)):
+        return presynthesize(texts, service_factory, voiceover_dir, max_workers=max_workers)
+
+def write_still_segment(frame, num_frames: int, output_path, frame_rate: float):
+    """Encode one RGBA frame held for num_frames as a partial movie.
+
+    Input format, rate and encoder arguments are those of manim 0.18's
+    SceneFileWriter.open_movie_pipe, so the segment joins manim's own partial
+    movies in the final stream copy; only the frame is read from a file,
+    looped, instead of piped frame by frame.
+    """
+    output_path = Path(output_path)
+    raw_path = output_path.with_suffix(".rgba")
+    raw_path.write_bytes(frame.tobytes())
+    fps = int(frame_rate) if frame_rate == int(frame_rate) else frame_rate
+    height, width = frame.shape[:2]
+    try:
+        subprocess.run(
+            [config.ffmpeg_executable, "-y", "-f", "rawvideo", "-s", f"{width}x{height}", "-pix_fmt", "rgba",
+             "-r", str(fps), "-stream_loop", "-1", "-i", str(raw_path), "-frames:v", str(num_frames), "-an",
+             "-loglevel", config.ffmpeg_loglevel.lower(), "-vcodec", "libx264", "-pix_fmt", "yuv420p",
+             str(output_path)],
+            check=True
+        )
+    finally:
+        raw_path.unlink(missing_ok=True)
 
 class EssayVideo(VoiceoverScene, Slide):
-    def __init__(self, sections_data: EssayStructure, image_path: str, *args, **kwargs):
+    def __init__(self, sections_data: EssayStructure, image_path: str, *args,
+                 body_font_size: int = None, paragraph_lines: List[List[str]] = None,
+                 voiceover_dir: str = None, **kwargs):
         self.sections_data = sections_data
         self.image_path = image_path
+        self.voiceover_dir = voiceover_dir
+        # Lets per-section renders share the font size and line breaks chosen for the whole essay
+        self.body_font_size = body_font_size
+        self.paragraph_lines = paragraph_lines
         super().__init__(*args, **kwargs)
+        # Animations rendered by earlier jobs count as cached once linked into this scene's directory
+        writer = self.renderer.file_writer
+        is_already_cached = writer.is_already_cached
+        writer.is_already_cached = lambda h: hydrate_partial(writer, h) or is_already_cached(h)
 
     def find_optimal_font_size(self):
-        # Layout parameters for testing
-        margin = 0.8
-        title_buff = 0.5
-        line_spacing = 0.3
-        min_font_size = 120  # Significantly increased minimum
-        max_font_size = 200  # Significantly increased maximum
-        title_font_size = 72
-
-        # Available space calculations for right half of screen
-        available_width = (config.frame_width / 2) - 2 * margin
-        
-        def test_font_size(size):
-            # Create a test title to account for its space
-            test_title = Text("Test", font_size=title_font_size)
-            max_height = config.frame_height - test_title.height - 2 * title_buff - 0.5
-
-            # Test each section's paragraph
-            for sec in self.sections_data["sections"]:
-                paragraph_text = sec["narration"].strip()
-                
-                # Create test paragraph
-                test_paragraph = Paragraph(
-                    paragraph_text,
-                    font_size=size,
-                    width=available_width,
-                    line_spacing=line_spacing,
-                    alignment="left"
-                )
-                
-                # Check if it fits
-                if test_paragraph.height > max_height:
-                    return False
-            return True
-
-        # Binary search for the largest working font size
-        left, right = min_font_size, max_font_size
-        optimal_size = min_font_size
-        while left <= right:
-            mid = (left + right) // 2
-            if test_font_size(mid):
-                optimal_size = mid
-                left = mid + 1
-            else:
-                right = mid - 1
-
-        return optimal_size
+        return find_optimal_font_size(self.sections_data)
+
+    def _has_still_segment_hooks(self) -> bool:
+        """Whether the renderer and Slide keep the bookkeeping a still segment has to update"""
+        renderer = self.renderer
+        return (all(hasattr(renderer, name) for name in
+                    ("_original_skipping_status", "animations_hashes", "num_plays", "time", "file_writer"))
+                and hasattr(renderer.file_writer, "add_partial_movie_file")
+                and hasattr(self, "_current_animation"))
+
+    def _is_static_hold(self, stop_condition, frozen_frame) -> bool:
+        """Whether a wait would only repeat the current frame, as manim decides for Wait"""
+        if not ELIDE_STATIC_HOLDS or stop_condition is not None:
+            return False
+        if (config.renderer != RendererType.CAIRO or not write_to_movie() or config.transparent
+                or config.format not in (None, "mp4") or config.movie_file_extension != ".mp4"):
+            return False
+        if frozen_frame is not None:
+            return frozen_frame
+        return not (self.always_update_mobjects
+                    or any(mob.has_time_based_updater() for mob in self.get_mobject_family_members()))
+
+    def wait(self, duration: float = DEFAULT_WAIT_TIME, stop_condition=None, frozen_frame=None):
+        """Hold the current frame, written as one still segment instead of frame by frame"""
+        if not self._has_still_segment_hooks():
+            return super().wait(duration, stop_condition=stop_condition, frozen_frame=frozen_frame)
+        renderer = self.renderer
+        renderer.skip_animations = renderer._original_skipping_status
+        renderer.update_skipping_status()
+        num_frames = int(duration * config.frame_rate)
+        if renderer.skip_animations or num_frames < 1 or not self._is_static_hold(stop_condition, frozen_frame):
+            return super().wait(duration, stop_condition=stop_condition, frozen_frame=frozen_frame)
+
+        renderer.static_image = None
+        renderer.update_frame(self)
+        frame = renderer.get_frame()
+        # Same frame and length give the same segment, which is then reused
+        segment_hash = "still_" + hashlib.sha256(
+            frame.tobytes() + f"{frame.shape}:{num_frames}:{config.frame_rate}".encode("utf-8")
+        ).hexdigest()[:32]
+        renderer.file_writer.add_partial_movie_file(segment_hash)
+        renderer.animations_hashes.append(segment_hash)
+        segment_path = renderer.file_writer.partial_movie_files[-1]
+        if segment_path is None:
+            return super().wait(duration, stop_condition=stop_condition, frozen_frame=frozen_frame)
+        if not Path(segment_path).exists() and not hydrate_partial(renderer.file_writer, segment_hash):
+            write_still_segment(frame, num_frames, segment_path, config.frame_rate)
+
+        # Keep the bookkeeping of Scene.play and Slide.play: audio offsets and slide indices depend on it
+        renderer.time += num_frames / config.frame_rate
+        renderer.num_plays += 1
+        self._current_animation += 1
+        count("frames_elided", num_frames)
 
     def construct(self):
-        # Azure TTS setup
-        azure_subscription_key = os.getenv("AZURE_SUBSCRIPTION_KEY")
-        azure_service_region = os.getenv("AZURE_SERVICE_REGION")
-        self.set_speech_service(
-            AzureService(api_key=azure_subscription_key, region=azure_service_region)
-        )
+        # Azure TTS setup, or the audio synthesized before rendering when available
+        voiceovers = load_voiceovers(self.voiceover_dir) if self.voiceover_dir else None
+        if voiceovers:
+            self.set_speech_service(PresynthesizedService(voiceovers, cache_dir=self.voiceover_dir))
+        else:
+            self.set_speech_service(make_speech_service(self.voiceover_dir))
 
         # Layout parameters
-        margin = 0.8
-        title_buff = 0.5
+        margin = MARGIN
+        title_buff = TITLE_BUFF
         title_font_size = 42
-        line_spacing = 0.3
 
-        # Find the optimal font size that works for all slides
-        body_font_size = self.find_optimal_font_size()
+        # Find the optimal font size that works for all slides, reusing the verified layouts
+        if self.body_font_size and self.paragraph_lines:
+            body_font_size = self.body_font_size
+            paragraphs = [layout_lines(lines, body_font_size, LINE_SPACING) for lines in self.paragraph_lines]
+        else:
+            body_font_size, _, paragraphs = layout_sections(self.sections_data)
         print(f"Selected optimal font size: {body_font_size}")
 
-        # Calculate available width for content (right half of screen)
-        available_width = (config.frame_width / 2) - 2 * margin
-
         # Define screen halves
         left_half_center = -config.frame_width/4
         right_half_center = config.frame_width/4
@@ -123,67 +226,178 @@ class EssayVideo(VoiceoverScene, Slide):
             width=0.00001,  # Much thinner width
         ).set_z_index(5).shift(UP * 0.5)  # Shift cursor up and ensure it appears above text
 
-        for sec in self.sections_data["sections"]:
-            title_text = sec["title"]
-            paragraph_text = sec["narration"].strip()
+        for sec, paragraph in zip(self.sections_data["sections"], paragraphs):
+            with span("video.animate_section", title=sec["title"]):
+                start_time = self.renderer.time
+                title_text = sec["title"]
 
-            # Clear previous slide
-            self.clear()
+                # Clear previous slide
+                self.clear()
 
-            # Add image to each slide
-            self.add(image)
+                # Add image to each slide
+                self.add(image)
 
-            # Create title and position it on right half
-            title = Text(title_text, font_size=title_font_size)
-            title.move_to([right_half_center, config.frame_height/2 - title_buff, 0])
-            
-            # Animate title with cursor
-            self.play(TypeWithCursor(
-                title, 
-                cursor.copy(), 
-                time_per_char=0.05,
-                keep_cursor_y=False,  # Allow cursor to move with text height
-                buff=0.05,
-                cursor_opacity=0  # Make cursor completely transparent
-            ))
-
-            # Create paragraph with proper wrapping using optimal font size
-            paragraph = Text(
-                paragraph_text,
-                font_size=body_font_size,
-                line_spacing=line_spacing,
-            ).set_width(available_width)
+                # Create title and position it on right half
+                title = Text(title_text, font_size=title_font_size)
+                title.move_to([right_half_center, config.frame_height/2 - title_buff, 0])
             
-            # Position paragraph on right half, below title with proper spacing
-            paragraph_top = title.get_bottom()[1] - title_buff
-            paragraph_center_y = paragraph_top - paragraph.height/2
-            paragraph.move_to([right_half_center, paragraph_center_y, 0])
+                # Animate title with cursor
+                self.play(TypeWithCursor(
+                    title, 
+                    cursor.copy(), 
+                    time_per_char=0.05,
+                    keep_cursor_y=False,  # Allow cursor to move with text height
+                    buff=0.05,
+                    cursor_opacity=0  # Make cursor completely transparent
+                ))
+
+                # Position paragraph on right half, below title with proper spacing
+                paragraph_top = title.get_bottom()[1] - title_buff
+                paragraph_center_y = paragraph_top - paragraph.height/2
+                paragraph.move_to([right_half_center, paragraph_center_y, 0])
             
-            # Animate the paragraph with cursor and add voiceover
-            cleaned_narration = paragraph_text.replace("&", "and")
-            with self.voiceover(text=cleaned_narration) as tracker:
-                # Calculate font size scaling factor (larger font = slower typing)
-                font_scale_factor = body_font_size / 120  # baseline at font size 120
-                adjusted_duration = tracker.duration * font_scale_factor
+                # Animate the paragraph with cursor and add voiceover
+                cleaned_narration = narration_text(sec)
+                with self.voiceover(text=cleaned_narration) as tracker:
+                    # Calculate font size scaling factor (larger font = slower typing)
+                    font_scale_factor = body_font_size / 120  # baseline at font size 120
+                    adjusted_duration = tracker.duration * font_scale_factor
                 
-                self.play(
-                    TypeWithCursor(
-                        paragraph,
-                        cursor.copy(),
-                        time_per_char=adjusted_duration / len(cleaned_narration),
-                        keep_cursor_y=False,  # Allow cursor to move with text height
-                        leave_cursor_on=False,
-                        buff=0.05,  # Reduced space between cursor and text
-                        cursor_opacity=0  # Make cursor completely transparent
-                    ),
-                    run_time=tracker.duration
-                )
+                    self.play(
+                        TypeWithCursor(
+                            paragraph,
+                            cursor.copy(),
+                            time_per_char=adjusted_duration / len(cleaned_narration),
+                            keep_cursor_y=False,  # Allow cursor to move with text height
+                            leave_cursor_on=False,
+                            buff=0.05,  # Reduced space between cursor and text
+                            cursor_opacity=0  # Make cursor completely transparent
+                        ),
+                        run_time=tracker.duration
+                    )
+                    # Whatever narration is left once typing ends is a static hold
+                    remaining = tracker.get_remaining_duration()
+                    if remaining >= 1 / config.frame_rate:
+                        self.wait(remaining)
             
-            # Pause briefly after narration
-            self.wait(1)
+                # Pause briefly after narration
+                self.wait(1)
             
-            # Advance to next slide
-            self.next_slide()
+                # Advance to next slide
+                self.next_slide()
+                count("frames_rendered", int((self.renderer.time - start_time) * config.frame_rate))
+
+def _render_section(job):
+    """Render one section as an independent scene (runs in a worker process).
+
+    Returns the section video and the worker's spans and counters for the parent to merge.
+    """
+    index, section, image_path, body_font_size, lines, voiceover_dir, work_dir, quality, frame_rate = job
+    section_dir = Path(work_dir) / f"section_{index:02d}"
+    section_dir.mkdir(parents=True, exist_ok=True)
+    # Keep manim-slides output of concurrent scenes apart
+    os.chdir(section_dir)
+
+    config.media_dir = str(section_dir)
+    config.video_dir = str(section_dir)
+    config.output_file = f"section_{index:02d}"
+    config.quality = quality
+    if frame_rate:
+        config.frame_rate = frame_rate
+    # Partial movies must outlive the scene to be published; the section directory goes anyway
+    config.flush_cache = not RENDER_CACHE_ENABLED
+    config.max_files_cached = 10000
+    # Pool workers are reused; report only this section's spans
+    tracer.reset()
+    with shared_text_dir(), span("video.render_section", index=index, quality=quality, frame_rate=config.frame_rate):
+        scene = EssayVideo({"sections": [section]}, image_path,
+                           body_font_size=body_font_size, paragraph_lines=[lines],
+                           voiceover_dir=voiceover_dir)
+        scene.render()
+        publish_partials(scene.renderer.file_writer)
+    return section_dir / f"section_{index:02d}.mp4", tracer.export()
+
+def concat_videos(video_paths: List[Path], output_path: Path):
+    """Join rendered videos (with their audio) into one faststart mp4 without re-encoding"""
+    list_path = Path(output_path).with_suffix(".concat.txt")
+    list_path.write_text("".join(f"file '{Path(p).resolve()}'\n" for p in video_paths))
+    try:
+        with span("video.encode", inputs=len(video_paths)):
+            subprocess.run(
+                ["ffmpeg", "-y", "-loglevel", "error", "-f", "concat", "-safe", "0",
+                 "-i", str(list_path), "-c", "copy",
+                 # moov atom first, so playback can start before the whole file is fetched
+                 "-movflags", "+faststart", str(output_path)],
+                check=True
+            )
+    finally:
+        list_path.unlink(missing_ok=True)
+
+def section_cache_key(section: Section, body_font_size: int, lines: List[str], image_digest: str,
+                      quality: str, voiceover: dict, frame_rate: float = None) -> str:
+    """Everything a section video depends on, including this scene's code"""
+    return make_key("section", section["title"], narration_text(section), body_font_size, lines, image_digest,
+                    quality, frame_rate, voiceover, ELIDE_STATIC_HOLDS, file_digest(__file__))
+
+def render_essay_video(sections_data: EssayStructure, image_path: str, output_path: str,
+                       quality: str = "medium_quality", max_workers: int = None,
+                       voiceover_dir: str = None, frame_rate: float = None, preset: str = "medium") -> Path:
+    """Render every section in parallel and stitch them into the final video.
+
+    ``frame_rate`` overrides the quality's own rate. ``preset`` is accepted for a common signature with
+    the draft backend and unused: partial movies must keep manim's own encoder settings to be joined.
+    """
+    output_path = Path(output_path).resolve()
+    work_dir = output_path.parent / f"{output_path.stem}_sections"
+    sections = sections_data["sections"]
+
+    if RENDER_CACHE_ENABLED:
+        prune_files()
+        image_path = shared_asset(image_path)
+
+    # Pick one font size for the whole essay so the slides stay consistent;
+    # measured text lands in the shared directory too, before any worker needs it
+    with shared_text_dir():
+        body_font_size, wrapped, _ = layout_sections(sections_data)
+    print(f"Selected optimal font size: {body_font_size}")
+
+    voiceovers = load_voiceovers(voiceover_dir) if voiceover_dir else None
+    voiceovers = {v["text"]: v for v in voiceovers or []}
+    image_digest = file_digest(image_path)
+    jobs, keys, section_videos = [], [], {}
+    work_dir.mkdir(parents=True, exist_ok=True)
+    for i, (sec, lines) in enumerate(zip(sections, wrapped)):
+        voiceover = voiceovers.get(normalize_text(narration_text(sec)))
+        keys.append(section_cache_key(sec, body_font_size, lines, image_digest, quality, voiceover, frame_rate))
+        cached = render_cache.get_path(keys[i]) if RENDER_CACHE_ENABLED else None
+        if cached is not None:
+            # Unchanged section: reuse the video an earlier render produced, unless it was evicted meanwhile
+            try:
+                link_or_copy(cached, work_dir / f"section_{i:02d}.mp4")
+                section_videos[i] = work_dir / f"section_{i:02d}.mp4"
+                count("sections_reused")
+                continue
+            except FileNotFoundError:
+                pass
+        jobs.append((i, sec, str(Path(image_path).resolve()), body_font_size, lines,
+                     str(Path(voiceover_dir).resolve()) if voiceover_dir else None, str(work_dir), quality,
+                     frame_rate))
+    print(f"Rendering {len(jobs)} of {len(sections)} sections, {len(sections) - len(jobs)} unchanged")
+
+    try:
+        if jobs:
+            workers = max_workers or min(len(jobs), os.cpu_count() or 1)
+            # spawn gives every worker a fresh manim config and working directory
+            with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+                for job, (video_path, trace) in zip(jobs, pool.map(_render_section, jobs)):
+                    section_videos[job[0]] = video_path
+                    tracer.merge(trace)
+                    if RENDER_CACHE_ENABLED:
+                        render_cache.set_file(keys[job[0]], video_path)
+        concat_videos([section_videos[i] for i in range(len(sections))], output_path)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    return output_path
 
 if __name__ == "__main__":
     # Load structured JSON
@@ -0,0 +1,139 @@
+from functools import lru_cache
+from typing import List, Tuple
+from manim import Text
+
+# Font size at which every narration is laid out once
+REFERENCE_FONT_SIZE = 100
+
+
+@lru_cache(maxsize=None)
+def line_pitch(font_size: float, line_spacing: float) -> float:
+    """Distance between consecutive baselines of a multi-line Text"""
+    one_line = Text("A", font_size=font_size, line_spacing=line_spacing)
+    two_lines = Text("A\nA", font_size=font_size, line_spacing=line_spacing)
+    return two_lines.height - one_line.height
+
+
+class ParagraphMetrics:
+    """Word advances and line height of a narration, measured at a reference font size.
+
+    Glyph widths scale linearly with font size, so once the advances are known the
+    wrapped layout at any other size can be predicted without asking Pango again.
+    """
+
+    def __init__(self, text: str, line_spacing: float = 0.3, reference_size: float = REFERENCE_FONT_SIZE):
+        self.text = text.strip()
+        self.line_spacing = line_spacing
+        self.reference_size = reference_size
+        # Explicit line breaks in the narration are kept as paragraph boundaries
+        self.paragraphs = [p.split() for p in self.text.split("\n") if p.split()]
+        self._measure()
+
+    def _measure(self):
+        words = [word for paragraph in self.paragraphs for word in paragraph]
+        # A single layout pass; ligatures off so every character maps to one glyph
+        line = Text(" ".join(words), font_size=self.reference_size, disable_ligatures=True)
+        glyphs = line.submobjects
+        self.line_height = line.height
+        self.pitch = line_pitch(self.reference_size, self.line_spacing)
+
+        if len(glyphs) != sum(len(word) for word in words):
+            # Glyph/character mismatch (e.g. combining marks): share the width evenly
+            char_width = line.width / max(1, sum(len(word) + 1 for word in words))
+            self.advances = [len(word) * char_width for word in words]
+            self.space = char_width
+            return
+
+        self.advances = []
+        gaps = []
+        start = 0
+        previous_right = None
+        for word in words:
+            first, last = glyphs[start], glyphs[start + len(word) - 1]
+            self.advances.append(last.get_right()[0] - first.get_left()[0])
+            if previous_right is not None:
+                gaps.append(first.get_left()[0] - previous_right)
+            previous_right = last.get_right()[0]
+            start += len(word)
+        self.space = sum(gaps) / len(gaps) if gaps else 0.25 * self.line_height
+
+    def wrap(self, font_size: float, width: float) -> List[str]:
+        """Greedy line breaking at the given font size and maximum line width"""
+        scale = font_size / self.reference_size
+        space = self.space * scale
+        advances = iter(self.advances)
+        lines = []
+        for paragraph in self.paragraphs:
+            current, current_width = [], 0.0
+            for word in paragraph:
+                advance = next(advances) * scale
+                if current and current_width + space + advance > width:
+                    lines.append(" ".join(current))
+                    current, current_width = [word], advance
+                elif current:
+                    current.append(word)
+                    current_width += space + advance
+                else:
+                    current, current_width = [word], advance
+            lines.append(" ".join(current))
+        return lines
+
+    def predict_height(self, font_size: float, width: float) -> float:
+        """Predicted height of the wrapped paragraph without building it"""
+        scale = font_size / self.reference_size
+        num_lines = len(self.wrap(font_size, width))
+        return (self.line_height + (num_lines - 1) * self.pitch) * scale
+
+    def layout(self, font_size: float, width: float) -> Text:
+        """Build the real wrapped Text for the given font size"""
+        return layout_lines(self.wrap(font_size, width), font_size, self.line_spacing)
+
+
+def layout_lines(lines: List[str], font_size: float, line_spacing: float = 0.3) -> Text:
+    """Lay out already wrapped lines as a single left-aligned Text"""
+    return Text("\n".join(lines), font_size=font_size, line_spacing=line_spacing)
+
+
+def solve_font_size(texts: List[str], width: float, max_height: float,
+                    min_size: int = 120, max_size: int = 200,
+                    line_spacing: float = 0.3) -> Tuple[int, List[List[str]], List[Text]]:
+    """Largest font size at which every text fits, with the verified line breaks and layouts"""
+    metrics = [ParagraphMetrics(text, line_spacing=line_spacing) for text in texts]
+
+    def predicted_fit(size):
+        return all(m.predict_height(size, width) <= max_height for m in metrics)
+
+    # Binary search over predictions only; no layout passes here
+    left, right = min_size, max_size
+    size = min_size
+    while left <= right:
+        mid = (left + right) // 2
+        if predicted_fit(mid):
+            size = mid
+            left = mid + 1
+        else:
+            right = mid - 1
+
+    attempts = {}
+
+    def real_fit(size):
+        wrapped = [m.wrap(size, width) for m in metrics]
+        layouts = [layout_lines(lines, size, line_spacing) for lines in wrapped]
+        attempts[size] = (size, wrapped, layouts)
+        return all(l.height <= max_height and l.width <= width * 1.01 for l in layouts)
+
+    # Check the candidate with a real layout; if the prediction was optimistic, the real
+    # fit lies below it, so binary-search real layouts there instead of stepping down
+    if real_fit(size) or size <= min_size:
+        return attempts[size]
+    best = min_size
+    left, right = min_size, size - 1
+    while left <= right:
+        mid = (left + right) // 2
+        if real_fit(mid):
+            best = mid
+            left = mid + 1
+        else:
+            right = mid - 1
+    # When nothing fits, the search ends on min_size, so its layout is there too
+    return attempts[best]
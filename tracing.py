@@ -0,0 +1,264 @@
+import asyncio
+import contextvars
+import functools
+import itertools
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import closing, contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+# Aggregated metrics of every process (jobs, render workers) end up here
+METRICS_DB = Path(os.getenv("METRICS_DB", Path(os.getenv("CACHE_DIR", ".cache")) / "metrics.db")).resolve()
+METRICS_PORT = int(os.getenv("METRICS_PORT", 9108))
+# Seconds between writes of a process's gauges; a process silent for three intervals is gone
+METRICS_FLUSH_INTERVAL = float(os.getenv("METRICS_FLUSH_INTERVAL", 10))
+
+_current_span = contextvars.ContextVar("current_span", default=None)
+_span_ids = itertools.count(1)
+
+class Tracer:
+    """In-process collector of timed spans and labelled counters"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.spans = []
+        self.counters = {}
+        self.gauges = {}
+
+    @contextmanager
+    def span(self, name: str, **attrs):
+        # Ids are unique across the process's tracers, which are merged into one another
+        span_id = f"{os.getpid()}-{next(_span_ids)}"
+        parent = _current_span.get()
+        token = _current_span.set(span_id)
+        start = time.time()
+        error = None
+        try:
+            yield attrs
+        except BaseException as e:
+            error = repr(e)
+            raise
+        finally:
+            _current_span.reset(token)
+            record = {
+                "id": span_id, "parent": parent, "name": name, "start": start,
+                "duration": time.time() - start, "pid": os.getpid(),
+                "thread": threading.get_ident(), "attrs": attrs,
+            }
+            if error:
+                record["error"] = error
+            with self._lock:
+                self.spans.append(record)
+
+    def count(self, name: str, value: float = 1, **labels):
+        key = (name, tuple(sorted((k, str(v)) for k, v in labels.items())))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def gauge(self, name: str, value: float, **labels):
+        """Current value of a level such as a queue depth; the last write wins"""
+        key = (name, tuple(sorted((k, str(v)) for k, v in labels.items())))
+        with self._lock:
+            self.gauges[key] = value
+
+    def export(self) -> dict:
+        """Picklable snapshot, e.g. to hand spans from a worker process to its parent"""
+        with self._lock:
+            return {"spans": list(self.spans),
+                    "counters": [[name, list(labels), value] for (name, labels), value in self.counters.items()],
+                    "gauges": [[name, list(labels), value] for (name, labels), value in self.gauges.items()]}
+
+    def merge(self, data: dict):
+        with self._lock:
+            self.spans.extend(data["spans"])
+        for name, labels, value in data["counters"]:
+            self.count(name, value, **dict(labels))
+        for name, labels, value in data.get("gauges", []):
+            self.gauge(name, value, **dict(labels))
+
+    def reset(self, gauges: bool = True):
+        with self._lock:
+            self.spans = []
+            self.counters = {}
+            if gauges:
+                self.gauges = {}
+
+    def write_trace(self, path):
+        """Write spans in Chrome trace-event format (chrome://tracing, Perfetto) plus the counters"""
+        data = self.export()
+        events = [{
+            "name": s["name"], "ph": "X", "ts": s["start"] * 1e6, "dur": s["duration"] * 1e6,
+            "pid": s["pid"], "tid": s["thread"],
+            "args": {**s["attrs"], "id": s["id"], "parent": s["parent"], **({"error": s["error"]} if "error" in s else {})},
+        } for s in data["spans"]]
+        counters = [{"name": name, "labels": dict(labels), "value": value} for name, labels, value in data["counters"]]
+        gauges = [{"name": name, "labels": dict(labels), "value": value} for name, labels, value in data["gauges"]]
+        Path(path).write_text(json.dumps({"traceEvents": events, "counters": counters, "gauges": gauges},
+                                         indent=1, default=str))
+
+_process_tracer = Tracer()
+_current_tracer = contextvars.ContextVar("current_tracer", default=_process_tracer)
+
+class _CurrentTracer:
+    """The tracer of the enclosing ``run_tracer`` block, or the process-wide one outside any"""
+
+    def __getattr__(self, name):
+        return getattr(_current_tracer.get(), name)
+
+tracer = _CurrentTracer()
+
+def span(name: str, **attrs):
+    return _current_tracer.get().span(name, **attrs)
+
+def count(name: str, value: float = 1, **labels):
+    _current_tracer.get().count(name, value, **labels)
+
+@contextmanager
+def run_tracer():
+    """Give one run (a job, a topic) its own spans and counters, so concurrent runs keep their traces apart.
+
+    Threads and tasks started from the block with its context record into the
+    run's tracer too. When the block ends, everything is merged into the
+    enclosing tracer, which metrics are flushed from.
+    """
+    parent = _current_tracer.get()
+    run = Tracer()
+    token = _current_tracer.set(run)
+    try:
+        yield run
+    finally:
+        _current_tracer.reset(token)
+        data = run.export()
+        data["gauges"] = []
+        parent.merge(data)
+
+_flusher_lock = threading.Lock()
+_flusher_pid = None
+
+def gauge(name: str, value: float, **labels):
+    """Set a gauge; the process's gauges are written to the metrics store every METRICS_FLUSH_INTERVAL"""
+    # Levels belong to the process, not to the run that happened to change them
+    _process_tracer.gauge(name, value, **labels)
+    if _flusher_pid != os.getpid():
+        _start_gauge_flusher()
+
+def traced(name: str):
+    """Decorator recording a span around every call of a sync or async function"""
+    def decorator(fn):
+        if asyncio.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                with span(name):
+                    return await fn(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def record_usage(usage, model: str = None):
+    """Count prompt/completion tokens from an OpenAI-style usage object or dict"""
+    if usage is None:
+        return
+    get = usage.get if isinstance(usage, dict) else lambda key: getattr(usage, key, None)
+    for kind in ("prompt_tokens", "completion_tokens"):
+        if get(kind):
+            count(f"llm_{kind}", get(kind), model=model)
+
+@contextmanager
+def _connect_metrics():
+    """A connection to the metrics store for one transaction, committed and closed when the block ends"""
+    METRICS_DB.parent.mkdir(parents=True, exist_ok=True)
+    with closing(sqlite3.connect(METRICS_DB, timeout=30)) as db, db:
+        db.execute("CREATE TABLE IF NOT EXISTS metrics (name TEXT, labels TEXT, value REAL, PRIMARY KEY (name, labels))")
+        db.execute("""CREATE TABLE IF NOT EXISTS process_gauges (name TEXT, labels TEXT, pid INTEGER, value REAL,
+                      updated_at REAL, PRIMARY KEY (name, labels, pid))""")
+        yield db
+
+def _gauge_rows(data: dict) -> list:
+    now = time.time()
+    return [(name, json.dumps(dict(labels), sort_keys=True), os.getpid(), value, now)
+            for name, labels, value in data["gauges"]]
+
+def flush_gauges():
+    """Write this process's current gauges to the shared metrics store"""
+    rows = _gauge_rows(_process_tracer.export())
+    if rows:
+        with _connect_metrics() as db:
+            db.executemany("INSERT OR REPLACE INTO process_gauges VALUES (?, ?, ?, ?, ?)", rows)
+
+def _flush_gauges_forever():
+    while True:
+        time.sleep(METRICS_FLUSH_INTERVAL)
+        try:
+            flush_gauges()
+        except sqlite3.Error as e:
+            print(f"⚠️ Could not flush gauges: {e}")
+
+def _start_gauge_flusher():
+    global _flusher_pid
+    with _flusher_lock:
+        # Forked processes inherit the flag but not the thread
+        if _flusher_pid == os.getpid():
+            return
+        _flusher_pid = os.getpid()
+    threading.Thread(target=_flush_gauges_forever, name="gauge-flush", daemon=True).start()
+
+def flush_metrics():
+    """Add this process's counters and span timings to the shared metrics store and reset them"""
+    data = tracer.export()
+    rows = [(name, json.dumps(dict(labels), sort_keys=True), value) for name, labels, value in data["counters"]]
+    for s in data["spans"]:
+        labels = json.dumps({"span": s["name"]})
+        rows.append(("span_seconds_sum", labels, s["duration"]))
+        rows.append(("span_seconds_count", labels, 1))
+    with _connect_metrics() as db:
+        db.executemany("""INSERT INTO metrics VALUES (?, ?, ?)
+                          ON CONFLICT(name, labels) DO UPDATE SET value = value + excluded.value""", rows)
+        db.executemany("INSERT OR REPLACE INTO process_gauges VALUES (?, ?, ?, ?, ?)", _gauge_rows(data))
+    # Gauges are levels, not totals: the periodic flush keeps reporting them
+    tracer.reset(gauges=False)
+
+def prometheus_text() -> str:
+    """All flushed metrics in the Prometheus text exposition format, gauges per live process"""
+    with _connect_metrics() as db:
+        db.execute("DELETE FROM process_gauges WHERE updated_at < ?", (time.time() - 3 * METRICS_FLUSH_INTERVAL,))
+        rows = db.execute("SELECT name, labels, value, NULL FROM metrics UNION ALL "
+                          "SELECT name, labels, value, pid FROM process_gauges ORDER BY 1, 2, 4").fetchall()
+    lines = []
+    for name, labels, value, pid in rows:
+        labels = {k: v for k, v in json.loads(labels).items() if v not in (None, "None")}
+        if pid is not None:
+            labels["pid"] = pid
+        label_text = ",".join(f'{k}="{v}"' for k, v in labels.items())
+        metric = f"pipeline_{name}" if pid is not None or name.startswith("span_") else f"pipeline_{name}_total"
+        lines.append(f"{metric}{{{label_text}}} {value}" if label_text else f"{metric} {value}")
+    return "\n".join(lines) + "\n"
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.rstrip("/") != "/metrics":
+            self.send_error(404)
+            return
+        body = prometheus_text().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+def start_metrics_server(host: str = "127.0.0.1", port: int = METRICS_PORT) -> ThreadingHTTPServer:
+    """Serve /metrics for Prometheus scraping from a background thread"""
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    return server
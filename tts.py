@@ -0,0 +1,113 @@
+import json
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, List
+from mutagen import File as AudioFile
+from manim_voiceover.services.base import SpeechService
+from cache import CACHE_ROOT, DiskCache, make_key, link_or_copy
+from governor import get_governor
+
+MANIFEST_NAME = "voiceovers.json"
+
+# Synthesized speech never goes stale, so only the size bound applies
+tts_cache = DiskCache(
+    CACHE_ROOT / "tts",
+    max_bytes=int(os.getenv("TTS_CACHE_MAX_BYTES", 1024 * 1024 * 1024))
+)
+
+def normalize_text(text: str) -> str:
+    """Whitespace-normalized text, as manim-voiceover sends it to the service"""
+    return " ".join(text.split())
+
+def speech_settings(service: SpeechService) -> dict:
+    """Service settings that change the synthesized audio"""
+    settings = {"service": type(service).__name__, "global_speed": service.global_speed}
+    for name in ("voice", "style", "output_format", "prosody", "model"):
+        if hasattr(service, name):
+            settings[name] = getattr(service, name)
+    return settings
+
+def audio_duration(path) -> float:
+    return AudioFile(str(path)).info.length
+
+def _audio_suffix(path: Path) -> str:
+    with open(path, 'rb') as f:
+        return ".wav" if f.read(4) == b"RIFF" else ".mp3"
+
+def synthesize(text: str, service_factory: Callable[[str], SpeechService], cache: DiskCache = None):
+    """Cache key and cached audio path for one narration, synthesizing only on a miss"""
+    cache = cache or tts_cache
+    text = normalize_text(text)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        service = service_factory(tmp_dir)
+        key = make_key("tts", speech_settings(service), text)
+        path = cache.get_path(key)
+        if path is None:
+            data = get_governor("tts").call(service._wrap_generate_from_text, text)
+            path = cache.set_file(key, Path(tmp_dir) / data["final_audio"])
+    return key, path
+
+def _collect_audio(key: str, cached_path: Path, output_dir: Path) -> Path:
+    target = output_dir / f"{key}{_audio_suffix(cached_path)}"
+    if not target.exists():
+        link_or_copy(cached_path, target)
+    return target
+
+def presynthesize(texts: List[str], service_factory: Callable[[str], SpeechService],
+                  output_dir, max_workers: int = 4, cache: DiskCache = None) -> List[dict]:
+    """Synthesize all narrations concurrently and collect them in output_dir.
+
+    Writes a manifest with each narration's audio file and duration, which
+    PresynthesizedService serves to the scene during rendering.
+    """
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        results = list(pool.map(lambda text: synthesize(text, service_factory, cache), texts))
+
+    voiceovers = []
+    for text, (key, cached_path) in zip(texts, results):
+        try:
+            target = _collect_audio(key, cached_path, output_dir)
+        except FileNotFoundError:
+            # Evicted by another process since it was synthesized
+            key, cached_path = synthesize(text, service_factory, cache)
+            target = _collect_audio(key, cached_path, output_dir)
+        voiceovers.append({
+            "text": normalize_text(text),
+            "audio": target.name,
+            "duration": audio_duration(target),
+        })
+    (output_dir / MANIFEST_NAME).write_text(json.dumps(voiceovers, indent=2))
+    return voiceovers
+
+def load_voiceovers(voiceover_dir) -> List[dict]:
+    """Manifest written by presynthesize, or None if the narration was not pre-synthesized"""
+    manifest = Path(voiceover_dir) / MANIFEST_NAME
+    return json.loads(manifest.read_text()) if manifest.exists() else None
+
+class PresynthesizedService(SpeechService):
+    """Speech service that only serves audio produced by presynthesize"""
+
+    def __init__(self, voiceovers: List[dict], cache_dir, **kwargs):
+        self.voiceovers = {v["text"]: v for v in voiceovers}
+        super().__init__(cache_dir=cache_dir, **kwargs)
+
+    def generate_from_text(self, text, cache_dir=None, path=None, **kwargs) -> dict:
+        text = normalize_text(text)
+        if text not in self.voiceovers:
+            raise KeyError(f"No pre-synthesized audio for narration: {text[:60]}...")
+        return {
+            "input_text": text,
+            "input_data": {"input_text": text, "service": "presynthesized"},
+            "original_audio": self.voiceovers[text]["audio"],
+        }
+
+    def _wrap_generate_from_text(self, text, **kwargs) -> dict:
+        # The audio is final already; skip speed adjustment and cache.json writes,
+        # which parallel section renders sharing this directory would race on
+        data = self.generate_from_text(text)
+        data["final_audio"] = data["original_audio"]
+        return data